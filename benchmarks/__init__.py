@@ -0,0 +1,3 @@
+"""
+Load tests and benchmarks for Quiz System
+"""
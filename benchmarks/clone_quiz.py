@@ -0,0 +1,67 @@
+"""Копирование квиза на стороне базы в сравнении с повторной загрузкой.
+
+    python -m benchmarks.clone_quiz --sizes 100 1000 10000
+
+Для каждого размера квиз загружается один раз, затем копируется
+clone_quiz (INSERT ... SELECT) и сохраняется повторно из разобранного
+файла (QuizParser.save_to_db). Число запросов копирования не должно
+зависеть от размера квиза.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import StatementCounter, benchmark_database
+from benchmarks.save_quiz import quiz_text
+
+
+def timed(app, action) -> dict:
+    from website.models import db
+
+    with app.app_context():
+        counter = StatementCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+        try:
+            started = time.perf_counter()
+            action()
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', counter)
+    return {'seconds': elapsed, 'statements': counter.count}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Замер копирования квиза')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='количество вопросов')
+    arg_parser.add_argument('--database-url', help='по умолчанию — временная SQLite')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with benchmark_database(args.database_url, 'clone-quiz'):
+        from website import create_app
+        from website.quiz_clone import clone_quiz
+        from website.views.quiz_parser import QuizParser
+
+        app = create_app()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        print(f"{'Вопросов':>9}{'загрузка, с':>13}{'запросов':>10}{'копия, с':>10}{'запросов':>10}")
+        for size in args.sizes:
+            parser = QuizParser()
+            parser.parse_txt(quiz_text(size))
+            with app.app_context():
+                quiz_id = parser.save_to_db(1).id
+
+            upload = timed(app, lambda: parser.save_to_db(1))
+            clone = timed(app, lambda: clone_quiz(quiz_id, 1))
+            print(
+                f"{size:>9}{upload['seconds']:>13.3f}{upload['statements']:>10}"
+                f"{clone['seconds']:>10.3f}{clone['statements']:>10}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import contextlib
+import os
+import shutil
+import tempfile
+from typing import Iterator, Optional
+
+
+@contextlib.contextmanager
+def benchmark_database(database_url: Optional[str], name: str) -> Iterator[str]:
+    """Настраивает окружение для create_app на время замера.
+
+    Без database_url создается временная SQLite, которая удаляется после
+    замера. Возвращает используемый адрес базы.
+    """
+    workdir = None
+    if not database_url:
+        workdir = tempfile.mkdtemp(prefix=f'quiz-{name}-')
+        database_url = f"sqlite:///{os.path.join(workdir, f'{name}.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('ADMIN_USER_ID', '1')
+    try:
+        yield database_url
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+class StatementCounter:
+    """Считает SQL-запросы, выполненные через движок"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
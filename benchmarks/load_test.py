@@ -0,0 +1,425 @@
+"""Нагрузочный тест бота: игроки нескольких игр проходят квиз одновременно.
+
+    python -m benchmarks.load_test --games 20 --teams 5 --players 4 --questions 6
+
+Синтетические обновления подаются в настоящий Dispatcher с обработчиками
+из register_handlers. Bot API заменен заглушкой (StubSession), база —
+временная SQLite или указанная в --database-url (например, Postgres).
+Тест добавляет в базу собственных пользователей, квиз и игры, поэтому
+для Postgres используйте отдельную базу.
+
+Сценарий: игроки входят в игры через /join, модераторы запускают квиз,
+по каждому вопросу игроки отвечают (кнопкой или текстом), модераторы
+проверяют свободные ответы и переходят к следующему вопросу. Выводятся
+пропускная способность по фазам, перцентили времени обработчиков и
+количество запросов к базе на обновление; --json сохраняет то же в файл
+для сравнения между запусками.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import random
+import string
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from sqlalchemy import event
+
+from benchmarks.common import benchmark_database
+from bot.fake_telegram import StubSession, make_callback_update, make_message_update
+
+logger = logging.getLogger(__name__)
+
+# Счетчик запросов обновления, которое сейчас обрабатывается. Контекст
+# копируется в потоки run_db, поэтому запросы из них попадают сюда же.
+_update_queries: contextvars.ContextVar = contextvars.ContextVar('update_queries', default=None)
+
+
+@dataclass
+class PlayerSpec:
+    telegram_id: int
+    team_id: int
+
+
+@dataclass
+class GameSpec:
+    game_id: int
+    join_code: str
+    moderator_telegram_id: int
+    players: List[PlayerSpec] = field(default_factory=list)
+
+
+@dataclass
+class QuestionSpec:
+    question_id: int
+    type: str
+    options: Optional[list]
+
+
+class LoadStats:
+    """Время обработчиков, запросы к базе и ошибки за время теста"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.queries: Dict[str, int] = Counter()
+        self.background_queries = 0
+        self.errors = 0
+        self.phases: List[dict] = []
+
+    def on_query(self, *args):
+        counter = _update_queries.get()
+        if counter is None:
+            # Очередь ответов, рассыльщик и прочая фоновая работа
+            self.background_queries += 1
+        else:
+            counter[0] += 1
+
+    def record(self, handler: str, elapsed: float, queries: int):
+        self.latencies[handler].append(elapsed)
+        self.queries[handler] += queries
+
+    def report(self) -> dict:
+        handlers = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            handlers[name] = {
+                'calls': len(values),
+                'p50_ms': _percentile(values, 50) * 1000,
+                'p95_ms': _percentile(values, 95) * 1000,
+                'p99_ms': _percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+                'queries_per_update': self.queries[name] / len(values)
+            }
+        updates = sum(phase['updates'] for phase in self.phases)
+        elapsed = sum(phase['elapsed'] for phase in self.phases)
+        return {
+            'phases': self.phases,
+            'updates': updates,
+            'elapsed': elapsed,
+            'updates_per_second': updates / elapsed if elapsed else 0.0,
+            'handlers': handlers,
+            'background_queries': self.background_queries,
+            'errors': self.errors
+        }
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Замеряет время обработчика и количество его запросов к базе"""
+
+    def __init__(self, stats: LoadStats):
+        self.stats = stats
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event_obj: Any, data: Dict[str, Any]) -> Any:
+        counter = [0]
+        token = _update_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            return await handler(event_obj, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            _update_queries.reset(token)
+            self.stats.record(data['handler'].callback.__name__, elapsed, counter[0])
+
+
+class ErrorCounter(logging.Handler):
+    """Считает ошибки, которые обработчики перехватили и записали в журнал"""
+
+    def __init__(self, stats: LoadStats):
+        super().__init__(level=logging.ERROR)
+        self.stats = stats
+
+    def emit(self, record):
+        self.stats.errors += 1
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _codes(count: int, taken: set) -> List[str]:
+    """Уникальные коды из шести заглавных букв, как у игр и команд"""
+    codes = []
+    while len(codes) < count:
+        code = ''.join(random.choices(string.ascii_uppercase, k=6))
+        if code not in taken:
+            taken.add(code)
+            codes.append(code)
+    return codes
+
+
+def seed(app, games: int, teams: int, players: int, questions: int, rounds: int):
+    """Создает квиз, игры в статусе ready, команды и игроков"""
+    from website.models import db, Game, Question, Quiz, Round, Team, TeamMember, User
+
+    run = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
+    telegram_ids = itertools.count(random.randrange(10 ** 9, 2 * 10 ** 9) * 1000)
+
+    with app.app_context():
+        taken = set(db.session.scalars(db.select(Game.join_code))) | set(db.session.scalars(db.select(Team.join_code)))
+        game_codes = _codes(games, taken)
+        team_codes = iter(_codes(games * teams, taken))
+
+        author = User(username=f'lt_{run}_author', telegram_id=next(telegram_ids), role='moderator')
+        db.session.add(author)
+        db.session.flush()
+
+        quiz = Quiz(title=f'Нагрузочный тест {run}', created_by=author.id)
+        db.session.add(quiz)
+        db.session.flush()
+
+        question_rows = []
+        per_round = -(-questions // rounds)
+        for round_index in range(rounds):
+            round_row = Round(quiz_id=quiz.id, title=f'Раунд {round_index + 1}', order=round_index + 1)
+            db.session.add(round_row)
+            db.session.flush()
+            for order in range(1, per_round + 1):
+                if len(question_rows) == questions:
+                    break
+                choice = len(question_rows) % 2 == 0
+                question = Question(
+                    round_id=round_row.id,
+                    text=f'Вопрос {len(question_rows) + 1}',
+                    type='multiple_choice' if choice else 'open',
+                    options=['А', 'Б', 'В', 'Г'] if choice else None,
+                    correct_option=0 if choice else None,
+                    correct_answer='А' if choice else 'ответ',
+                    time_limit=3600,   # таймер не должен истечь во время теста
+                    order=order
+                )
+                db.session.add(question)
+                question_rows.append(question)
+        db.session.flush()
+        plan = [QuestionSpec(q.id, q.type, q.options) for q in question_rows]
+
+        specs = []
+        for game_index in range(games):
+            moderator = User(
+                username=f'lt_{run}_m{game_index}', telegram_id=next(telegram_ids), role='moderator'
+            )
+            db.session.add(moderator)
+            db.session.flush()
+            game = Game(
+                quiz_id=quiz.id, moderator_id=moderator.id,
+                join_code=game_codes[game_index], status=Game.STATUS_READY
+            )
+            db.session.add(game)
+            db.session.flush()
+            spec = GameSpec(game.id, game.join_code, moderator.telegram_id)
+
+            for team_index in range(teams):
+                team = Team(name=f'Команда {game_index}-{team_index}', join_code=next(team_codes))
+                db.session.add(team)
+                game.teams.append(team)
+                users = [
+                    User(
+                        username=f'lt_{run}_p{game_index}_{team_index}_{player_index}',
+                        telegram_id=next(telegram_ids)
+                    )
+                    for player_index in range(players)
+                ]
+                db.session.add_all(users)
+                db.session.flush()
+                team.captain_id = users[0].id
+                db.session.add_all(TeamMember(team_id=team.id, user_id=user.id) for user in users)
+                spec.players.extend(PlayerSpec(user.telegram_id, team.id) for user in users)
+            specs.append(spec)
+
+        db.session.commit()
+    return specs, plan
+
+
+def pending_answers(app, game_ids: List[int], question_id: int) -> list:
+    """Непроверенные ответы на вопрос во всех играх теста: (id, game_id)"""
+    from website.models import db, Answer
+
+    with app.app_context():
+        return db.session.execute(
+            db.select(Answer.id, Answer.game_id).where(
+                Answer.game_id.in_(game_ids),
+                Answer.question_id == question_id,
+                Answer.score.is_(None)
+            )
+        ).all()
+
+
+async def deliver(dp, bot, stats: LoadStats, name: str, updates: List[dict], concurrency: int):
+    """Подает обновления в диспетчер, держа не более concurrency одновременно"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update):
+        async with semaphore:
+            await dp.feed_raw_update(bot, update)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(feed(update) for update in updates))
+    elapsed = time.perf_counter() - started
+    stats.phases.append({'phase': name, 'updates': len(updates), 'elapsed': elapsed})
+
+
+async def run(args) -> dict:
+    import bot.bot as quiz_bot
+    from bot.answer_queue import answer_queue
+    from bot.db_executor import db_executor
+    from website import create_app
+    from website.models import db, Answer, Game
+
+    app = create_app()
+    bot, dp = quiz_bot.create_bot(app)
+    bot.session = StubSession(latency=args.latency)
+
+    stats = LoadStats()
+    metrics = HandlerMetrics(stats)
+    dp.message.middleware(metrics)
+    dp.callback_query.middleware(metrics)
+    logging.getLogger().addHandler(ErrorCounter(stats))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', stats.on_query)
+
+    specs, plan = seed(app, args.games, args.teams, args.players, args.questions, args.rounds)
+    game_ids = [spec.game_id for spec in specs]
+    update_ids = itertools.count(1)
+    answers_expected = 0
+
+    answer_queue.start(app)
+    try:
+        await deliver(dp, bot, stats, 'join', [
+            make_message_update(next(update_ids), player.telegram_id, f'/join {spec.join_code}')
+            for spec in specs for player in spec.players
+        ], args.concurrency)
+
+        await deliver(dp, bot, stats, 'start', [
+            make_callback_update(next(update_ids), spec.moderator_telegram_id, f'{quiz_bot.START_GAME}:{spec.game_id}')
+            for spec in specs
+        ], args.concurrency)
+
+        for number, question in enumerate(plan, start=1):
+            await deliver(dp, bot, stats, f'ask {number}', [
+                make_callback_update(next(update_ids), spec.moderator_telegram_id, f'{quiz_bot.ASK_QUESTION}:{spec.game_id}')
+                for spec in specs
+            ], args.concurrency)
+
+            if question.type == 'multiple_choice':
+                answers = [
+                    make_callback_update(
+                        next(update_ids), player.telegram_id,
+                        f'answer:{spec.game_id}:{question.question_id}:{random.randrange(len(question.options))}'
+                    )
+                    for spec in specs for player in spec.players
+                ]
+            else:
+                answers = [
+                    make_message_update(next(update_ids), player.telegram_id, f'ответ {player.telegram_id % 1000}')
+                    for spec in specs for player in spec.players
+                ]
+            answers_expected += len(answers)
+            await deliver(dp, bot, stats, f'answers {number}', answers, args.concurrency)
+            await answer_queue.flush()
+
+            if question.type != 'multiple_choice':
+                moderators = {spec.game_id: spec.moderator_telegram_id for spec in specs}
+                rows = pending_answers(app, game_ids, question.question_id)
+                await deliver(dp, bot, stats, f'review {number}', [
+                    make_callback_update(
+                        next(update_ids), moderators[row.game_id],
+                        f'{random.choice([quiz_bot.APPROVE_ANSWER, quiz_bot.REJECT_ANSWER])}:{row.id}'
+                    )
+                    for row in rows
+                ], args.concurrency)
+
+            await deliver(dp, bot, stats, f'next {number}', [
+                make_callback_update(next(update_ids), spec.moderator_telegram_id, f'{quiz_bot.NEXT_QUESTION}:{spec.game_id}')
+                for spec in specs
+            ], args.concurrency)
+    finally:
+        await answer_queue.close()
+        db_executor.shutdown()
+        event.remove(engine, 'before_cursor_execute', stats.on_query)
+
+    result = stats.report()
+    with app.app_context():
+        result['answers_saved'] = db.session.scalar(
+            db.select(db.func.count(Answer.id)).where(Answer.game_id.in_(game_ids))
+        )
+        result['games_finished'] = db.session.scalar(
+            db.select(db.func.count(Game.id)).where(Game.id.in_(game_ids), Game.status == Game.STATUS_FINISHED)
+        )
+    result['answers_expected'] = answers_expected
+    result['games'] = len(specs)
+    result['players'] = sum(len(spec.players) for spec in specs)
+    result['bot_api_calls'] = dict(bot.session.counts)
+    result['db_pool'] = db_executor.stats()
+    return result
+
+
+def print_report(result: dict):
+    print(
+        f"\nИгр: {result['games']}, игроков: {result['players']}, "
+        f"обновлений: {result['updates']} за {result['elapsed']:.2f} с "
+        f"({result['updates_per_second']:.0f}/с)"
+    )
+    print(f"\n{'Фаза':<14}{'обновлений':>12}{'время, с':>10}{'в секунду':>11}")
+    for phase in result['phases']:
+        rate = phase['updates'] / phase['elapsed'] if phase['elapsed'] else 0.0
+        print(f"{phase['phase']:<14}{phase['updates']:>12}{phase['elapsed']:>10.2f}{rate:>11.0f}")
+
+    print(f"\n{'Обработчик':<24}{'вызовов':>8}{'p50, мс':>9}{'p95, мс':>9}{'p99, мс':>9}{'max, мс':>9}{'запросов':>10}")
+    for name, row in result['handlers'].items():
+        print(
+            f"{name:<24}{row['calls']:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+            f"{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['queries_per_update']:>10.1f}"
+        )
+
+    print(f"\nФоновых запросов к базе: {result['background_queries']}")
+    print(f"Ответов сохранено: {result['answers_saved']} из {result['answers_expected']}")
+    print(f"Игр завершено: {result['games_finished']} из {result['games']}")
+    print(f"Ошибок в журнале: {result['errors']}")
+    print(f"Вызовы Bot API: {result['bot_api_calls']}")
+    print(f"Пул потоков базы: {result['db_pool']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота квизов')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--teams', type=int, default=5, help='команд в игре')
+    parser.add_argument('--players', type=int, default=4, help='игроков в команде')
+    parser.add_argument('--questions', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=40, help='одновременно обрабатываемых обновлений')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа Bot API, с')
+    parser.add_argument('--database-url', help='по умолчанию — временная SQLite')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    parser.add_argument('--verbose', action='store_true', help='показывать журнал бота')
+    args = parser.parse_args()
+
+    os.environ.setdefault('BOT_TOKEN', '123456:load-test')
+    # Обращения к настоящему Bot API не нужны: сессия бота заменяется заглушкой
+    os.environ.pop('TELEGRAM_API_URL', None)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    with benchmark_database(args.database_url, 'load'):
+        result = asyncio.run(run(args))
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
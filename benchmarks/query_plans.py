@@ -0,0 +1,217 @@
+"""Проверка планов горячих запросов: каждый должен использовать индекс.
+
+    python -m benchmarks.query_plans [--database-url postgresql://...] [--games 50]
+
+Запросы повторяют те, что выполняются на каждом ответе, входе в бота и
+обновлении таблицы результатов. Перед проверкой база заполняется данными
+нагрузочного теста (seed из load_test) с ответами всех команд на все
+вопросы, сообщениями чата, кодами входа и очередью уведомлений, после
+чего собирается статистика (ANALYZE): на пустых таблицах планировщик
+выбирает не те планы, что на рабочей базе. Для Postgres используйте
+отдельную базу или --no-seed на базе с рабочими данными.
+
+Для SQLite проверяется EXPLAIN QUERY PLAN
+(строка «SCAN <таблица>» — полный просмотр), для PostgreSQL — EXPLAIN с
+enable_seqscan = off («Seq Scan on <таблица>»). При полном просмотре
+проверяемой таблицы скрипт завершается с кодом 1.
+"""
+import argparse
+import logging
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import func, insert, or_, select
+
+from benchmarks.common import benchmark_database
+
+
+class PlanCheck(NamedTuple):
+    name: str
+    table: str                 # таблица, которую нельзя просматривать целиком
+    statement: Callable        # () -> select, строится внутри контекста приложения
+    partial_index: str = ''    # частичный индекс: его просмотр целиком не читает всю таблицу
+
+
+def hot_queries() -> List[PlanCheck]:
+    from website.models import db, Answer, ChatMessage, Game, OutboxMessage, Question, Round, Team, TeamMember, TelegramCode, game_teams
+
+    return [
+        PlanCheck(
+            'коды входа пользователя (bot.cmd_start)', 'telegram_code',
+            lambda: select(TelegramCode).filter_by(telegram_id=1, is_used=False)
+        ),
+        PlanCheck(
+            'ответ команды на вопрос (admin, bot)', 'answer',
+            lambda: select(Answer).filter_by(game_id=1, team_id=1, question_id=1)
+        ),
+        PlanCheck(
+            'таблица результатов (scoreboard)', 'answer',
+            lambda: select(Answer.team_id, func.coalesce(func.sum(Answer.score), 0.0))
+            .where(Answer.game_id == 1).group_by(Answer.team_id)
+        ),
+        PlanCheck(
+            'команда игрока в игре (identity_cache)', 'team_member',
+            lambda: db.session.query(Team.id, Team.name)
+            .join(TeamMember, TeamMember.team_id == Team.id)
+            .join(game_teams, game_teams.c.team_id == Team.id)
+            .filter(game_teams.c.game_id == 1, TeamMember.user_id == 1, TeamMember.joined_at.isnot(None))
+            .statement
+        ),
+        PlanCheck(
+            'раунды квиза (quiz_plan)', 'round',
+            lambda: select(Round.id, Round.order).where(Round.quiz_id == 1).order_by(Round.order, Round.id)
+        ),
+        PlanCheck(
+            'вопросы раунда (quiz_plan)', 'question',
+            lambda: select(Question.id, Question.order).where(Question.round_id == 1).order_by(Question.order, Question.id)
+        ),
+        PlanCheck(
+            'активные игры (bot, admin)', 'game',
+            lambda: select(Game.id).where(Game.status.in_([Game.STATUS_ACTIVE, Game.STATUS_PAUSED]))
+        ),
+        PlanCheck(
+            'история чата игры (chat)', 'chat_message',
+            lambda: select(ChatMessage.id).where(ChatMessage.game_id == 1).order_by(ChatMessage.id.desc()).limit(100)
+        ),
+        PlanCheck(
+            'очередь уведомлений (bot.outbox)', 'outbox_message',
+            lambda: select(OutboxMessage.id).where(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.attempts < 5,
+                or_(OutboxMessage.next_attempt_at.is_(None), OutboxMessage.next_attempt_at <= func.now())
+            ).order_by(OutboxMessage.id).limit(100),
+            partial_index='ix_outbox_message_pending'
+        ),
+    ]
+
+
+def seed_data(app, games: int, teams: int, players: int, questions: int) -> dict:
+    """Заполняет базу как после нескольких сыгранных квизов; возвращает число строк по таблицам"""
+    from benchmarks.load_test import _codes, seed
+    from website.models import db, Answer, ChatMessage, Game, OutboxMessage, TeamMember, TelegramCode
+
+    specs, plan = seed(app, games, teams, players, questions, rounds=max(1, questions // 10))
+    now = datetime.utcnow()
+
+    with app.app_context():
+        members = {
+            team_id: user_id
+            for team_id, user_id in db.session.query(TeamMember.team_id, TeamMember.user_id)
+            .filter(TeamMember.team_id.in_({player.team_id for spec in specs for player in spec.players}))
+        }
+        code_values = iter(_codes(
+            sum(len(spec.players) for spec in specs), set(db.session.scalars(select(TelegramCode.code)))
+        ))
+        answers, messages, codes, outbox = [], [], [], []
+        for index, spec in enumerate(specs):
+            team_ids = sorted({player.team_id for player in spec.players})
+            for question in plan:
+                answers.extend({
+                    'game_id': spec.game_id, 'team_id': team_id, 'question_id': question.question_id,
+                    'user_id': members[team_id], 'answer_text': 'А', 'score': float(team_id % 2)
+                } for team_id in team_ids)
+            messages.extend({
+                'game_id': spec.game_id, 'type': 'player', 'sender': 'игрок', 'message': f'Сообщение {number}'
+            } for number in range(len(plan)))
+            for player in spec.players:
+                codes.append({
+                    'code': next(code_values), 'telegram_id': player.telegram_id,
+                    'is_used': True, 'used_at': now
+                })
+                outbox.append({
+                    'chat_id': player.telegram_id, 'text': 'Игра завершена', 'payload': {},
+                    'attempts': 1, 'created_at': now, 'sent_at': now
+                })
+            # Большинство игр уже сыграно, несколько идут сейчас
+            db.session.query(Game).filter(Game.id == spec.game_id).update({
+                'status': Game.STATUS_ACTIVE if index % 10 == 0 else Game.STATUS_FINISHED,
+                'started_at': now - timedelta(hours=1)
+            })
+
+        for model, rows in ((Answer, answers), (ChatMessage, messages), (TelegramCode, codes), (OutboxMessage, outbox)):
+            if rows:
+                db.session.execute(insert(model), rows)
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+    return {'answer': len(answers), 'chat_message': len(messages), 'telegram_code': len(codes), 'outbox_message': len(outbox)}
+
+
+def explain(connection, statement) -> List[str]:
+    """Строки плана запроса для SQLite или PostgreSQL"""
+    dialect = connection.dialect
+    # Параметры подставляются в текст: в запросах только числа и строки
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()]
+    if dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        return [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {sql}').all()]
+    raise ValueError(f"Планы запросов для {dialect.name} не поддерживаются")
+
+
+def full_scan(plan: List[str], table: str, dialect_name: str, partial_index: str = '') -> bool:
+    if dialect_name == 'sqlite':
+        pattern = rf'^SCAN {table}\b'
+        if partial_index:
+            pattern += rf'(?! USING (COVERING )?INDEX {partial_index}\b)'
+    else:
+        pattern = rf'Seq Scan on "?{table}"?\b'
+    return any(re.search(pattern, line.strip()) for line in plan)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Проверка использования индексов горячими запросами')
+    arg_parser.add_argument('--database-url', help='по умолчанию — временная SQLite')
+    arg_parser.add_argument('--games', type=int, default=50, help='игр в тестовых данных')
+    arg_parser.add_argument('--teams', type=int, default=10, help='команд в игре')
+    arg_parser.add_argument('--players', type=int, default=4, help='игроков в команде')
+    arg_parser.add_argument('--questions', type=int, default=40)
+    arg_parser.add_argument('--no-seed', action='store_true', help='проверять на данных, уже лежащих в базе')
+    arg_parser.add_argument('--verbose', action='store_true', help='выводить планы целиком')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with benchmark_database(args.database_url, 'query-plans'):
+        from website import create_app
+        from website.models import db
+
+        app = create_app()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        if not args.no_seed:
+            started = time.monotonic()
+            counts = seed_data(app, args.games, args.teams, args.players, args.questions)
+            print(
+                f"Тестовые данные: {', '.join(f'{table} {count}' for table, count in counts.items())} "
+                f"строк за {time.monotonic() - started:.1f} с"
+            )
+
+        failures = 0
+        with app.app_context():
+            dialect_name = db.engine.dialect.name
+            for check in hot_queries():
+                with db.engine.connect() as connection:
+                    plan = explain(connection, check.statement())
+                    connection.rollback()   # сбрасывает SET LOCAL
+                scan = full_scan(plan, check.table, dialect_name, check.partial_index)
+                failures += scan
+                print(f"{'SCAN' if scan else 'ok':<6}{check.table:<15}{check.name}")
+                if args.verbose or scan:
+                    for line in plan:
+                        print(f"{'':<6}{line}")
+
+        if failures:
+            print(f"Полный просмотр таблицы в {failures} запросах")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Сравнение сохранения разобранного квиза: построчно через ORM и пакетно.
+
+    python -m benchmarks.save_quiz --sizes 100 1000 10000
+
+Для каждого размера квиз разбирается один раз, затем сохраняется обоими
+способами (QuizParser.save_to_db с bulk=False и bulk=True). Выводятся
+лучшее время из --repeat попыток и количество SQL-запросов. База —
+временная SQLite или указанная в --database-url.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import StatementCounter, benchmark_database
+
+QUESTIONS_PER_ROUND = 10
+
+
+def quiz_text(questions: int) -> str:
+    """Текст квиза заданного размера в формате загрузки"""
+    lines = [f'# Квиз на {questions} вопросов', 'Описание']
+    for index in range(questions):
+        if index % QUESTIONS_PER_ROUND == 0:
+            lines.append(f'## Раунд {index // QUESTIONS_PER_ROUND + 1}')
+        lines.append(f'{index % QUESTIONS_PER_ROUND + 1}. Вопрос {index + 1}?')
+        if index % 2:
+            lines += ['Тип: open', f'Ответ: ответ {index}']
+        else:
+            lines += ['Тип: multiple_choice', 'Ответ: Б', 'Варианты: А; Б; В; Г']
+        lines += ['Баллы: 1', 'Время: 30', '']
+    return '\n'.join(lines)
+
+
+def measure(app, parser, bulk: bool, repeat: int) -> dict:
+    from website.models import db
+
+    best = None
+    statements = 0
+    for _ in range(repeat):
+        with app.app_context():
+            counter = StatementCounter()
+            event.listen(db.engine, 'before_cursor_execute', counter)
+            try:
+                started = time.perf_counter()
+                parser.save_to_db(1, bulk=bulk)
+                elapsed = time.perf_counter() - started
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', counter)
+        best = elapsed if best is None else min(best, elapsed)
+        statements = counter.count
+    return {'seconds': best, 'statements': statements}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Замер сохранения квиза в базу')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='количество вопросов')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--database-url', help='по умолчанию — временная SQLite')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with benchmark_database(args.database_url, 'save-quiz'):
+        from website import create_app
+        from website.views.quiz_parser import QuizParser
+
+        app = create_app()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        print(f"{'Вопросов':>9}{'ORM, с':>10}{'запросов':>10}{'пакетно, с':>12}{'запросов':>10}{'ускорение':>11}")
+        for size in args.sizes:
+            parser = QuizParser()
+            parser.parse_txt(quiz_text(size))
+            orm = measure(app, parser, bulk=False, repeat=args.repeat)
+            bulk = measure(app, parser, bulk=True, repeat=args.repeat)
+            print(
+                f"{size:>9}{orm['seconds']:>10.3f}{orm['statements']:>10}"
+                f"{bulk['seconds']:>12.3f}{bulk['statements']:>10}"
+                f"{orm['seconds'] / bulk['seconds']:>10.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
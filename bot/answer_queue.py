@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import insert
+
+from website.models import db, Answer
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.05   # секунд между сбросами пакета
+MAX_BATCH = 200         # ответов в одном INSERT
+
+
+class AnswerIngestQueue:
+    """Очередь ответов с групповой записью в базу.
+
+    Обработчик ставит ответ в очередь и ждет, пока пакет, в который он попал,
+    будет зафиксирован одним многострочным INSERT. Запись выполняется в
+    отдельном потоке, поэтому event loop бота на это время не блокируется.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._app = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._executor = None
+        self._closing = False
+
+    def start(self, app=None):
+        """Запускает фоновый сброс на текущем event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._app = app or current_app._get_current_object()
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='answer-writer')
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Очередь записи ответов запущена")
+
+    async def submit(self, **row) -> int:
+        """Ставит ответ в очередь и возвращает его id после фиксации в базе"""
+        if self._task is None or self._task.done():
+            self.start()
+        row.setdefault('created_at', datetime.utcnow())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return await future
+
+    async def flush(self):
+        """Сбрасывает в базу все ответы, поставленные в очередь до вызова"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                await self._write_batch(batch)
+
+    async def close(self):
+        """Сбрасывает остаток очереди и останавливает фоновую задачу"""
+        if self._task is None:
+            return
+        # Даем фоновой задаче дописать текущий пакет, а не прерываем ее
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self._task = None
+        logger.info("Очередь записи ответов остановлена")
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def _write_batch(self, batch):
+        rows = [row for row, _ in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            ids = await loop.run_in_executor(self._executor, self._insert, rows)
+        except Exception as e:
+            logger.error(f"Ошибка при записи пакета из {len(rows)} ответов: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), answer_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(answer_id)
+
+    def _insert(self, rows) -> List[int]:
+        """Вставляет пакет ответов одной транзакцией (в потоке записи)"""
+        with self._app.app_context():
+            with db.engine.begin() as connection:
+                result = connection.execute(
+                    insert(Answer.__table__).returning(
+                        Answer.__table__.c.id, sort_by_parameter_order=True
+                    ),
+                    rows
+                )
+                return [answer_id for (answer_id,) in result]
+
+
+answer_queue = AnswerIngestQueue()
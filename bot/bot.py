@@ -1,22 +1,37 @@
 import os
 import logging
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters.command import Command
 from aiogram.filters import CommandObject
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, Message, CallbackQuery, FSInputFile
-from website.models import db, User, Game, Team, TeamMember, Question, Answer, Round, TelegramCode, Quiz
+from website.models import db, User, Game, Team, TeamMember, Question, Answer, Round, TelegramCode, Quiz, game_teams
 from website.views.auth import generate_code
-from website.views.quiz_parser import parse_quiz_content
+from website.views.quiz_parser import MAX_QUIZ_FILE_SIZE, FILE_TOO_LARGE_MESSAGE
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
+from sqlalchemy import text, update
 import contextlib
 import asyncio
 from functools import wraps
 from sqlalchemy.orm import scoped_session, sessionmaker
 from datetime import datetime
+from typing import NamedTuple, Optional
 from aiogram.types import Message, CallbackQuery
-import tempfile
-from docx import Document
+from website.scoreboard import scoreboards
+from website.quiz_plan import quiz_plans
+from website.identity_cache import identity_cache, TeamRef
+from website.deletion import invalidate_deleted
+from website.quiz_clone import clone_quiz
+from website.jobs import import_jobs, import_cache, STAGE_QUEUED, STAGE_DONE, STAGE_FAILED, STAGE_DUPLICATE, STAGE_TITLES
+from website.socket import emit_to_room, game_room, init_emitter, room_updates
+from website.spectator import spectators
+from bot.fanout import OutgoingMessage, send_bulk
+from bot.answer_queue import answer_queue
+from bot.outbox import outbox_dispatcher
+from bot.webhook import webhook_enabled, run_webhook
+from bot.db_executor import db_executor, run_db
+from bot.question_timer import question_timers
 
 # Импортируем константы статусов игры
 GAME_STATUS_SETUP = 'setup'
@@ -34,6 +49,10 @@ RESUME_GAME = 'resume_game'
 END_GAME = 'end_game'
 APPROVE_ANSWER = 'approve_answer'
 REJECT_ANSWER = 'reject_answer'
+IMPORT_COPY = 'import_copy'
+
+# Переходить к следующему вопросу автоматически, когда истекает время на ответ
+AUTO_ADVANCE = os.getenv('QUESTION_AUTO_ADVANCE', '').lower() in ('1', 'true', 'yes')
 
 # Настройка логирования
 logging.basicConfig(
@@ -48,19 +67,27 @@ dp = None
 flask_app = None
 
 def with_app_context(func):
-    """Декоратор для работы с контекстом приложения Flask"""
+    """Декоратор для работы с контекстом приложения Flask.
+
+    Каждое обновление получает собственный контекст приложения, а с ним и
+    собственную сессию базы данных, которая закрывается по завершении.
+    """
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        try:
-            return await func(*args, **kwargs)
-        except Exception as e:
-            logger.error(f"Ошибка в обработчике {func.__name__}: {e}")
-            # Если это сообщение, отправляем ответ об ошибке
-            if len(args) > 0 and isinstance(args[0], types.Message):
-                await args[0].answer("Произошла ошибка при обработке команды. Попробуйте позже.")
-            # Если это callback_query, отвечаем на него
-            elif len(args) > 0 and isinstance(args[0], types.CallbackQuery):
-                await args[0].answer("Произошла ошибка. Попробуйте позже.", show_alert=True)
+        with flask_app.app_context():
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике {func.__name__}: {e}")
+                # Если это сообщение, отправляем ответ об ошибке
+                if len(args) > 0 and isinstance(args[0], types.Message):
+                    await args[0].answer("Произошла ошибка при обработке команды. Попробуйте позже.")
+                # Если это callback_query, отвечаем на него
+                elif len(args) > 0 and isinstance(args[0], types.CallbackQuery):
+                    await args[0].answer("Произошла ошибка. Попробуйте позже.", show_alert=True)
+            finally:
+                # Закрытие сессии может откатывать транзакцию, поэтому тоже вне event loop
+                await run_db(db.session.remove)
     return wrapper
 
 def create_bot(app):
@@ -77,11 +104,18 @@ def create_bot(app):
 
         # Инициализация бота и диспетчера
         global bot, dp
-        bot = Bot(token=bot_token)
+        # TELEGRAM_API_URL позволяет работать через локальный Bot API сервер или его заглушку
+        api_url = os.getenv('TELEGRAM_API_URL')
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+        bot = Bot(token=bot_token, session=session)
         dp = Dispatcher()
 
         # Регистрируем все обработчики
         register_handlers(dp)
+
+        # События в игровые комнаты сайта, если бот запущен отдельно от веб-сервера
+        init_emitter()
+        spectators.start(flask_app, emit_to_room)
         
         logger.info("Бот успешно инициализирован")
         return bot, dp
@@ -97,9 +131,12 @@ def register_handlers(dp: Dispatcher):
     dp.message.register(cmd_login, Command("login"))
     dp.message.register(cmd_join, Command("join"))
     dp.message.register(cmd_upload_quiz, Command("upload_quiz"))
+    dp.message.register(cmd_clone_quiz, Command("clone_quiz"))
+    dp.message.register(cmd_cache_stats, Command("cache_stats"))
     
     # Регистрируем обработчик файлов
     dp.message.register(process_quiz_file, lambda msg: msg.document is not None)
+    dp.callback_query.register(process_import_copy, lambda c: c.data.startswith(f"{IMPORT_COPY}:"))
     
     # Регистрируем базовые обработчики
     dp.callback_query.register(process_join_game, lambda c: c.data == "join_game")
@@ -126,6 +163,37 @@ def register_handlers(dp: Dispatcher):
     # Регистрируем обработчик текстовых ответов (должен быть последним)
     dp.message.register(process_answer, lambda msg: msg.text and not msg.text.startswith('/'))
 
+def _register_user(telegram_id: int, username: str, is_admin: bool):
+    """Создает пользователя или обновляет его роль, возвращает (id, роль)"""
+    # Начинаем новую транзакцию
+    db.session.begin_nested()
+    
+    user = User.query.filter_by(telegram_id=telegram_id).first()
+    if not user:
+        # Создаем пользователя с соответствующей ролью
+        user = User(
+            telegram_id=telegram_id,
+            username=username,
+            role="admin" if is_admin else "player"  # Устанавливаем роль admin для админа
+        )
+        db.session.add(user)
+        logger.info(f"Создан новый пользователь: {user.username} с ролью {user.role}")
+    elif is_admin and user.role != 'admin':
+        # Если пользователь уже существует и это админ, но роль не admin
+        logger.info(f"Обновляем роль пользователя {user.username} с {user.role} на admin")
+        user.role = 'admin'
+    else:
+        logger.info(f"Пользователь {user.username} уже существует с ролью {user.role}")
+        if is_admin:
+            logger.info("Пользователь является админом, но роль уже установлена правильно")
+        else:
+            logger.info("Пользователь не является админом")
+    
+    # Фиксируем изменения
+    db.session.commit()
+    identity_cache.invalidate_user(telegram_id=telegram_id)
+    return user.id, user.role
+
 @with_app_context
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
@@ -141,35 +209,15 @@ async def cmd_start(message: types.Message):
     logger.info(f"is_admin: {is_admin}")
     
     try:
-        # Начинаем новую транзакцию
-        db.session.begin_nested()
-        
-        user = User.query.filter_by(telegram_id=message.from_user.id).first()
-        if not user:
-            # Создаем пользователя с соответствующей ролью
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username or str(message.from_user.id),
-                role="admin" if is_admin else "player"  # Устанавливаем роль admin для админа
-            )
-            db.session.add(user)
-            logger.info(f"Создан новый пользователь: {user.username} с ролью {user.role}")
-        elif is_admin and user.role != 'admin':
-            # Если пользователь уже существует и это админ, но роль не admin
-            logger.info(f"Обновляем роль пользователя {user.username} с {user.role} на admin")
-            user.role = 'admin'
-        else:
-            logger.info(f"Пользователь {user.username} уже существует с ролью {user.role}")
-            if is_admin:
-                logger.info("Пользователь является админом, но роль уже установлена правильно")
-            else:
-                logger.info("Пользователь не является админом")
-        
-        # Фиксируем изменения
-        db.session.commit()
+        user_id, role = await run_db(
+            _register_user,
+            message.from_user.id,
+            message.from_user.username or str(message.from_user.id),
+            bool(is_admin)
+        )
         
         # Проверяем, является ли пользователь модератором или админом
-        if user.role in ['admin', 'moderator']:
+        if role in ['admin', 'moderator']:
             keyboard = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [
@@ -196,18 +244,18 @@ async def cmd_start(message: types.Message):
             "admin": "Администратор",
             "moderator": "Модератор",
             "player": "Игрок"
-        }.get(user.role, "Неизвестная роль")
+        }.get(role, "Неизвестная роль")
         
         await message.answer(
             f"Привет! Ваша роль: {role_text}\n"
-            f"Ваш внутренний ID: {user.id}\n\n"
+            f"Ваш внутренний ID: {user_id}\n\n"
             "Выберите действие:",
             reply_markup=keyboard
         )
         
     except Exception as e:
         # В случае ошибки откатываем транзакцию
-        db.session.rollback()
+        await run_db(db.session.rollback)
         logger.error(f"Ошибка в обработчике cmd_start: {e}")
         # Отправляем сообщение об ошибке пользователю
         await message.answer(
@@ -215,6 +263,49 @@ async def cmd_start(message: types.Message):
             "Пожалуйста, попробуйте позже или обратитесь к администратору."
         )
 
+def _issue_login_code(telegram_id: int, username: str) -> str:
+    """Создает администратора при необходимости и выдает ему новый код входа"""
+    # Начинаем транзакцию
+    db.session.begin_nested()
+    
+    # Получаем или создаем пользователя
+    user = User.query.filter_by(telegram_id=telegram_id).first()
+    if not user:
+        # Создаем администратора
+        user = User(
+            telegram_id=telegram_id,
+            username=username,
+            role="admin"
+        )
+        db.session.add(user)
+        logger.info(f"Создан новый администратор: {user.username}")
+    elif user.role != 'admin':
+        # Обновляем роль до админа, если это необходимо
+        user.role = 'admin'
+        logger.info(f"Обновлена роль пользователя {user.username} до admin")
+    
+    # Генерируем код
+    code = generate_code()
+    logger.info(f"Сгенерирован код {code} для пользователя {telegram_id}")
+    
+    # Проверяем существующие коды
+    existing_codes = TelegramCode.query.filter_by(telegram_id=telegram_id, is_used=False).all()
+    if existing_codes:
+        logger.info(f"Найдены существующие неиспользованные коды: {[code.code for code in existing_codes]}")
+        # Отмечаем старые коды как использованные
+        for old_code in existing_codes:
+            old_code.is_used = True
+        logger.info("Старые коды помечены как использованные")
+    
+    # Сохраняем новый код в базу
+    db.session.add(TelegramCode(code=code, telegram_id=telegram_id))
+    
+    # Фиксируем все изменения
+    db.session.commit()
+    identity_cache.invalidate_user(telegram_id=telegram_id)
+    logger.info(f"Код {code} успешно сохранен в базе")
+    return code
+
 @with_app_context
 async def cmd_login(message: types.Message):
     """Обработчик команды /login"""
@@ -228,48 +319,11 @@ async def cmd_login(message: types.Message):
             await message.answer("У вас нет прав для входа в админ-панель.")
             return
         
-        # Начинаем транзакцию
-        db.session.begin_nested()
-        
-        # Получаем или создаем пользователя
-        user = User.query.filter_by(telegram_id=message.from_user.id).first()
-        if not user:
-            # Создаем администратора
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username or f"admin_{message.from_user.id}",
-                role="admin"
-            )
-            db.session.add(user)
-            logger.info(f"Создан новый администратор: {user.username}")
-        elif user.role != 'admin':
-            # Обновляем роль до админа, если это необходимо
-            user.role = 'admin'
-            logger.info(f"Обновлена роль пользователя {user.username} до admin")
-        
-        # Генерируем код
-        code = generate_code()
-        logger.info(f"Сгенерирован код {code} для пользователя {message.from_user.id}")
-        
-        # Проверяем существующие коды
-        existing_codes = TelegramCode.query.filter_by(telegram_id=message.from_user.id, is_used=False).all()
-        if existing_codes:
-            logger.info(f"Найдены существующие неиспользованные коды: {[code.code for code in existing_codes]}")
-            # Отмечаем старые коды как использованные
-            for old_code in existing_codes:
-                old_code.is_used = True
-            logger.info("Старые коды помечены как использованные")
-        
-        # Сохраняем новый код в базу
-        telegram_code = TelegramCode(
-            code=code,
-            telegram_id=message.from_user.id
+        code = await run_db(
+            _issue_login_code,
+            message.from_user.id,
+            message.from_user.username or f"admin_{message.from_user.id}"
         )
-        db.session.add(telegram_code)
-        
-        # Фиксируем все изменения
-        db.session.commit()
-        logger.info(f"Код {code} успешно сохранен в базе")
         
         # Отправляем код пользователю
         await message.answer(
@@ -280,7 +334,7 @@ async def cmd_login(message: types.Message):
         
     except Exception as e:
         # В случае ошибки откатываем транзакцию
-        db.session.rollback()
+        await run_db(db.session.rollback)
         logger.error(f"Ошибка в обработчике cmd_login: {e}")
         await message.answer(
             "Произошла ошибка при генерации кода. "
@@ -326,19 +380,48 @@ async def process_auto_join(callback_query: types.CallbackQuery):
     
     await callback_query.answer()
 
+def _find_game(join_code: str):
+    """Игра по коду присоединения: (id, status, moderator_id, quiz_id)"""
+    return db.session.query(Game.id, Game.status, Game.moderator_id, Game.quiz_id)\
+        .filter(Game.join_code == join_code)\
+        .first()
+
+def _mark_joined(user_id: int, game_id: int):
+    """Отмечает присоединение игрока к игре.
+
+    Возвращает (команда, присоединился ли только что) или None,
+    если игрок не состоит ни в одной команде игры.
+    """
+    team_member = TeamMember.query.filter_by(user_id=user_id)\
+        .join(TeamMember.team)\
+        .join(Team.games)\
+        .filter(Game.id == game_id)\
+        .first()
+    if not team_member:
+        return None
+    
+    team = TeamRef(team_member.team_id, team_member.team.name)
+    if team_member.joined_at:
+        return team, False
+    
+    # Отмечаем время присоединения
+    team_member.joined_at = datetime.utcnow()
+    db.session.commit()
+    return team, True
+
 @with_app_context
 async def process_game_code(message: Message):
     """Обработчик ввода кода квиза"""
     logger.info(f"Получен код квиза от пользователя {message.from_user.id}: {message.text}")
     
     # Получаем пользователя по telegram_id
-    user = User.query.filter_by(telegram_id=message.from_user.id).first()
+    user = await run_db(identity_cache.get_user, message.from_user.id)
     if not user:
         await message.answer("Ошибка: пользователь не найден.")
         return
     
     # Ищем игру по коду
-    game = Game.query.filter_by(join_code=message.text).first()
+    game = await run_db(_find_game, message.text)
     
     if not game:
         await message.answer("Квиз с таким кодом не найден.")
@@ -352,47 +435,40 @@ async def process_game_code(message: Message):
         )
         return
     
-    # Ищем команду игрока
-    team_member = TeamMember.query.filter_by(user_id=user.id)\
-        .join(TeamMember.team)\
-        .join(Team.games)\
-        .filter(Game.id == game.id)\
-        .first()
+    # Ищем команду игрока и отмечаем присоединение
+    joined = await run_db(_mark_joined, user.id, game.id)
     
-    if not team_member:
+    if not joined:
         await message.answer(
             "Вы не были добавлены ни в одну команду этого квиза.\n"
             "Обратитесь к администратору или модератору квиза."
         )
         return
     
+    team, just_joined = joined
     # Если пользователь уже присоединился к игре
-    if team_member.joined_at:
+    if not just_joined:
         await message.answer(
-            f"Вы уже присоединились к квизу в команде {team_member.team.name}.\n"
+            f"Вы уже присоединились к квизу в команде {team.name}.\n"
             f"Ожидайте начала квиза!"
         )
         return
-        
-    # Отмечаем время присоединения
-    team_member.joined_at = datetime.utcnow()
-    db.session.commit()
     
     # Отправляем уведомление через WebSocket
-    from website.socket import socketio
-    socketio.emit('player_joined', {
+    emit_to_room('player_joined', {
         'user_id': user.id,
         'username': user.username,
-        'team_id': team_member.team_id
-    }, room=f'game_{game.id}')
+        'team_id': team.team_id
+    }, game_room(game.id))
     
     # Получаем информацию о раундах
-    total_rounds = Round.query.filter_by(quiz_id=game.quiz_id).count()
-    first_round = Round.query.filter_by(quiz_id=game.quiz_id, order=1).first()
-    questions_in_first_round = Question.query.filter_by(round_id=first_round.id).count() if first_round else 0
+    plan = await run_db(quiz_plans.get, game.quiz_id)
+    first_question = plan.first()
+    total_rounds = plan.total_rounds
+    questions_in_first_round = first_question.round_size if first_question else 0
     
     await message.answer(
-        f"Вы успешно присоединились к квизу в команде {team_member.team.name}!\n\n"
+        f"Вы успешно присоединились к квизу в команде {team.name}!\n\n"
         f"📚 Всего раундов: {total_rounds}\n"
         f"❓ Вопросов в первом раунде: {questions_in_first_round}\n\n"
         "Ожидайте начала квиза."
@@ -415,7 +491,7 @@ async def cmd_join(message: types.Message, command: CommandObject):
         logger.info(f"Код для присоединения: {join_code}")
         
         # Ищем игру по коду
-        game = Game.query.filter_by(join_code=join_code).first()
+        game = await run_db(_find_game, join_code)
         if not game:
             logger.warning(f"Игра с кодом {join_code} не найдена")
             await message.answer("Игра с указанным кодом не найдена")
@@ -431,7 +507,7 @@ async def cmd_join(message: types.Message, command: CommandObject):
             return
 
         # Получаем пользователя
-        user = User.query.filter_by(telegram_id=message.from_user.id).first()
+        user = await run_db(identity_cache.get_user, message.from_user.id)
         if not user:
             logger.warning(f"Пользователь с telegram_id {message.from_user.id} не найден")
             await message.answer(
@@ -462,14 +538,10 @@ async def cmd_join(message: types.Message, command: CommandObject):
             )
             return
 
-        # Ищем команду игрока
-        team_member = TeamMember.query.filter_by(user_id=user.id)\
-            .join(TeamMember.team)\
-            .join(Team.games)\
-            .filter(Game.id == game.id)\
-            .first()
+        # Ищем команду игрока и отмечаем присоединение
+        joined = await run_db(_mark_joined, user.id, game.id)
         
-        if not team_member:
+        if not joined:
             logger.warning(f"Пользователь {user.id} не найден ни в одной команде игры {game.id}")
             await message.answer(
                 "Вы не были добавлены ни в одну команду этой игры.\n"
@@ -477,28 +549,24 @@ async def cmd_join(message: types.Message, command: CommandObject):
             )
             return
             
+        team, just_joined = joined
         # Если пользователь уже присоединился к игре
-        if team_member.joined_at:
+        if not just_joined:
             await message.answer(
-                f"Вы уже присоединились к игре в команде {team_member.team.name}.\n"
+                f"Вы уже присоединились к игре в команде {team.name}.\n"
                 f"Ожидайте начала игры!"
             )
             return
-            
-        # Отмечаем время присоединения
-        team_member.joined_at = datetime.utcnow()
-        db.session.commit()
         
         # Отправляем уведомление через WebSocket
-        from website.socket import socketio
-        socketio.emit('player_joined', {
+        emit_to_room('player_joined', {
             'user_id': user.id,
             'username': user.username,
-            'team_id': team_member.team_id
-        }, room=f'game_{game.id}')
+            'team_id': team.team_id
+        }, game_room(game.id))
         
         await message.answer(
-            f"Вы успешно присоединились к команде {team_member.team.name}!\n"
+            f"Вы успешно присоединились к команде {team.name}!\n"
             "Ожидайте начала игры."
         )
         
@@ -506,71 +574,162 @@ async def cmd_join(message: types.Message, command: CommandObject):
         logger.error(f"Ошибка при обработке команды /join: {e}")
         await message.answer("Произошла ошибка при обработке команды")
 
+def _join_team(team_id: int, user_id: int):
+    """Добавляет пользователя в команду.
+
+    Возвращает (название команды, добавлен ли только что) или None,
+    если команда не найдена.
+    """
+    # Получаем команду
+    team = Team.query.get(team_id)
+    if not team:
+        return None
+    team_name = team.name
+
+    # Проверяем, не состоит ли пользователь уже в команде
+    existing_member = TeamMember.query.filter_by(
+        team_id=team.id,
+        user_id=user_id
+    ).first()
+
+    if existing_member:
+        return team_name, False
+
+    # Добавляем пользователя в команду
+    team_member = TeamMember(team_id=team.id, user_id=user_id)
+    db.session.add(team_member)
+    db.session.commit()
+    return team_name, True
+
 @with_app_context
 async def process_join_team(callback_query: types.CallbackQuery):
     """Обработчик присоединения к команде"""
     team_id = int(callback_query.data.split(':')[1])
-    
+
     # Получаем пользователя по telegram_id
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
     if not user:
         await callback_query.answer("Ошибка: пользователь не найден", show_alert=True)
         return
-    
-    # Получаем команду
-    team = Team.query.get(team_id)
-    if not team:
+
+    joined = await run_db(_join_team, team_id, user.id)
+    if not joined:
         await callback_query.answer("Команда не найдена", show_alert=True)
         return
-    
-    # Проверяем, не состоит ли пользователь уже в команде
-    existing_member = TeamMember.query.filter_by(
-        team_id=team.id,
-        user_id=user.id
-    ).first()
-    
-    if existing_member:
+
+    team_name, added = joined
+    if not added:
         await callback_query.answer("Вы уже состоите в этой команде", show_alert=True)
         return
-    
-    # Добавляем пользователя в команду
-    team_member = TeamMember(team_id=team.id, user_id=user.id)
-    db.session.add(team_member)
-    db.session.commit()
-    
+
     await callback_query.message.edit_text(
-        f"Вы успешно присоединились к команде {team.name}!"
+        f"Вы успешно присоединились к команде {team_name}!"
     )
     await callback_query.answer()
 
+class GameSnapshot(NamedTuple):
+    """Поля игры, нужные обработчикам, без привязки к сессии"""
+    id: int
+    quiz_id: int
+    moderator_id: int
+    status: str
+    current_question_id: Optional[int]
+    quiz_title: str
+    moderator_telegram_id: int
+
+def _game_snapshot_query():
+    """Запрос полей GameSnapshot: игра, название квиза и модератор"""
+    return db.session.query(
+        Game.id, Game.quiz_id, Game.moderator_id, Game.status, Game.current_question_id,
+        Quiz.title, User.telegram_id
+    ).join(Quiz, Quiz.id == Game.quiz_id)\
+        .join(User, User.id == Game.moderator_id)
+
+def _load_game(game_id: int) -> Optional[GameSnapshot]:
+    """Загружает игру вместе с названием квиза и модератором одним запросом"""
+    row = _game_snapshot_query().filter(Game.id == game_id).first()
+    return GameSnapshot(*row) if row else None
+
+def _update_game(game_id: int, **values):
+    """Обновляет поля игры, фиксирует изменения и сообщает о них зрителям"""
+    db.session.execute(update(Game).where(Game.id == game_id).values(**values))
+    db.session.commit()
+    spectators.publish(game_id)
+
+def _mark_ready(game_id: int):
+    """Переводит игру в READY и выдает ей код комнаты для зрителей"""
+    game = db.session.get(Game, game_id)
+    game.status = Game.STATUS_READY
+    if not game.room_code:
+        game.generate_room_code()
+    db.session.commit()
+    spectators.publish(game_id)
+
+def _game_members(game_id: int):
+    """Участники команд игры: telegram_id, username, team_id, team_name, member_id, joined_at"""
+    return db.session.query(
+        User.telegram_id, User.username,
+        Team.id.label('team_id'), Team.name.label('team_name'),
+        TeamMember.id.label('member_id'), TeamMember.joined_at
+    ).join(TeamMember, TeamMember.user_id == User.id)\
+        .join(Team, Team.id == TeamMember.team_id)\
+        .join(game_teams, game_teams.c.team_id == Team.id)\
+        .filter(game_teams.c.game_id == game_id)\
+        .order_by(Team.id, TeamMember.id)\
+        .all()
+
+async def notify_members(game_id: int, text: str, joined_only: bool = False):
+    """Рассылает сообщение участникам игры через общий планировщик рассылок"""
+    members = [
+        member for member in await run_db(_game_members, game_id)
+        if member.joined_at or not joined_only
+    ]
+    results = await send_bulk(bot, [OutgoingMessage(member.telegram_id, text) for member in members])
+    for member, result in zip(members, results):
+        if not result.ok:
+            logger.error(f"Ошибка при отправке уведомления игроку {member.username}: {result.error}")
+
+def _teams_overview(game_id: int):
+    """Команды игры: [(название, капитан, [игроки])]"""
+    game = Game.query.get(game_id)
+    return [
+        (
+            team.name,
+            team.captain.username if team.captain else None,
+            [member.user.username for member in team.members]
+        )
+        for team in game.teams
+    ]
+
 @with_app_context
 async def process_ready_game(callback_query: types.CallbackQuery):
     """Обработчик подготовки квиза к началу"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game:
         await callback_query.answer("Квиз не найден", show_alert=True)
         return
-    
-    if game.moderator_id != User.query.filter_by(telegram_id=callback_query.from_user.id).first().id:
+
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
+    if not user or game.moderator_id != user.id:
         await callback_query.answer("У вас нет прав для управления этим квизом", show_alert=True)
         return
-    
+
     # Проверяем, есть ли команды и игроки
-    if not game.teams:
+    teams = await run_db(_teams_overview, game_id)
+    if not teams:
         await callback_query.answer("Нельзя начать квиз без команд", show_alert=True)
         return
-    
-    for team in game.teams:
-        if not team.members:
-            await callback_query.answer(f"В команде {team.name} нет игроков", show_alert=True)
+
+    for team_name, _, members in teams:
+        if not members:
+            await callback_query.answer(f"В команде {team_name} нет игроков", show_alert=True)
             return
-    
+
     # Меняем статус игры на READY
-    game.status = Game.STATUS_READY
-    db.session.commit()
-    
+    await run_db(_mark_ready, game_id)
+
     # Создаем клавиатуру для управления игрой
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -582,84 +741,89 @@ async def process_ready_game(callback_query: types.CallbackQuery):
             ]
         ]
     )
-    
+
     # Отправляем сообщение с информацией о командах
     teams_info = "\n\n".join([
-        f"Команда: {team.name}\n"
-        f"Капитан: {team.captain.username}\n"
-        f"Игроки: {', '.join(member.user.username for member in team.members)}"
-        for team in game.teams
+        f"Команда: {team_name}\n"
+        f"Капитан: {captain}\n"
+        f"Игроки: {', '.join(members)}"
+        for team_name, captain, members in teams
     ])
-    
+
     await callback_query.message.edit_text(
         f"Квиз готов к началу!\n\n"
-        f"Название: {game.quiz.title}\n\n"
+        f"Название: {game.quiz_title}\n\n"
         f"Команды:\n{teams_info}",
         reply_markup=keyboard
     )
-    
+
     await callback_query.answer()
 
 @with_app_context
 async def process_start_game(callback_query: types.CallbackQuery):
     """Обработчик нажатия кнопки начала игры"""
     game_id = int(callback_query.data.split(':')[1])
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
-    
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
+
     if not user or user.role not in ['admin', 'moderator']:
         await callback_query.answer("У вас нет прав для управления квизом", show_alert=True)
         return
-        
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.moderator_id != user.id:
         await callback_query.answer("Квиз не найден или вы не являетесь его модератором", show_alert=True)
         return
-        
+
     if game.status != Game.STATUS_READY:
         await callback_query.answer("Квиз не готов к началу", show_alert=True)
         return
-        
+
     try:
-        # Меняем статус игры
-        game.status = Game.STATUS_ACTIVE
-        game.started_at = datetime.utcnow()
-        
         # Берем первый вопрос
-        first_round = Round.query.filter_by(quiz_id=game.quiz_id, order=1).first()
-        if first_round:
-            first_question = Question.query.filter_by(round_id=first_round.id, order=1).first()
-            if first_question:
-                game.current_question_id = first_question.id
-            
-        db.session.commit()
-        
+        plan = await run_db(quiz_plans.get, game.quiz_id)
+        first_question = plan.first()
+
+        # Меняем статус игры
+        changes = {'status': Game.STATUS_ACTIVE, 'started_at': datetime.utcnow()}
+        if first_question:
+            changes['current_question_id'] = first_question.question_id
+        await run_db(_update_game, game.id, **changes)
+        game = game._replace(
+            status=Game.STATUS_ACTIVE,
+            current_question_id=changes.get('current_question_id', game.current_question_id)
+        )
+
         # Отправляем уведомление через WebSocket
-        from website.socket import socketio, broadcast_game_state
-        broadcast_game_state(game.id)
-        
+        from website.socket import broadcast_game_state
+        await run_db(broadcast_game_state, game.id)
+
         # Получаем информацию о раундах
-        total_rounds = Round.query.filter_by(quiz_id=game.quiz_id).count()
-        questions_in_first_round = Question.query.filter_by(round_id=first_round.id).count()
-        
-        # Отправляем сообщение всем участникам
-        for team in game.teams:
-            for member in team.members:
-                if member.joined_at:  # Отправляем только тем, кто присоединился
-                    await bot.send_message(
-                        member.user.telegram_id,
-                        f"🎮 Квиз «{game.quiz.title}» начинается!\n\n"
-                        f"🎯 Вы играете за команду «{team.name}»\n"
-                        f"📚 Всего раундов: {total_rounds}\n"
-                        f"❓ Вопросов в первом раунде: {questions_in_first_round}\n\n"
-                        f"👥 Ваши товарищи по команде:\n"
-                        + "\n".join(f"• {m.user.username}" for m in team.members if m.id != member.id)
-                        + "\n\n"
-                        f"Ждите первый вопрос от модератора..."
-                    )
-        
+        total_rounds = plan.total_rounds
+        questions_in_first_round = first_question.round_size if first_question else 0
+
+        # Отправляем сообщение всем участникам, кто присоединился
+        members = await run_db(_game_members, game.id)
+        await send_bulk(bot, [
+            OutgoingMessage(
+                member.telegram_id,
+                f"🎮 Квиз «{game.quiz_title}» начинается!\n\n"
+                f"🎯 Вы играете за команду «{member.team_name}»\n"
+                f"📚 Всего раундов: {total_rounds}\n"
+                f"❓ Вопросов в первом раунде: {questions_in_first_round}\n\n"
+                f"👥 Ваши товарищи по команде:\n"
+                + "\n".join(
+                    f"• {m.username}" for m in members
+                    if m.team_id == member.team_id and m.member_id != member.member_id
+                )
+                + "\n\n"
+                f"Ждите первый вопрос от модератора..."
+            )
+            for member in members if member.joined_at
+        ])
+
         # Создаем панель управления для модератора
         await update_moderator_panel(game, callback_query.message)
-        
+
     except Exception as e:
         logger.error(f"Ошибка при начале квиза: {e}")
         await callback_query.answer("Произошла ошибка при начале квиза", show_alert=True)
@@ -668,78 +832,50 @@ async def process_start_game(callback_query: types.CallbackQuery):
 async def process_next_round(callback_query: types.CallbackQuery):
     """Обработчик перехода к следующему раунду"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.status != Game.STATUS_ACTIVE:
         await callback_query.answer("Игра не найдена или не активна", show_alert=True)
         return
-    
-    # Получаем текущий раунд
-    current_round = None
-    if game.current_question_id:
-        current_question = Question.query.get(game.current_question_id)
-        current_round = current_question.round
-    
-    # Получаем следующий раунд
-    next_round = None
-    if current_round:
-        next_round = Round.query.filter_by(
-            quiz_id=game.quiz_id,
-            order=current_round.order + 1
-        ).first()
-    else:
-        # Если текущего раунда нет, берем первый
-        next_round = Round.query.filter_by(
-            quiz_id=game.quiz_id,
-            order=1
-        ).first()
-    
-    if not next_round:
-        await callback_query.answer("Нет следующего раунда", show_alert=True)
-        return
-    
-    # Берем первый вопрос следующего раунда
-    next_question = Question.query.filter_by(
-        round_id=next_round.id,
-        order=1
-    ).first()
-    
+
+    # Первый вопрос следующего раунда (или первого, если текущего вопроса нет)
+    plan, _ = await run_db(quiz_plans.locate, game.quiz_id, game.current_question_id)
+    next_question = plan.next_round_start(game.current_question_id)
+
     if not next_question:
-        await callback_query.answer("В следующем раунде нет вопросов", show_alert=True)
+        await callback_query.answer("Нет следующего раунда", show_alert=True)
         return
-    
+
+    # Дописываем ответы на прошлый вопрос, прежде чем переключиться
+    await answer_queue.flush()
+
     # Обновляем текущий вопрос
-    game.current_question_id = next_question.id
-    db.session.commit()
-    
+    await run_db(_update_game, game_id, current_question_id=next_question.question_id)
+    question_timers.cancel(game_id)
+
     # Оповещаем все команды о начале нового раунда
-    for team in game.teams:
-        for member in team.members:
-            try:
-                await bot.send_message(
-                    member.user.telegram_id,
-                    f"Начался новый раунд: {next_round.title}\n"
-                    f"Приготовьтесь к ответам!"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления игроку {member.user.username}: {e}")
-    
+    await notify_members(
+        game_id,
+        f"Начался новый раунд: {next_question.round_title}\n"
+        f"Приготовьтесь к ответам!"
+    )
+
     await callback_query.answer("Начат новый раунд")
 
 @with_app_context
 async def process_pause_game(callback_query: types.CallbackQuery):
     """Обработчик постановки игры на паузу"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.status != Game.STATUS_ACTIVE:
         await callback_query.answer("Игра не найдена или не активна", show_alert=True)
         return
-    
-    # Меняем статус игры
-    game.status = Game.STATUS_PAUSED
-    db.session.commit()
-    
+
+    # Меняем статус игры и останавливаем отсчет времени
+    await run_db(_update_game, game_id, status=Game.STATUS_PAUSED)
+    question_timers.pause(game_id)
+
     # Создаем клавиатуру для управления игрой
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -757,40 +893,32 @@ async def process_pause_game(callback_query: types.CallbackQuery):
             ]
         ]
     )
-    
+
     await callback_query.message.edit_text(
         f"Игра приостановлена\n"
-        f"Квиз: {game.quiz.title}",
+        f"Квиз: {game.quiz_title}",
         reply_markup=keyboard
     )
-    
+
     # Оповещаем все команды о паузе
-    for team in game.teams:
-        for member in team.members:
-            try:
-                await bot.send_message(
-                    member.user.telegram_id,
-                    "Игра приостановлена. Ожидайте продолжения."
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления игроку {member.user.username}: {e}")
-    
+    await notify_members(game_id, "Игра приостановлена. Ожидайте продолжения.")
+
     await callback_query.answer()
 
 @with_app_context
 async def process_resume_game(callback_query: types.CallbackQuery):
     """Обработчик возобновления игры"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.status != Game.STATUS_PAUSED:
         await callback_query.answer("Игра не найдена или не на паузе", show_alert=True)
         return
-    
-    # Меняем статус игры
-    game.status = Game.STATUS_ACTIVE
-    db.session.commit()
-    
+
+    # Меняем статус игры и продолжаем отсчет с оставшегося времени
+    await run_db(_update_game, game_id, status=Game.STATUS_ACTIVE)
+    question_timers.resume(game_id)
+
     # Создаем клавиатуру для управления игрой
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -808,57 +936,44 @@ async def process_resume_game(callback_query: types.CallbackQuery):
             ]
         ]
     )
-    
+
     await callback_query.message.edit_text(
         f"Игра продолжается\n"
-        f"Квиз: {game.quiz.title}\n"
+        f"Квиз: {game.quiz_title}\n"
         "Используйте кнопки для управления игрой.",
         reply_markup=keyboard
     )
-    
+
     # Оповещаем все команды о возобновлении
-    for team in game.teams:
-        for member in team.members:
-            try:
-                await bot.send_message(
-                    member.user.telegram_id,
-                    "Игра продолжается!"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления игроку {member.user.username}: {e}")
-    
+    await notify_members(game_id, "Игра продолжается!")
+
     await callback_query.answer()
 
 @with_app_context
 async def process_finish_game(callback_query: types.CallbackQuery):
     """Обработчик завершения игры"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.status not in [Game.STATUS_ACTIVE, Game.STATUS_PAUSED]:
         await callback_query.answer("Игра не найдена или не может быть завершена", show_alert=True)
         return
-    
+
+    # Дописываем оставшиеся ответы до завершения игры
+    await answer_queue.flush()
+
     # Меняем статус игры
-    game.status = Game.STATUS_FINISHED
-    db.session.commit()
-    
+    await run_db(_update_game, game_id, status=Game.STATUS_FINISHED)
+    question_timers.cancel(game_id)
+
     await callback_query.message.edit_text(
         f"Игра завершена\n"
-        f"Квиз: {game.quiz.title}"
+        f"Квиз: {game.quiz_title}"
     )
-    
+
     # Оповещаем все команды о завершении
-    for team in game.teams:
-        for member in team.members:
-            try:
-                await bot.send_message(
-                    member.user.telegram_id,
-                    "Игра завершена. Спасибо за участие!"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления игроку {member.user.username}: {e}")
-    
+    await notify_members(game_id, "Игра завершена. Спасибо за участие!")
+
     await callback_query.answer()
 
 async def echo(message: types.Message):
@@ -891,95 +1006,99 @@ async def echo(message: types.Message):
 async def start_bot(bot: Bot, dp: Dispatcher):
     try:
         logger.info("Запуск бота...")
+        # Собираем таблицы результатов идущих игр
+        active_games = db.session.query(Game.id).filter(
+            Game.status.in_([Game.STATUS_ACTIVE, Game.STATUS_PAUSED])
+        ).all()
+        scoreboards.warm(game_id for (game_id,) in active_games)
+        answer_queue.start(flask_app)
+        # Таймеры вопросов; пауза и смена вопроса в админке приходят через очередь
+        question_timers.start(on_question_expired)
+        outbox_dispatcher.on_control('pause', lambda payload: question_timers.pause(payload['game_id']))
+        outbox_dispatcher.on_control('resume', lambda payload: question_timers.resume(payload['game_id']))
+        outbox_dispatcher.on_control('cancel_timer', lambda payload: question_timers.cancel(payload['game_id']))
+        # Кэши, сброшенные в админке
+        outbox_dispatcher.on_control('invalidate_identity', lambda payload: identity_cache.invalidate(payload['scope'], payload['ids']))
+        outbox_dispatcher.on_control('invalidate_scoreboard', lambda payload: scoreboards.invalidate(payload['game_id']))
+        outbox_dispatcher.on_control('invalidate_plan', lambda payload: quiz_plans.invalidate(payload['quiz_id']))
+        outbox_dispatcher.on_control('invalidate_deleted', lambda payload: invalidate_deleted(
+            payload['target'], payload['target_id'], payload['game_ids']
+        ))
+        # Уведомления, поставленные в очередь веб-процессом
+        outbox_dispatcher.start(flask_app, bot)
         # Запускаем бота
-        await dp.start_polling(bot, skip_updates=True)
+        if webhook_enabled():
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot, skip_updates=True)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        # Не теряем принятые, но еще не записанные ответы
+        await answer_queue.close()
+        await outbox_dispatcher.close()
+        await question_timers.close()
+        db_executor.shutdown()
+        import_jobs.shutdown()
+        # Последнее состояние игровых комнат сайта
+        room_updates.flush()
 
-def format_scoreboard(game: Game) -> str:
+def format_scoreboard(game: GameSnapshot) -> str:
     """Форматирует таблицу результатов"""
-    scores = []
-    for team in game.teams:
-        total_score = sum(answer.score or 0 for answer in team.answers)
-        scores.append((team.name, total_score))
-    
-    # Сортируем команды по убыванию очков
-    scores.sort(key=lambda x: x[1], reverse=True)
-    
     result = "📊 Текущий счет:\n\n"
-    for i, (team_name, score) in enumerate(scores, 1):
+    for i, (_, team_name, score) in enumerate(scoreboards.ranking(game.id), 1):
         medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "▫️"
         result += f"{medal} {team_name}: {score} очков\n"
     
     return result
 
-def get_quiz_progress(game: Game) -> str:
+def get_quiz_progress(game: GameSnapshot) -> str:
     """Формирует информацию о прогрессе квиза"""
-    if not game.current_question:
+    plan, current = quiz_plans.locate(game.quiz_id, game.current_question_id)
+    if not current:
         return "❌ Нет активного вопроса"
-        
-    current_round = game.current_question.round
-    current_question = game.current_question
-    
-    # Получаем общую информацию о раундах
-    total_rounds = Round.query.filter_by(quiz_id=game.quiz_id).count()
-    questions_in_current_round = Question.query.filter_by(round_id=current_round.id).count()
-    
-    # Получаем следующий вопрос в текущем раунде
-    next_question_same_round = Question.query.filter(
-        Question.round_id == current_round.id,
-        Question.order > current_question.order
-    ).order_by(Question.order).first()
-    
-    # Получаем первый вопрос следующего раунда
-    next_round = Round.query.filter(
-        Round.quiz_id == game.quiz_id,
-        Round.order > current_round.order
-    ).order_by(Round.order).first()
     
-    next_question_next_round = Question.query.filter(
-        Question.round_id == next_round.id
-    ).order_by(Question.order).first() if next_round else None
+    # Следующий вопрос: в текущем раунде или первый в следующем
+    upcoming = plan.next(current.question_id)
     
     progress = (
         f"📍 Текущее положение:\n"
-        f"Раунд {current_round.order} из {total_rounds}: {current_round.title}\n"
-        f"Вопрос {current_question.order} из {questions_in_current_round}\n\n"
+        f"Раунд {current.round_order} из {plan.total_rounds}: {current.round_title}\n"
+        f"Вопрос {current.question_order} из {current.round_size}\n\n"
     )
     
-    if next_question_same_round:
+    if upcoming and upcoming.round_id == current.round_id:
         progress += (
             f"⏭️ Следующий вопрос:\n"
             f"Останемся в текущем раунде\n"
-            f"Вопрос {next_question_same_round.order} из {questions_in_current_round}\n"
-            f"Тип: {'С вариантами ответов' if next_question_same_round.type == 'multiple_choice' else 'Свободный ответ'}\n\n"
+            f"Вопрос {upcoming.question_order} из {current.round_size}\n"
+            f"Тип: {'С вариантами ответов' if upcoming.question_type == 'multiple_choice' else 'Свободный ответ'}\n\n"
         )
-    elif next_round and next_question_next_round:
-        questions_in_next_round = Question.query.filter_by(round_id=next_round.id).count()
+    elif upcoming:
         progress += (
             f"📚 Следующий раунд:\n"
-            f"Переходим к раунду {next_round.order} из {total_rounds}: {next_round.title}\n"
-            f"Начнем с вопроса 1 из {questions_in_next_round}\n"
-            f"Тип: {'С вариантами ответов' if next_question_next_round.type == 'multiple_choice' else 'Свободный ответ'}\n\n"
+            f"Переходим к раунду {upcoming.round_order} из {plan.total_rounds}: {upcoming.round_title}\n"
+            f"Начнем с вопроса 1 из {upcoming.round_size}\n"
+            f"Тип: {'С вариантами ответов' if upcoming.question_type == 'multiple_choice' else 'Свободный ответ'}\n\n"
         )
     else:
         progress += "🏁 Это последний вопрос квиза!\n\n"
     
     return progress
 
-async def update_moderator_panel(game: Game, message: Message = None):
+async def update_moderator_panel(game: GameSnapshot, message: Message = None):
     """Обновляет панель управления модератора"""
-    progress = get_quiz_progress(game)
-    scoreboard = format_scoreboard(game)
-    
+    progress = await run_db(get_quiz_progress, game)
+    scoreboard = await run_db(format_scoreboard, game)
+
     # Формируем текст сообщения
     text = (
-        f"🎮 Управление квизом «{game.quiz.title}»\n\n"
+        f"🎮 Управление квизом «{game.quiz_title}»\n\n"
         f"{progress}\n"
         f"{scoreboard}"
     )
-    
+
     # Создаем клавиатуру
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -1007,30 +1126,42 @@ async def update_moderator_panel(game: Game, message: Message = None):
             ]
         ]
     )
-    
+
     if message:
         await message.edit_text(text, reply_markup=keyboard)
     else:
-        await bot.send_message(game.moderator.telegram_id, text, reply_markup=keyboard)
+        await bot.send_message(game.moderator_telegram_id, text, reply_markup=keyboard)
+
+def _load_question(question_id: int):
+    """Вопрос с номером раунда: id, text, type, options, correct_option, order, time_limit, round_order"""
+    return db.session.query(
+        Question.id, Question.text, Question.type, Question.options,
+        Question.correct_option, Question.order, Question.time_limit,
+        Round.order.label('round_order')
+    ).outerjoin(Round, Round.id == Question.round_id)\
+        .filter(Question.id == question_id)\
+        .first()
 
-async def send_question(game: Game):
+async def send_question(game: GameSnapshot):
     """Отправка текущего вопроса всем участникам"""
-    if not game.current_question:
+    if not game.current_question_id:
         return
-        
-    question = game.current_question
-    round_info = f"Раунд {question.round.order}" if question.round else ""
-    
+
+    question = await run_db(_load_question, game.current_question_id)
+    if not question:
+        return
+    round_info = f"Раунд {question.round_order}" if question.round_order is not None else ""
+
     # Формируем текст вопроса
     question_text = (
         f"❓ {round_info}\n"
         f"Вопрос {question.order}:\n\n"
         f"{question.text}"
     )
-    
+
     # Получаем текущий счет
-    scoreboard = format_scoreboard(game)
-    
+    scoreboard = await run_db(format_scoreboard, game)
+
     # Если есть варианты ответов, создаем клавиатуру
     if question.type == 'multiple_choice' and question.options:
         keyboard = InlineKeyboardMarkup(
@@ -1043,154 +1174,189 @@ async def send_question(game: Game):
                 ] for i, option in enumerate(question.options)
             ]
         )
-        
-        # Отправляем вопрос с вариантами ответов
-        for team in game.teams:
-            for member in team.members:
-                if member.joined_at:
-                    await bot.send_message(
-                        member.user.telegram_id,
-                        f"{question_text}\n\n{scoreboard}",
-                        reply_markup=keyboard
-                    )
+
+        text = f"{question_text}\n\n{scoreboard}"
+        kwargs = {'reply_markup': keyboard}
     else:
-        # Отправляем вопрос без вариантов
-        for team in game.teams:
-            for member in team.members:
-                if member.joined_at:
-                    await bot.send_message(
-                        member.user.telegram_id,
-                        f"{question_text}\n\n"
-                        f"✍️ Напишите ваш ответ в чат.\n\n"
-                        f"{scoreboard}"
-                    )
+        text = (
+            f"{question_text}\n\n"
+            f"✍️ Напишите ваш ответ в чат.\n\n"
+            f"{scoreboard}"
+        )
+        kwargs = {}
+
+    # Рассылаем вопрос всем присоединившимся участникам
+    messages = [
+        OutgoingMessage(member.telegram_id, text, kwargs)
+        for member in await run_db(_game_members, game.id)
+        if member.joined_at
+    ]
+    results = await send_bulk(bot, messages)
+
+    # Время на ответ отсчитывается с момента, когда вопрос разослан
+    question_timers.open(
+        game.id, question.id, question.time_limit,
+        chats=[message.chat_id for message in messages]
+    )
+
+    failed = [r for r in results if not r.ok]
+    if failed:
+        logger.warning(
+            f"Вопрос {question.id} не доставлен {len(failed)} участникам: "
+            + ", ".join(f"{r.chat_id} ({r.error})" for r in failed)
+        )
+    return results
 
 @with_app_context
 async def process_ask_question(callback_query: CallbackQuery):
     """Обработчик кнопки 'Задать вопрос'"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
     if not user or user.role not in ['admin', 'moderator']:
         await callback_query.answer("У вас нет прав для управления квизом", show_alert=True)
         return
-        
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.moderator_id != user.id:
         await callback_query.answer("Квиз не найден или вы не являетесь его модератором", show_alert=True)
         return
-        
+
     if game.status != Game.STATUS_ACTIVE:
         await callback_query.answer("Квиз не активен", show_alert=True)
         return
-        
+
     try:
         # Отправляем текущий вопрос
         await send_question(game)
         await callback_query.answer("Вопрос отправлен участникам")
-        
+
         # Обновляем панель модератора
         await update_moderator_panel(game, callback_query.message)
-        
+
     except Exception as e:
         logger.error(f"Ошибка при отправке вопроса: {e}")
         await callback_query.answer("Произошла ошибка при отправке вопроса", show_alert=True)
 
+async def advance_question(game: GameSnapshot, current_question, next_question,
+                           message: Message = None) -> Optional[GameSnapshot]:
+    """Переводит игру к следующему вопросу или завершает ее после последнего.
+
+    Возвращает обновленный снимок игры или None, если игра завершена.
+    """
+    # Дописываем ответы на текущий вопрос, прежде чем переключиться
+    await answer_queue.flush()
+    question_timers.cancel(game.id)
+
+    if not next_question:
+        # Это был последний вопрос
+        await run_db(
+            _update_game, game.id,
+            status=Game.STATUS_FINISHED, finished_at=datetime.utcnow()
+        )
+
+        final_scoreboard = await run_db(format_scoreboard, game)
+
+        # Отправляем уведомление о завершении игры
+        await notify_members(
+            game.id,
+            f"🎯 Квиз завершен!\n\n"
+            f"Финальный счет:\n{final_scoreboard}\n"
+            f"Спасибо за участие! 🎉",
+            joined_only=True
+        )
+
+        text = (
+            f"🏁 Квиз «{game.quiz_title}» завершен!\n\n"
+            f"Финальный счет:\n{final_scoreboard}"
+        )
+        if message:
+            await message.edit_text(text, reply_markup=None)
+        else:
+            await bot.send_message(game.moderator_telegram_id, text)
+        return None
+
+    # Переходим к следующему вопросу
+    await run_db(_update_game, game.id, current_question_id=next_question.question_id)
+    game = game._replace(current_question_id=next_question.question_id)
+
+    # Уведомляем о переходе к следующему вопросу/раунду
+    if next_question.round_id != current_question.round_id:
+        await notify_members(
+            game.id,
+            f"📚 Начинается новый раунд!\n"
+            f"Раунд {next_question.round_order}: {next_question.round_title}",
+            joined_only=True
+        )
+
+    # Обновляем панель модератора
+    await update_moderator_panel(game, message)
+    return game
+
+@with_app_context
+async def on_question_expired(game_id: int, question_id: int):
+    """Закрывает вопрос, время на который истекло"""
+    game = await run_db(_load_game, game_id)
+    if not game or game.status != Game.STATUS_ACTIVE or game.current_question_id != question_id:
+        return
+
+    members = await run_db(_game_members, game_id)
+    await send_bulk(bot, [
+        OutgoingMessage(member.telegram_id, "⏰ Время на ответ истекло. Ответы больше не принимаются.")
+        for member in members
+        if member.joined_at
+    ])
+
+    if not AUTO_ADVANCE:
+        await bot.send_message(
+            game.moderator_telegram_id,
+            "⏰ Время на ответ истекло. Перейдите к следующему вопросу."
+        )
+        return
+
+    plan, current_question = await run_db(quiz_plans.locate, game.quiz_id, question_id)
+    if not current_question:
+        return
+    game = await advance_question(game, current_question, plan.next(question_id))
+    if game:
+        await send_question(game)
+
 @with_app_context
 async def process_next_question(callback_query: CallbackQuery):
     """Обработчик перехода к следующему вопросу"""
     game_id = int(callback_query.data.split(':')[1])
-    
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
     if not user or user.role not in ['admin', 'moderator']:
         await callback_query.answer("У вас нет прав для управления квизом", show_alert=True)
         return
-        
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.moderator_id != user.id:
         await callback_query.answer("Квиз не найден или вы не являетесь его модератором", show_alert=True)
         return
-        
+
     if game.status != Game.STATUS_ACTIVE:
         await callback_query.answer("Квиз не активен", show_alert=True)
         return
-        
+
     try:
-        current_question = game.current_question
+        plan, current_question = await run_db(quiz_plans.locate, game.quiz_id, game.current_question_id)
         if not current_question:
             await callback_query.answer("Текущий вопрос не найден", show_alert=True)
             return
-            
-        current_round = current_question.round
-        
-        # Ищем следующий вопрос в текущем раунде
-        next_question = Question.query.filter(
-            Question.round_id == current_round.id,
-            Question.order > current_question.order
-        ).order_by(Question.order).first()
-        
-        if not next_question:
-            # Ищем следующий раунд
-            next_round = Round.query.filter(
-                Round.quiz_id == game.quiz_id,
-                Round.order > current_round.order
-            ).order_by(Round.order).first()
-            
-            if next_round:
-                # Берем первый вопрос следующего раунда
-                next_question = Question.query.filter_by(
-                    round_id=next_round.id
-                ).order_by(Question.order).first()
-        
-        if not next_question:
-            # Это был последний вопрос
-            game.status = Game.STATUS_FINISHED
-            game.finished_at = datetime.utcnow()
-            db.session.commit()
-            
-            final_scoreboard = format_scoreboard(game)
-            
-            # Отправляем уведомление о завершении игры
-            for team in game.teams:
-                for member in team.members:
-                    if member.joined_at:
-                        await bot.send_message(
-                            member.user.telegram_id,
-                            f"🎯 Квиз завершен!\n\n"
-                            f"Финальный счет:\n{final_scoreboard}\n"
-                            f"Спасибо за участие! 🎉"
-                        )
-            
-            await callback_query.message.edit_text(
-                f"🏁 Квиз «{game.quiz.title}» завершен!\n\n"
-                f"Финальный счет:\n{final_scoreboard}",
-                reply_markup=None
-            )
+
+        # Следующий вопрос в текущем раунде или первый вопрос следующего
+        next_question = plan.next(current_question.question_id)
+
+        if not await advance_question(game, current_question, next_question, callback_query.message):
             return
-            
-        # Переходим к следующему вопросу
-        game.current_question_id = next_question.id
-        db.session.commit()
-        
-        # Уведомляем о переходе к следующему вопросу/раунду
-        if next_question.round_id != current_round.id:
-            for team in game.teams:
-                for member in team.members:
-                    if member.joined_at:
-                        await bot.send_message(
-                            member.user.telegram_id,
-                            f"📚 Начинается новый раунд!\n"
-                            f"Раунд {next_question.round.order}: {next_question.round.title}"
-                        )
-        
-        # Обновляем панель модератора
-        await update_moderator_panel(game, callback_query.message)
-        
+
         await callback_query.answer(
             "Переход к следующему вопросу выполнен. "
             "Нажмите 'Задать вопрос', чтобы отправить его участникам."
         )
-        
+
     except Exception as e:
         logger.error(f"Ошибка при переходе к следующему вопросу: {e}")
         await callback_query.answer("Произошла ошибка", show_alert=True)
@@ -1200,174 +1366,234 @@ async def process_answer_choice(callback_query: CallbackQuery):
     """Обработка ответа с выбором варианта"""
     _, game_id, question_id, option_idx = callback_query.data.split(':')
     game_id, question_id, option_idx = map(int, [game_id, question_id, option_idx])
-    
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+
+    # Опоздавший ответ отклоняем до обращения к базе
+    if not question_timers.accepts(game_id, question_id):
+        await callback_query.answer("⏰ Время на ответ истекло", show_alert=True)
+        return
+
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
     if not user:
         await callback_query.answer("Пользователь не найден", show_alert=True)
         return
-        
-    team_member = TeamMember.query.filter_by(user_id=user.id)\
-        .join(TeamMember.team)\
-        .join(Team.games)\
-        .filter(Game.id == game_id)\
-        .first()
-        
-    if not team_member or not team_member.joined_at:
+
+    team = await run_db(identity_cache.get_team, user.id, game_id)
+    if not team:
         await callback_query.answer("Вы не являетесь участником этой игры", show_alert=True)
         return
-        
-    game = Game.query.get(game_id)
+
+    game = await run_db(_load_game, game_id)
     if not game or game.status != Game.STATUS_ACTIVE:
         await callback_query.answer("Игра не найдена или не активна", show_alert=True)
         return
-        
-    question = Question.query.get(question_id)
+
+    question = await run_db(_load_question, question_id)
     if not question or question.id != game.current_question_id:
         await callback_query.answer("Этот вопрос уже не активен", show_alert=True)
         return
-        
-    # Создаем ответ
-    answer = Answer(
+
+    # Если это вопрос с автоматической проверкой
+    score = None
+    if question.correct_option is not None:
+        score = 1.0 if option_idx == question.correct_option else 0.0
+
+    # Сохраняем ответ в составе пакета и ждем фиксации
+    await answer_queue.submit(
         game_id=game_id,
-        team_id=team_member.team_id,
+        team_id=team.team_id,
         question_id=question_id,
         user_id=user.id,
-        answer_text=question.options[option_idx]
+        answer_text=question.options[option_idx],
+        score=score
     )
-    db.session.add(answer)
-    
-    # Если это вопрос с автоматической проверкой
-    if question.correct_option is not None:
-        answer.score = 1.0 if option_idx == question.correct_option else 0.0
-        
-    db.session.commit()
-    
+    scoreboards.record_score(game_id, team.team_id, None, score)
+
     # Отправляем уведомление модератору
     await bot.send_message(
-        game.moderator.telegram_id,
-        f"Получен ответ от команды {team_member.team.name}:\n"
+        game.moderator_telegram_id,
+        f"Получен ответ от команды {team.name}:\n"
         f"Игрок: {user.username}\n"
         f"Ответ: {question.options[option_idx]}\n"
-        f"{'✅ Верно' if answer.score == 1.0 else '❌ Неверно' if answer.score == 0.0 else '⏳ Ожидает проверки'}"
+        f"{'✅ Верно' if score == 1.0 else '❌ Неверно' if score == 0.0 else '⏳ Ожидает проверки'}"
     )
-    
+
     await callback_query.answer("Ваш ответ принят!")
 
+def _active_game_for_player(user_id: int) -> Optional[GameSnapshot]:
+    """Активная игра, к которой присоединился пользователь"""
+    row = _game_snapshot_query()\
+        .join(game_teams, game_teams.c.game_id == Game.id)\
+        .join(TeamMember, TeamMember.team_id == game_teams.c.team_id)\
+        .filter(
+            TeamMember.user_id == user_id,
+            TeamMember.joined_at.isnot(None),
+            Game.status == Game.STATUS_ACTIVE
+        ).first()
+    return GameSnapshot(*row) if row else None
+
 @with_app_context
 async def process_answer(message: Message):
     """Обработка текстового ответа на вопрос"""
-    user = User.query.filter_by(telegram_id=message.from_user.id).first()
+    # Опоздавший ответ отклоняем до обращения к базе
+    if question_timers.closed_for_chat(message.from_user.id):
+        await message.answer("⏰ Время на ответ истекло, ответ не принят.")
+        return
+
+    user = await run_db(identity_cache.get_user, message.from_user.id)
     if not user:
         return
-        
-    # Ищем активную игру пользователя
-    team_member = TeamMember.query.filter_by(user_id=user.id)\
-        .join(TeamMember.team)\
-        .join(Team.games)\
-        .filter(Game.status == Game.STATUS_ACTIVE)\
-        .first()
-        
-    if not team_member or not team_member.joined_at:
+
+    # Ищем активную игру, к которой присоединился пользователь
+    game = await run_db(_active_game_for_player, user.id)
+    if not game:
         return
-        
-    game = team_member.team.games[0]  # Берем первую активную игру
-    
-    if not game.current_question:
+
+    team = await run_db(identity_cache.get_team, user.id, game.id)
+    if not team:
+        return
+
+    if not game.current_question_id:
         await message.answer("Сейчас нет активного вопроса.")
         return
-        
-    # Создаем ответ
-    answer = Answer(
+
+    # Сохраняем ответ в составе пакета и ждем фиксации
+    answer_id = await answer_queue.submit(
         game_id=game.id,
-        team_id=team_member.team_id,
+        team_id=team.team_id,
         question_id=game.current_question_id,
         user_id=user.id,
-        answer_text=message.text
+        answer_text=message.text,
+        score=None
     )
-    db.session.add(answer)
-    db.session.commit()
-    
+
     # Отправляем уведомление модератору с кнопками проверки
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
                     text="✅ Принять",
-                    callback_data=f"{APPROVE_ANSWER}:{answer.id}"
+                    callback_data=f"{APPROVE_ANSWER}:{answer_id}"
                 ),
                 InlineKeyboardButton(
                     text="❌ Отклонить",
-                    callback_data=f"{REJECT_ANSWER}:{answer.id}"
+                    callback_data=f"{REJECT_ANSWER}:{answer_id}"
                 )
             ]
         ]
     )
-    
+
     await bot.send_message(
-        game.moderator.telegram_id,
-        f"Ответ от команды {team_member.team.name}:\n"
+        game.moderator_telegram_id,
+        f"Ответ от команды {team.name}:\n"
         f"Игрок: {user.username}\n"
         f"Ответ: {message.text}",
         reply_markup=keyboard
     )
-    
+
     await message.answer("Ваш ответ принят и отправлен на проверку модератору.")
 
+def _load_answer(answer_id: int):
+    """Ответ с номером вопроса: id, game_id, team_id, score, question_order"""
+    return db.session.query(
+        Answer.id, Answer.game_id, Answer.team_id, Answer.score,
+        Question.order.label('question_order')
+    ).join(Question, Question.id == Answer.question_id)\
+        .filter(Answer.id == answer_id)\
+        .first()
+
+def _set_answer_score(answer_id: int, score: float):
+    db.session.execute(update(Answer).where(Answer.id == answer_id).values(score=score))
+    db.session.commit()
+
 @with_app_context
 async def process_answer_review(callback_query: CallbackQuery):
     """Обработчик проверки ответа модератором"""
     action, answer_id = callback_query.data.split(':')
     answer_id = int(answer_id)
-    
-    user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
     if not user or user.role not in ['admin', 'moderator']:
         await callback_query.answer("У вас нет прав для проверки ответов", show_alert=True)
         return
-        
-    answer = Answer.query.get(answer_id)
+
+    answer = await run_db(_load_answer, answer_id)
     if not answer:
         await callback_query.answer("Ответ не найден", show_alert=True)
         return
-        
-    game = Game.query.get(answer.game_id)
+
+    game = await run_db(_load_game, answer.game_id)
     if not game or game.moderator_id != user.id:
         await callback_query.answer("У вас нет прав для проверки этого ответа", show_alert=True)
         return
-        
+
     # Устанавливаем оценку
-    answer.score = 1.0 if action == APPROVE_ANSWER else 0.0
-    db.session.commit()
-    
+    score = 1.0 if action == APPROVE_ANSWER else 0.0
+    await run_db(_set_answer_score, answer_id, score)
+    scoreboards.record_score(game.id, answer.team_id, answer.score, score)
+
     # Получаем текущий счет
-    scoreboard = format_scoreboard(game)
-    
+    scoreboard = await run_db(format_scoreboard, game)
+
     # Обновляем сообщение с ответом
     await callback_query.message.edit_text(
         callback_query.message.text + f"\n\n{'✅ Принят' if action == APPROVE_ANSWER else '❌ Отклонен'}",
         reply_markup=None
     )
-    
+
     # Отправляем уведомление команде
-    team = Team.query.get(answer.team_id)
-    for member in team.members:
-        if member.joined_at:
-            await bot.send_message(
-                member.user.telegram_id,
-                f"Результат проверки ответа на вопрос {answer.question.order}:\n"
-                f"{'✅ Ответ принят!' if action == APPROVE_ANSWER else '❌ Ответ отклонен'}\n\n"
-                f"{scoreboard}"
-            )
-    
+    result_text = (
+        f"Результат проверки ответа на вопрос {answer.question_order}:\n"
+        f"{'✅ Ответ принят!' if action == APPROVE_ANSWER else '❌ Ответ отклонен'}\n\n"
+        f"{scoreboard}"
+    )
+    await send_bulk(bot, [
+        OutgoingMessage(member.telegram_id, result_text)
+        for member in await run_db(_game_members, game.id)
+        if member.team_id == answer.team_id and member.joined_at
+    ])
+
     # Обновляем счет на сайте
     from website.socket import broadcast_scoreboard
-    broadcast_scoreboard(game.id)
+    await run_db(broadcast_scoreboard, game.id)
+
+    await callback_query.answer("Ответ проверен")
+
+@with_app_context
+async def cmd_cache_stats(message: Message):
+    """Обработчик команды /cache_stats: статистика кэша пользователей"""
+    user = await run_db(identity_cache.get_user, message.from_user.id)
+    if not user or user.role != 'admin':
+        return
     
-    await callback_query.answer("Ответ проверен") 
+    lines = []
+    for name, stats in identity_cache.stats().items():
+        lines.append(
+            f"{name}: {stats['size']} записей, "
+            f"попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"({stats['hit_ratio']:.0%})"
+        )
+    pool = db_executor.stats()
+    lines.append(
+        f"Пул запросов: {pool['workers']} потоков, вызовов {pool['calls']}, "
+        f"одновременно до {pool['max_in_flight']}, медленных {pool['slow_calls']}"
+    )
+    imports = import_cache.stats()
+    lines.append(
+        f"Импорт квизов: {imports['size']} файлов, "
+        f"повторных загрузок {imports['hits']} из {imports['hits'] + imports['misses']} "
+        f"({imports['hit_ratio']:.0%})"
+    )
+    for room, rates in room_updates.stats().items():
+        lines.append(
+            f"Сайт, {room}: обновлений {rates['submitted']}, отправлено {rates['sent']} "
+            f"({rates['sent_per_minute']:.0f}/мин)"
+        )
+    await message.answer("📈 Кэш пользователей:\n" + "\n".join(lines))
 
 @with_app_context
 async def cmd_upload_quiz(message: Message):
     """Обработчик команды /upload_quiz"""
-    user = User.query.filter_by(telegram_id=message.from_user.id).first()
+    user = await run_db(identity_cache.get_user, message.from_user.id)
     if not user or user.role not in ['admin', 'moderator']:
         await message.answer("У вас нет прав для загрузки квизов.")
         return
@@ -1386,13 +1612,110 @@ async def cmd_upload_quiz(message: Message):
         "Время: время в секундах"
     )
 
+def _clone_quiz(quiz_id: int, user_id: int, title: Optional[str]):
+    try:
+        quiz = clone_quiz(quiz_id, user_id, title)
+    except Exception:
+        db.session.rollback()
+        raise
+    return (quiz.id, quiz.title) if quiz else None
+
+@with_app_context
+async def cmd_clone_quiz(message: Message, command: CommandObject):
+    """Обработчик команды /clone_quiz <id квиза> [название копии]"""
+    user = await run_db(identity_cache.get_user, message.from_user.id)
+    if not user or user.role not in ['admin', 'moderator']:
+        await message.answer("У вас нет прав для копирования квизов.")
+        return
+
+    args = (command.args or '').split(maxsplit=1)
+    if not args or not args[0].isdigit():
+        await message.answer("Укажите ID квиза: /clone_quiz <id> [название копии]")
+        return
+
+    clone = await run_db(_clone_quiz, int(args[0]), user.id, args[1] if len(args) > 1 else None)
+    if not clone:
+        await message.answer("Квиз с указанным ID не найден")
+        return
+
+    clone_id, clone_title = clone
+    await message.answer(f"✅ Создана копия квиза: «{clone_title}» (ID {clone_id})")
+
+# Задачи, сообщающие модератору о ходе импорта (держим ссылки до завершения)
+_import_reports = set()
+
+async def _edit_import_status(status: Message, text: str, reply_markup: InlineKeyboardMarkup = None):
+    try:
+        await status.edit_text(text, reply_markup=reply_markup)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить статус импорта: {e}")
+
+async def _watch_import(status: Message, submit):
+    """Ставит импорт в очередь через submit(on_progress) и запускает отчет о нем.
+
+    submit записывает задачу в базу, поэтому выполняется в пуле run_db.
+    Этапы передаются из фонового потока в event loop через очередь, чтобы
+    сообщение обновлялось по порядку.
+    """
+    loop = asyncio.get_running_loop()
+    stages = asyncio.Queue()
+    job = await run_db(submit, lambda job: loop.call_soon_threadsafe(stages.put_nowait, job.stage))
+    task = asyncio.create_task(report_import(job, stages, status))
+    _import_reports.add(task)
+    task.add_done_callback(_import_reports.discard)
+
+async def report_import(job, stages: asyncio.Queue, status: Message):
+    """Обновляет сообщение о ходе импорта квиза до его завершения"""
+    while True:
+        stage = await stages.get()
+        if stage in (STAGE_DONE, STAGE_FAILED, STAGE_DUPLICATE):
+            break
+        await _edit_import_status(status, f"⏳ Импорт «{job.file_name}»: {STAGE_TITLES[stage].lower()}...")
+
+    if job.error:
+        await _edit_import_status(
+            status,
+            f"❌ Ошибка при загрузке квиза: {job.error}\n"
+            "Убедитесь, что файл соответствует формату и кодировке UTF-8"
+        )
+        return
+
+    result = job.result
+    if stage == STAGE_DUPLICATE:
+        await _edit_import_status(
+            status,
+            f"ℹ️ Этот файл уже загружен как квиз «{result['title']}» "
+            f"({result['questions_count']} вопросов).\n"
+            "Можно создать копию квиза без повторного разбора файла.",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="📄 Создать копию", callback_data=f"{IMPORT_COPY}:{job.id}")
+            ]])
+        )
+        return
+
+    # Формируем статистику по типам вопросов в каждом раунде
+    round_stats = [
+        f"Раунд {i+1}: {round_info['questions']} вопр. "
+        f"({round_info['multiple_choice']} тестовых, {round_info['open_answer']} открытых)"
+        for i, round_info in enumerate(result['rounds'])
+    ]
+    await _edit_import_status(
+        status,
+        f"✅ Квиз успешно загружен!\n\n"
+        f"📝 Название: {result['title']}\n"
+        f"📚 Количество раундов: {result['rounds_count']}\n"
+        f"❓ Общее количество вопросов: {result['questions_count']}\n\n"
+        f"Статистика по раундам:\n" +
+        "\n".join(round_stats)
+    )
+
 @with_app_context
 async def process_quiz_file(message: Message):
     """Обработчик загрузки файла квиза"""
     if not message.document:
         return
 
-    user = User.query.filter_by(telegram_id=message.from_user.id).first()
+    user = await run_db(identity_cache.get_user, message.from_user.id)
     if not user or user.role not in ['admin', 'moderator']:
         return
 
@@ -1401,54 +1724,46 @@ async def process_quiz_file(message: Message):
         await message.answer("Поддерживаются только файлы .txt и .docx")
         return
 
+    if message.document.file_size and message.document.file_size > MAX_QUIZ_FILE_SIZE:
+        await message.answer(FILE_TOO_LARGE_MESSAGE)
+        return
+
     try:
-        # Скачиваем файл во временный байтовый буфер
+        # Скачиваем файл в память (BytesIO)
         file = await bot.get_file(message.document.file_id)
-        file_bytes = await bot.download_file(file.file_path)
-        
-        # Читаем содержимое
-        if file_name.endswith('.txt'):
-            content = file_bytes.decode('utf-8')
-        else:  # .docx
-            # Сохраняем bytes во временный файл только для docx
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=True) as tmp_file:
-                tmp_file.write(file_bytes)
-                tmp_file.flush()  # Убеждаемся, что все данные записаны
-                doc = Document(tmp_file.name)
-                content = '\n'.join(paragraph.text for paragraph in doc.paragraphs)
-        
-        if not content:
-            raise ValueError("Не удалось прочитать содержимое файла")
-            
-        # Парсим содержимое
-        quiz = parse_quiz_content(content, user.id)
-        
-        # Отправляем подтверждение
-        rounds_count = len(quiz.rounds)
-        questions_count = sum(len(round.questions) for round in quiz.rounds)
-        
-        # Формируем статистику по типам вопросов в каждом раунде
-        round_stats = []
-        for i, round_obj in enumerate(quiz.rounds):
-            multiple_choice = sum(1 for q in round_obj.questions if q.type == 'multiple_choice')
-            open_answer = sum(1 for q in round_obj.questions if q.type == 'open_answer')
-            round_stats.append(
-                f"Раунд {i+1}: {len(round_obj.questions)} вопр. "
-                f"({multiple_choice} тестовых, {open_answer} открытых)"
-            )
-        
-        await message.answer(
-            f"✅ Квиз успешно загружен!\n\n"
-            f"📝 Название: {quiz.title}\n"
-            f"📚 Количество раундов: {rounds_count}\n"
-            f"❓ Общее количество вопросов: {questions_count}\n\n"
-            f"Статистика по раундам:\n" + 
-            "\n".join(round_stats)
+        buffer = await bot.download_file(file.file_path)
+        file_type = 'txt' if file_name.endswith('.txt') else 'docx'
+
+        status = await message.answer(
+            f"⏳ Импорт «{message.document.file_name}»: {STAGE_TITLES[STAGE_QUEUED].lower()}..."
         )
-            
+
+        # Разбор и сохранение выполняются в фоновом пуле, не задерживая другие обновления
+        await _watch_import(status, lambda on_progress: import_jobs.submit(
+            flask_app, buffer.getvalue(), file_type, message.document.file_name, user.id, on_progress
+        ))
+
     except Exception as e:
         logger.error(f"Ошибка при загрузке квиза: {str(e)}")
         await message.answer(
             f"❌ Ошибка при загрузке квиза: {str(e)}\n"
             "Убедитесь, что файл соответствует формату и кодировке UTF-8"
-        ) 
\ No newline at end of file
+        ) 
+
+@with_app_context
+async def process_import_copy(callback_query: types.CallbackQuery):
+    """Создание копии уже загруженного квиза из разобранного файла"""
+    user = await run_db(identity_cache.get_user, callback_query.from_user.id)
+    if not user or user.role not in ['admin', 'moderator']:
+        await callback_query.answer("Доступ запрещен", show_alert=True)
+        return
+
+    job = await run_db(import_jobs.get, callback_query.data.split(":")[1])
+    if not job or job.user_id != user.id or job.stage != STAGE_DUPLICATE:
+        await callback_query.answer("Файл больше не доступен, отправьте его заново", show_alert=True)
+        return
+
+    await callback_query.answer()
+    status = callback_query.message
+    await _edit_import_status(status, f"⏳ Копия «{job.file_name}»: {STAGE_TITLES[STAGE_QUEUED].lower()}...")
+    await _watch_import(status, lambda on_progress: import_jobs.submit_copy(flask_app, job, user.id, on_progress))
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from website.models import db
+
+logger = logging.getLogger(__name__)
+
+# Не больше, чем соединений в пуле create_app (pool_size + max_overflow),
+# иначе потоки будут ждать соединение, а не выполнять запросы
+DB_WORKERS = int(os.getenv('BOT_DB_WORKERS', 10))
+SLOW_CALL = 0.5   # секунд, после которых вызов попадает в лог
+
+
+class DatabaseExecutor:
+    """Выполняет синхронную работу с базой в ограниченном пуле потоков.
+
+    Функция запускается в копии контекста вызывающей задачи: ей доступен
+    контекст приложения текущего обновления и, следовательно, его сессия.
+    Сессия используется потоками строго по очереди — задача ждет результат,
+    прежде чем обратиться к ней снова.
+
+    После каждого вызова незавершенная транзакция сессии откатывается, и
+    соединение возвращается в пул. Иначе обновление держало бы соединение,
+    пока ждет ответа Telegram, и при числе одновременных обновлений больше
+    размера пула потоки простаивали бы в ожидании соединения. Поэтому
+    изменения должны фиксироваться в той же функции, которая их делает.
+    """
+
+    def __init__(self, max_workers=DB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.slow_calls = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='bot-db'
+                    )
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Выполняет fn(*args, **kwargs) в пуле и возвращает результат"""
+        context = contextvars.copy_context()
+        call = partial(context.run, _call_and_release, fn, args, kwargs)
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+        finally:
+            self.in_flight -= 1
+            elapsed = time.monotonic() - started
+            if elapsed > SLOW_CALL:
+                self.slow_calls += 1
+                logger.warning(f"Медленный запрос к базе: {getattr(fn, '__name__', fn)} {elapsed:.2f} с")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.max_workers,
+            'calls': self.calls,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'slow_calls': self.slow_calls
+        }
+
+
+def _call_and_release(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Транзакции, не зафиксированные вызовом, завершаем, чтобы вернуть соединение в пул
+        if db.session.registry.has():
+            db.session.rollback()
+
+
+db_executor = DatabaseExecutor()
+
+
+async def run_db(fn: Callable, *args, **kwargs) -> Any:
+    """Выполняет синхронную функцию работы с базой вне event loop"""
+    return await db_executor.run(fn, *args, **kwargs)
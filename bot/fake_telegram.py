@@ -0,0 +1,281 @@
+"""Локальная заглушка Telegram Bot API для проверки и замеров без сети.
+
+Запуск вместе с ботом в режиме webhook:
+
+    python -m bot.fake_telegram --port 8081 --updates 1000
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+    WEBHOOK_URL=http://127.0.0.1:8080 python bot_runner.py
+
+После того как бот зарегистрирует webhook, заглушка отправит ему
+указанное количество обновлений и выведет время их доставки.
+
+StubSession отвечает на методы Bot API прямо в процессе бота, без HTTP, —
+для замеров самих обработчиков (см. benchmarks.load_test).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Quiz Bot', 'username': 'quiz_test_bot'}
+
+
+def make_message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Обновление с текстовым сообщением от пользователя"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Player {user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text
+        }
+    }
+
+
+def make_document_update(update_id: int, user_id: int, file_id: str, file_name: str, file_size: int) -> dict:
+    """Обновление с файлом, отправленным пользователем"""
+    update = make_message_update(update_id, user_id, '')
+    message = update['message']
+    del message['text']
+    message['document'] = {
+        'file_id': file_id,
+        'file_unique_id': file_id,
+        'file_name': file_name,
+        'file_size': file_size
+    }
+    return update
+
+
+def make_callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """Обновление с нажатием inline-кнопки"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Player {user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': '...'
+            }
+        }
+    }
+
+
+def make_result(method: str, params: dict, message_id: int):
+    """Ответ на метод Bot API (имя метода в нижнем регистре)"""
+    if method == 'getme':
+        return BOT_USER
+    if method == 'getupdates':
+        return []
+    if method == 'getfile':
+        return {
+            'file_id': params.get('file_id'),
+            'file_unique_id': params.get('file_id'),
+            'file_path': f"documents/{params.get('file_id')}"
+        }
+    if method.startswith('send') or method == 'editmessagetext':
+        chat_id = params.get('chat_id')
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id) if chat_id else 0, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text') or ''
+        }
+    return True
+
+
+class StubSession(BaseSession):
+    """Сессия бота, отвечающая на методы Bot API без обращения к сети.
+
+    files — содержимое файлов по file_id для getFile и скачивания.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.counts = Counter()
+        self.files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        name = method.__api_method__
+        self.counts[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = {
+            'chat_id': getattr(method, 'chat_id', None),
+            'text': getattr(method, 'text', None),
+            'file_id': getattr(method, 'file_id', None)
+        }
+        result = make_result(name.lower(), params, next(self._message_ids))
+        response = self.check_response(
+            bot=bot, method=method, status_code=200,
+            content=json.dumps({'ok': True, 'result': result})
+        )
+        return response.result
+
+    async def stream_content(self, url: str, headers: Optional[dict] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        content = self.files.get(url.rsplit('/', 1)[-1], b'')
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+    async def close(self):
+        pass
+
+
+class FakeTelegramServer:
+    """Отвечает на методы Bot API и запоминает вызовы.
+
+    latency — искусственная задержка ответа на каждый метод, чтобы
+    приблизить замеры к работе с настоящим API.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[tuple] = []
+        self.counts = Counter()
+        self.webhook_url: Optional[str] = None
+        self.secret_token: Optional[str] = None
+        self.webhook_set = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self._base_url = None
+
+        self.app = web.Application()
+        self.app.router.add_route('*', '/bot{token}/{method}', self._handle)
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._base_url = f"http://{host}:{port}"
+        logger.info(f"Заглушка Telegram Bot API запущена на {self._base_url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append((method, params))
+        self.counts[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self._result(method.lower(), params)})
+
+    def _result(self, method: str, params: dict):
+        if method == 'setwebhook':
+            self.webhook_url = params.get('url')
+            self.secret_token = params.get('secret_token')
+            self.webhook_set.set()
+            return True
+        if method == 'deletewebhook':
+            self.webhook_url = None
+            self.webhook_set.clear()
+            return True
+        return make_result(method, params, next(self._message_ids))
+
+    async def deliver(self, updates: Iterable[dict], concurrency: int = 40) -> dict:
+        """Отправляет обновления на зарегистрированный webhook.
+
+        Как и Telegram, держит не более concurrency запросов одновременно.
+        Возвращает количество доставленных обновлений и затраченное время.
+        """
+        if not self.webhook_url:
+            raise RuntimeError("Webhook не зарегистрирован")
+        headers = {'Content-Type': 'application/json'}
+        if self.secret_token:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.secret_token
+
+        queue = list(updates)
+        delivered = 0
+        failed = 0
+
+        async with aiohttp.ClientSession(headers=headers) as session:
+            async def worker(items):
+                nonlocal delivered, failed
+                for update in items:
+                    async with session.post(self.webhook_url, data=json.dumps(update)) as response:
+                        if response.status == 200:
+                            delivered += 1
+                        else:
+                            failed += 1
+
+            started = time.monotonic()
+            await asyncio.gather(*(worker(queue[i::concurrency]) for i in range(concurrency)))
+            elapsed = time.monotonic() - started
+
+        return {'delivered': delivered, 'failed': failed, 'elapsed': elapsed}
+
+
+async def _main(args):
+    server = FakeTelegramServer(latency=args.latency)
+    await server.start(args.host, args.port)
+    try:
+        if args.updates:
+            await server.webhook_set.wait()
+            updates = [
+                make_message_update(i, args.first_user_id + i % args.users, args.text)
+                for i in range(1, args.updates + 1)
+            ]
+            stats = await server.deliver(updates, concurrency=args.concurrency)
+            logger.info(
+                f"Доставлено {stats['delivered']} обновлений за {stats['elapsed']:.2f} с "
+                f"({stats['delivered'] / stats['elapsed']:.0f}/с), ошибок: {stats['failed']}"
+            )
+            # Даем обработчикам завершиться и показываем, какие методы они вызывали
+            await asyncio.sleep(args.settle)
+            logger.info(f"Вызовы Bot API: {dict(server.counts)}")
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Заглушка Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа на метод, с')
+    parser.add_argument('--updates', type=int, default=0, help='сколько обновлений отправить на webhook')
+    parser.add_argument('--users', type=int, default=100, help='количество разных отправителей')
+    parser.add_argument('--first-user-id', type=int, default=100000)
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--concurrency', type=int, default=40)
+    parser.add_argument('--settle', type=float, default=2.0, help='ожидание обработки после доставки, с')
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
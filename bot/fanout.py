@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API
+GLOBAL_RATE = 30          # сообщений в секунду на бота
+PER_CHAT_INTERVAL = 1.0   # секунд между сообщениями в один чат
+MAX_CONCURRENCY = 25      # одновременных запросов к API
+MAX_ATTEMPTS = 4          # попыток доставки одного сообщения
+
+
+@dataclass
+class OutgoingMessage:
+    """Сообщение для рассылки"""
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class DeliveryResult:
+    """Результат доставки сообщения одному получателю"""
+    chat_id: int
+    ok: bool
+    attempts: int
+    error: Optional[str] = None
+
+
+class FanoutSender:
+    """Параллельная рассылка с соблюдением лимитов Telegram.
+
+    Расписание отправки общее для всех вызовов (и всех потоков процесса),
+    поэтому несколько одновременных рассылок делят один глобальный лимит.
+    """
+
+    def __init__(self, rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 concurrency=MAX_CONCURRENCY, max_attempts=MAX_ATTEMPTS):
+        self.interval = 1.0 / rate
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._next_global = 0.0
+        self._next_per_chat: Dict[int, float] = {}
+
+    def _reserve_chat(self, chat_id: int) -> float:
+        """Резервирует слот для чата и возвращает задержку до него"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_per_chat.get(chat_id, 0.0))
+            self._next_per_chat[chat_id] = slot + self.per_chat_interval
+            if len(self._next_per_chat) > 10000:
+                # Убираем чаты, для которых ограничение уже не действует
+                self._next_per_chat = {
+                    cid: t for cid, t in self._next_per_chat.items() if t > now
+                }
+            return slot - now
+
+    def _reserve_global(self) -> float:
+        """Резервирует глобальный слот и возвращает задержку до него"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_global)
+            self._next_global = slot + self.interval
+            return slot - now
+
+    def _backoff(self, chat_id: int, seconds: float):
+        """Сдвигает расписание после flood control"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_global = max(self._next_global, until)
+            self._next_per_chat[chat_id] = max(self._next_per_chat.get(chat_id, 0.0), until)
+
+    async def _deliver(self, bot: Bot, message: OutgoingMessage, semaphore: asyncio.Semaphore) -> DeliveryResult:
+        attempts = 0
+        while True:
+            attempts += 1
+            delay = self._reserve_chat(message.chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                delay = self._reserve_global()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    await bot.send_message(message.chat_id, message.text, **message.kwargs)
+                    return DeliveryResult(message.chat_id, True, attempts)
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Flood control для чата {message.chat_id}: ждем {e.retry_after} с")
+                    self._backoff(message.chat_id, e.retry_after)
+                    error = str(e)
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    self._backoff(message.chat_id, min(2 ** attempts, 30))
+                    error = str(e)
+                except Exception as e:
+                    # Ошибки вроде "бот заблокирован" повторять бессмысленно
+                    return DeliveryResult(message.chat_id, False, attempts, str(e))
+            if attempts >= self.max_attempts:
+                logger.error(f"Не удалось доставить сообщение в чат {message.chat_id}: {error}")
+                return DeliveryResult(message.chat_id, False, attempts, error)
+
+    async def send(self, bot: Bot, messages: Iterable[OutgoingMessage]) -> List[DeliveryResult]:
+        """Отправляет сообщения параллельно и возвращает результаты в исходном порядке"""
+        messages = list(messages)
+        if not messages:
+            return []
+        if bot is None:
+            return [DeliveryResult(m.chat_id, False, 0, "Бот не инициализирован") for m in messages]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        results = await asyncio.gather(*(self._deliver(bot, m, semaphore) for m in messages))
+
+        failed = sum(1 for r in results if not r.ok)
+        logger.info(
+            f"Рассылка: {len(results) - failed} из {len(results)} доставлено "
+            f"за {time.monotonic() - started:.2f} с"
+        )
+        return results
+
+
+# Общий планировщик процесса
+fanout = FanoutSender()
+
+
+async def send_bulk(bot: Bot, messages: Iterable[OutgoingMessage]) -> List[DeliveryResult]:
+    """Рассылка через общий планировщик процесса"""
+    return await fanout.send(bot, messages)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import delete, or_, update
+
+from website.models import db, OutboxMessage
+from bot.fanout import OutgoingMessage, send_bulk
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5     # секунд между проверками пустой очереди
+BATCH_SIZE = 100        # сообщений за один проход
+MAX_ATTEMPTS = 5        # проходов до отказа от сообщения
+RETRY_DELAY = 30        # секунд до второго прохода, дальше задержка удваивается
+MAX_RETRY_DELAY = 600
+RETENTION = timedelta(days=1)
+PURGE_INTERVAL = 3600   # секунд между очистками отправленных записей
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Пауза перед следующим проходом после attempts неудачных"""
+    return timedelta(seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+class OutboxDispatcher:
+    """Отправляет сообщения, поставленные в очередь веб-процессом.
+
+    Работа с базой выполняется в отдельном потоке, отправка — через общий
+    планировщик рассылок бота. Записи вида 'control' не отправляются, а
+    передаются обработчику, зарегистрированному для их действия.
+
+    Неудачная запись повторяется не сразу, а через RETRY_DELAY секунд с
+    удвоением на каждом проходе: сбой Telegram не расходует все попытки
+    за несколько опросов.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._app = None
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = None
+        self._closing = False
+        self._last_purge = 0.0
+        self._control_handlers: Dict[str, Callable[[dict], None]] = {}
+
+    def on_control(self, action: str, handler: Callable[[dict], None]):
+        """Регистрирует обработчик служебной команды веб-процесса"""
+        self._control_handlers[action] = handler
+
+    def start(self, app, bot):
+        if self._task is not None and not self._task.done():
+            return
+        self._app = app
+        self._bot = bot
+        self._closing = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox')
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Обработчик очереди уведомлений запущен")
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._closing = True
+        await self._task
+        self._executor.shutdown(wait=True)
+        self._task = None
+        logger.info("Обработчик очереди уведомлений остановлен")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            try:
+                sent = await self.drain_once()
+                if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await loop.run_in_executor(self._executor, self._purge)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке очереди уведомлений: {e}")
+                sent = 0
+            if not sent:
+                await asyncio.sleep(self.poll_interval)
+
+    async def drain_once(self) -> int:
+        """Отправляет один пакет сообщений, возвращает его размер"""
+        loop = asyncio.get_running_loop()
+        batch = await loop.run_in_executor(self._executor, self._claim)
+        if not batch:
+            return 0
+
+        messages = [row for row in batch if row[1] == 'message']
+        results = await send_bulk(self._bot, [
+            OutgoingMessage(chat_id, text, payload or {})
+            for _, _, chat_id, text, payload, _ in messages
+        ])
+        outcomes = [(row, result.ok, result.error) for row, result in zip(messages, results)]
+        outcomes.extend(
+            (row, *self._apply_control(row[4] or {}))
+            for row in batch if row[1] == 'control'
+        )
+
+        now = datetime.utcnow()
+        changes = [
+            {
+                'id': row[0],
+                'attempts': row[5] + 1,
+                'sent_at': now if ok else None,
+                'next_attempt_at': None if ok else now + retry_delay(row[5] + 1),
+                'last_error': error
+            }
+            for row, ok, error in outcomes
+        ]
+        await loop.run_in_executor(self._executor, self._mark, changes)
+        return len(batch)
+
+    def _apply_control(self, payload: dict):
+        handler = self._control_handlers.get(payload.get('action'))
+        if handler is None:
+            return False, f"Неизвестная команда: {payload.get('action')}"
+        try:
+            handler(payload)
+            return True, None
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении команды {payload.get('action')}: {e}")
+            return False, str(e)
+
+    def _claim(self):
+        with self._app.app_context():
+            rows = db.session.query(
+                OutboxMessage.id, OutboxMessage.kind, OutboxMessage.chat_id, OutboxMessage.text,
+                OutboxMessage.payload, OutboxMessage.attempts
+            ).filter(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.attempts < self.max_attempts,
+                or_(OutboxMessage.next_attempt_at.is_(None), OutboxMessage.next_attempt_at <= datetime.utcnow())
+            ).order_by(OutboxMessage.id).limit(self.batch_size).all()
+            return [tuple(row) for row in rows]
+
+    def _mark(self, changes):
+        with self._app.app_context():
+            db.session.execute(update(OutboxMessage), changes)
+            db.session.commit()
+
+    def _purge(self):
+        """Удаляет давно отправленные и окончательно неотправленные записи"""
+        with self._app.app_context():
+            threshold = datetime.utcnow() - RETENTION
+            db.session.execute(
+                delete(OutboxMessage).where(OutboxMessage.created_at < threshold).where(
+                    (OutboxMessage.sent_at.isnot(None)) | (OutboxMessage.attempts >= self.max_attempts)
+                )
+            )
+            db.session.commit()
+
+
+outbox_dispatcher = OutboxDispatcher()
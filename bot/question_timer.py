@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer:
+    __slots__ = ('game_id', 'question_id', 'deadline', 'remaining', 'closed', 'version', 'chats')
+
+    def __init__(self, game_id: int, question_id: int, deadline: float, version: int, chats: Set[int]):
+        self.game_id = game_id
+        self.question_id = question_id
+        self.deadline = deadline
+        self.remaining: Optional[float] = None   # остаток времени на паузе
+        self.closed = False
+        self.version = version
+        self.chats = chats
+
+
+class QuestionTimers:
+    """Таймеры вопросов на event loop бота.
+
+    Для каждой игры хранится не больше одного таймера — для заданного
+    вопроса. Сроки лежат в куче; устаревшие записи кучи (после паузы или
+    смены вопроса) пропускаются по номеру версии. Проверка ответа на
+    опоздание не обращается к базе.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, int]] = []
+        self._timers: Dict[int, _Timer] = {}
+        self._chats: Dict[int, int] = {}   # telegram_id игрока -> game_id
+        self._versions = itertools.count(1)
+        self._on_expire: Optional[Callable[[int, int], Awaitable]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._callbacks: Set[asyncio.Task] = set()
+
+    def start(self, on_expire: Callable[[int, int], Awaitable]):
+        """Запускает планировщик; on_expire(game_id, question_id) вызывается по истечении времени"""
+        if self._task is not None and not self._task.done():
+            return
+        self._on_expire = on_expire
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def open(self, game_id: int, question_id: int, time_limit: Optional[float], chats: Iterable[int] = ()):
+        """Запускает отсчет времени на вопрос, заменяя прежний таймер игры"""
+        self.cancel(game_id)
+        if not time_limit or time_limit <= 0:
+            return
+        deadline = self._now() + time_limit
+        timer = _Timer(game_id, question_id, deadline, next(self._versions), set(chats))
+        self._timers[game_id] = timer
+        for chat_id in timer.chats:
+            self._chats[chat_id] = game_id
+        self._push(timer)
+
+    def cancel(self, game_id: int):
+        """Снимает таймер игры (смена вопроса, завершение игры)"""
+        timer = self._timers.pop(game_id, None)
+        if timer is None:
+            return
+        for chat_id in timer.chats:
+            if self._chats.get(chat_id) == game_id:
+                del self._chats[chat_id]
+
+    def pause(self, game_id: int):
+        """Останавливает отсчет, запоминая остаток времени"""
+        timer = self._timers.get(game_id)
+        if timer is None or timer.closed or timer.remaining is not None:
+            return
+        timer.remaining = max(timer.deadline - self._now(), 0.0)
+        timer.version = next(self._versions)
+
+    def resume(self, game_id: int):
+        """Продолжает отсчет с сохраненного остатка"""
+        timer = self._timers.get(game_id)
+        if timer is None or timer.closed or timer.remaining is None:
+            return
+        timer.deadline = self._now() + timer.remaining
+        timer.remaining = None
+        timer.version = next(self._versions)
+        self._push(timer)
+
+    def accepts(self, game_id: int, question_id: int) -> bool:
+        """Можно ли принять ответ на вопрос.
+
+        Если таймер игры неизвестен (например, после перезапуска бота),
+        решение остается за проверками в базе.
+        """
+        timer = self._timers.get(game_id)
+        if timer is None:
+            return True
+        return timer.question_id == question_id and not timer.closed
+
+    def closed_for_chat(self, chat_id: int) -> bool:
+        """Закрыт ли вопрос в игре, где участвует игрок"""
+        game_id = self._chats.get(chat_id)
+        if game_id is None:
+            return False
+        timer = self._timers.get(game_id)
+        return timer is not None and timer.closed
+
+    def remaining(self, game_id: int) -> Optional[float]:
+        """Оставшееся время на текущий вопрос в секундах"""
+        timer = self._timers.get(game_id)
+        if timer is None or timer.closed:
+            return None
+        if timer.remaining is not None:
+            return timer.remaining
+        return max(timer.deadline - self._now(), 0.0)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, timer: _Timer):
+        heapq.heappush(self._heap, (timer.deadline, timer.version, timer.game_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = self._now()
+            while self._heap and self._heap[0][0] <= now:
+                _, version, game_id = heapq.heappop(self._heap)
+                timer = self._timers.get(game_id)
+                if timer is None or timer.version != version or timer.closed:
+                    continue
+                timer.closed = True
+                logger.info(f"Время на вопрос {timer.question_id} игры {game_id} истекло")
+                if self._on_expire is not None:
+                    task = asyncio.get_running_loop().create_task(self._on_expire(game_id, timer.question_id))
+                    self._callbacks.add(task)
+                    task.add_done_callback(self._callbacks.discard)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+question_timers = QuestionTimers()
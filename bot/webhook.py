@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import os
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/telegram/webhook'
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8080
+WEBHOOK_MAX_CONNECTIONS = 40   # одновременных запросов от Telegram (значение по умолчанию в Bot API)
+
+
+def webhook_enabled() -> bool:
+    """Включен ли прием обновлений через webhook (BOT_MODE=webhook)"""
+    return os.getenv('BOT_MODE', 'polling').lower() == 'webhook'
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, secret_token: str, path: str = WEBHOOK_PATH) -> web.Application:
+    """Создает aiohttp-приложение, передающее обновления в диспетчер.
+
+    Каждое обновление обрабатывается отдельной задачей: Telegram сразу
+    получает ответ 200, а обработчики выполняются параллельно.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret_token
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запускает сервер webhook и регистрирует его адрес в Telegram"""
+    base_url = os.getenv('WEBHOOK_URL')
+    if not base_url:
+        raise ValueError("WEBHOOK_URL не найден в переменных окружения")
+
+    path = os.getenv('WEBHOOK_PATH', WEBHOOK_PATH)
+    host = os.getenv('WEBHOOK_HOST', WEBHOOK_HOST)
+    port = int(os.getenv('WEBHOOK_PORT', WEBHOOK_PORT))
+    max_connections = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', WEBHOOK_MAX_CONNECTIONS))
+    # Без явно заданного секрета генерируем случайный на время работы процесса
+    secret_token = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+    runner = web.AppRunner(create_webhook_app(bot, dp, secret_token, path), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    try:
+        await bot.set_webhook(
+            base_url.rstrip('/') + path,
+            secret_token=secret_token,
+            max_connections=max_connections,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=True
+        )
+        logger.info(f"Webhook запущен на {host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        try:
+            await bot.delete_webhook()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении webhook: {e}")
+        await runner.cleanup()
@@ -1,4 +1,4 @@
- import os
+import os
 import asyncio
 import logging
 from website import create_app
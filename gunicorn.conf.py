@@ -0,0 +1,20 @@
+import logging
+import os
+
+# Рабочий запуск веб-процесса: gunicorn wsgi:app (файл читается автоматически).
+# Socket.IO работает в режиме threading, WebSocket обслуживает simple-websocket:
+# подключенный клиент занимает поток воркера, поэтому threads — предел
+# одновременных подключений одного воркера.
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 100))
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+accesslog = '-'
+
+# Запросы long-polling одного клиента gunicorn раздает разным воркерам,
+# поэтому несколько воркеров — только с общей очередью рассылок и WebSocket
+if workers > 1 and not (os.getenv('SOCKETIO_MESSAGE_QUEUE') and os.getenv('SOCKETIO_WEBSOCKET_ONLY') == '1'):
+    logging.getLogger(__name__).warning(
+        "WEB_CONCURRENCY > 1 требует SOCKETIO_MESSAGE_QUEUE и SOCKETIO_WEBSOCKET_ONLY=1, запускается один воркер"
+    )
+    workers = 1
@@ -5,8 +5,10 @@ from flask_login import LoginManager, current_user
 from website.models import db, User
 from website.views.auth import auth
 from website.views.admin import admin
+from website.views.spectator import spectator
 from bot.bot import create_bot, start_bot
-from website.socket import socketio
+from website.socket import socketio, init_socketio
+from website import create_db
 import asyncio
 import threading
 import eventlet
@@ -36,7 +38,7 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Инициализация расширений
 db.init_app(app)
-socketio.init_app(app, async_mode='threading')
+init_socketio(app)
 
 # Настройка Flask-Login
 login_manager = LoginManager()
@@ -50,15 +52,15 @@ def load_user(user_id):
 # Регистрация Blueprint'ов
 app.register_blueprint(auth)
 app.register_blueprint(admin)
+app.register_blueprint(spectator)
 
 # Обработчик корневого URL
 @app.route('/')
 def index():
     return render_template('index.html')
 
-# Создание таблиц базы данных
-with app.app_context():
-    db.create_all()
+# Создание таблиц базы данных или применение новых миграций (если не отключено MIGRATE_ON_STARTUP)
+create_db(app)
 
 # Глобальные переменные для управления ботом
 bot = None
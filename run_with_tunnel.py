@@ -2,7 +2,7 @@ import os
 from pyngrok import ngrok
 from dotenv import load_dotenv
 from website import create_app
-from website.socket import socketio
+from website.socket import socketio, init_socketio
 from bot.bot import create_bot, start_bot
 import asyncio
 import threading
@@ -20,6 +20,7 @@ if missing_vars:
 
 # Создание Flask приложения
 app = create_app()
+init_socketio(app)
 
 def run_bot_forever():
     """Запуск бота в отдельном потоке"""
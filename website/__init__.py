@@ -1,5 +1,6 @@
+import io
 import os
-from flask import Flask, redirect, url_for
+from flask import Flask, Request, redirect, url_for
 from flask_login import LoginManager
 from .models import db, User
 from sqlalchemy import create_engine, text
@@ -29,45 +30,40 @@ def wait_for_db(engine, max_attempts=5, wait_seconds=5):
                 raise
 
 def create_db(app):
-    """Создание базы данных и таблиц, если они не существуют"""
+    """Создание базы данных и таблиц или применение новых миграций схемы"""
+    from .migrations import LATEST_VERSION, MIGRATE_ON_STARTUP, current_version, migrate
+
     with app.app_context():
         try:
-            # Проверяем, существует ли таблица пользователей
-            inspector = db.inspect(db.engine)
-            tables_exist = inspector.get_table_names()
-            
-            if not tables_exist:
-                # Создаем все таблицы
-                db.create_all()
-                
-                # Создаем первого админа
-                admin_telegram_id = int(os.getenv('ADMIN_USER_ID'))
-                admin = User.query.filter_by(telegram_id=admin_telegram_id).first()
-                
-                if not admin:
-                    admin = User(
-                        id=1,  # Внутренний ID = 1 для первого админа
-                        telegram_id=admin_telegram_id,
-                        username="admin",
-                        role="admin"
-                    )
-                    db.session.add(admin)
-                    try:
-                        db.session.commit()
-                        logger.info("База данных успешно создана")
-                    except Exception as e:
-                        db.session.rollback()
-                        logger.error(f"Ошибка при создании админа: {e}")
-                        raise
+            if not MIGRATE_ON_STARTUP:
+                version = current_version(db.engine)
+                if version != LATEST_VERSION:
+                    logger.warning(f"Схема базы версии {version}, ожидается {LATEST_VERSION}: примените миграции")
+                return
+            if migrate(db.engine):
+                logger.info("База данных успешно создана")
         except Exception as e:
             logger.error(f"Ошибка при создании базы данных: {e}")
             raise
 
+class InMemoryUploadRequest(Request):
+    """Запрос, хранящий загружаемые файлы в памяти, а не во временных файлах.
+
+    Размер тела запроса ограничен MAX_CONTENT_LENGTH.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 def create_app():
     app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
     
     # Конфигурация приложения
     app.config['SECRET_KEY'] = os.urandom(24)
+    # Запросы больше этого размера (прежде всего загрузки квизов) отклоняются с кодом 413
+    from .views.quiz_parser import MAX_QUIZ_FILE_SIZE
+    app.config['MAX_CONTENT_LENGTH'] = MAX_QUIZ_FILE_SIZE + 64 * 1024  # запас на заголовки multipart
     
     # Настройка подключения к PostgreSQL с пулом соединений
     database_url = os.getenv('DATABASE_URL')
@@ -136,4 +132,7 @@ def create_app():
     from .views.admin import admin as admin_blueprint
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
 
+    from .views.spectator import spectator as spectator_blueprint
+    app.register_blueprint(spectator_blueprint, url_prefix='/spectate')
+
     return app 
\ No newline at end of file
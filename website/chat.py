@@ -0,0 +1,242 @@
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import insert, select
+
+from .identity_cache import TTLCache
+from .models import db, ChatMessage, Game, TeamMember, game_teams
+
+logger = logging.getLogger(__name__)
+
+# Последние сообщения каждой игры, которые получает вошедший в комнату
+CHAT_HISTORY_SIZE = int(os.getenv('CHAT_HISTORY_SIZE', 100))
+CHAT_MESSAGE_MAX_LENGTH = 1000
+# Буфер старше этого перечитывается из базы при входе в комнату: так в
+# истории появляются сообщения, отправленные через другие веб-процессы
+CHAT_HISTORY_REFRESH = float(os.getenv('CHAT_HISTORY_REFRESH', 5.0))
+# Токен-бакет на пользователя: до CHAT_BURST сообщений подряд, затем CHAT_RATE в секунду
+CHAT_RATE = float(os.getenv('CHAT_RATE', 1.0))
+CHAT_BURST = int(os.getenv('CHAT_BURST', 5))
+CHAT_FLUSH_INTERVAL = 2.0      # секунд между записями в базу
+CHAT_PERMISSION_TTL = 300      # секунд кэширования права писать в чат игры
+CHAT_MAX_PENDING = 10000       # незаписанных сообщений, сверх — старые отбрасываются
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity: int):
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, capacity: int, rate: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def _message(message_type: str, sender: str, text: str, created_at: datetime) -> dict:
+    return {'type': message_type, 'sender': sender, 'message': text, 'timestamp': created_at.isoformat()}
+
+
+def _key(message: dict):
+    return message['timestamp'], message['sender'], message['message']
+
+
+class GameChat:
+    """Чат игровых комнат в памяти процесса.
+
+    Для каждой игры хранится кольцевой буфер последних сообщений: история
+    при входе в комнату отдается из него. Новые сообщения записываются в
+    базу фоновым потоком пачками.
+
+    Буфер свой у каждого веб-процесса, поэтому при входе в комнату он
+    перечитывается из базы, если загружен раньше чем CHAT_HISTORY_REFRESH
+    назад; еще не записанные сообщения этого процесса добавляются к
+    прочитанным. Сообщения других процессов видны с задержкой их записи
+    (CHAT_FLUSH_INTERVAL).
+    """
+
+    def __init__(self, history_size: int = CHAT_HISTORY_SIZE, rate: float = CHAT_RATE, burst: int = CHAT_BURST):
+        self.history_size = history_size
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._rooms: Dict[int, Deque[dict]] = {}
+        self._loaded_at: Dict[int, float] = {}    # время чтения буфера игры из базы
+        self._pending: List[dict] = []
+        self._flushing: List[dict] = []           # пачка, которая сейчас записывается
+        # Простаивающий бакет и так полон, поэтому бакеты хранятся с TTL
+        self._buckets = TTLCache(10000, max(burst / rate, 1) * 10)
+        self.permissions = TTLCache(10000, CHAT_PERMISSION_TTL)
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, app):
+        """Запускает фоновую запись сообщений в базу"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def can_post(self, user_id: int, role: str, game_id: int) -> bool:
+        """Может ли пользователь писать в чат игры (с кэшированием)"""
+        if not self._game_exists(game_id):
+            return False
+        if role in ('admin', 'moderator'):
+            return True
+        key = (user_id, game_id)
+        if self.permissions.get(key):
+            return True
+        allowed = db.session.scalar(
+            select(TeamMember.id)
+            .join(game_teams, game_teams.c.team_id == TeamMember.team_id)
+            .where(game_teams.c.game_id == game_id, TeamMember.user_id == user_id)
+            .limit(1)
+        ) is not None
+        if allowed:
+            # Отказ не кэшируем: игрок может вступить в команду в любой момент
+            self.permissions.set(key, True)
+        return allowed
+
+    def allow(self, user_id: int) -> bool:
+        """Токен-бакет пользователя: False, если сообщения идут слишком часто"""
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.burst)
+                self._buckets.set(user_id, bucket)
+            return bucket.take(self.burst, self.rate)
+
+    def add(self, game_id: int, message_type: str, sender: str, text: str, user_id: Optional[int] = None) -> dict:
+        """Добавляет сообщение в буфер игры и в очередь на запись; возвращает его для отправки клиентам"""
+        created_at = datetime.utcnow()
+        message = _message(message_type, sender[:80], text[:CHAT_MESSAGE_MAX_LENGTH], created_at)
+        room = self._room(game_id)
+        with self._lock:
+            # Буфер мог быть перечитан другим потоком после _room
+            self._rooms.get(game_id, room).append(message)
+            self._pending.append({
+                'game_id': game_id,
+                'user_id': user_id,
+                'type': message_type,
+                'sender': message['sender'],
+                'message': message['message'],
+                'created_at': created_at
+            })
+            if len(self._pending) > CHAT_MAX_PENDING:
+                del self._pending[:len(self._pending) - CHAT_MAX_PENDING]
+        return message
+
+    def history(self, game_id: int) -> List[dict]:
+        """Последние сообщения игры, от старых к новым (при входе в комнату)"""
+        room = self._room(game_id, max_age=CHAT_HISTORY_REFRESH)
+        with self._lock:
+            return list(room)
+
+    def forget(self, game_id: int):
+        """Забывает удаленную игру"""
+        with self._lock:
+            self._rooms.pop(game_id, None)
+            self._loaded_at.pop(game_id, None)
+            self._pending = [row for row in self._pending if row['game_id'] != game_id]
+        self.permissions.pop_where(lambda key, _: key == game_id or (isinstance(key, tuple) and key[1] == game_id))
+
+    def flush(self):
+        """Записывает накопленные сообщения одним пакетом"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if not rows or self._app is None:
+                self._pending[:0] = rows
+                return
+            self._flushing = rows
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(ChatMessage.__table__), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Ошибка записи {len(rows)} сообщений чата: {e}")
+                with self._lock:
+                    self._pending[:0] = rows[-CHAT_MAX_PENDING:]
+            finally:
+                with self._lock:
+                    self._flushing = []
+                db.session.remove()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rooms': len(self._rooms),
+                'messages': sum(len(room) for room in self._rooms.values()),
+                'pending': len(self._pending)
+            }
+
+    def _game_exists(self, game_id: int) -> bool:
+        exists = self.permissions.get(game_id)
+        if exists is None:
+            exists = db.session.get(Game, game_id) is not None
+            self.permissions.set(game_id, exists)
+        return exists
+
+    def _room(self, game_id: int, max_age: Optional[float] = None) -> Deque[dict]:
+        """Буфер игры; max_age — перечитать из базы, если он загружен раньше"""
+        started = time.monotonic()
+        with self._lock:
+            room = self._rooms.get(game_id)
+            if room is not None and (max_age is None or started - self._loaded_at[game_id] < max_age):
+                return room
+
+        rows = db.session.execute(
+            select(ChatMessage.type, ChatMessage.sender, ChatMessage.message, ChatMessage.created_at)
+            .where(ChatMessage.game_id == game_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(self.history_size)
+        ).all()
+        messages = [_message(row.type, row.sender, row.message, row.created_at) for row in reversed(rows)]
+        with self._lock:
+            if self._loaded_at.get(game_id, 0.0) > started:
+                # Другой поток перечитал историю позже
+                return self._rooms[game_id]
+            # Незаписанные сообщения этого процесса; записанные после чтения уже прочитаны
+            seen = {_key(message) for message in messages}
+            unwritten = [
+                _message(row['type'], row['sender'], row['message'], row['created_at'])
+                for row in self._flushing + self._pending if row['game_id'] == game_id
+            ]
+            messages.extend(message for message in unwritten if _key(message) not in seen)
+            messages.sort(key=lambda message: message['timestamp'])
+            room = self._rooms[game_id] = collections.deque(messages, maxlen=self.history_size)
+            self._loaded_at[game_id] = time.monotonic()
+            return room
+
+    def _run(self):
+        while not self._stop.wait(CHAT_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой записи чата: {e}")
+
+
+chat = GameChat()
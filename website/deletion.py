@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+from typing import List
+
+from sqlalchemy import delete, func, or_, select
+
+from .chat import chat
+from .identity_cache import identity_cache
+from .jobs import Job, JobRunner, STAGE_DELETING, STAGE_DONE, STAGE_FAILED
+from .outbox import enqueue_control
+from .models import db, Quiz, Game, Round, Question, Answer, Team, TeamMember, ChatMessage, game_teams
+from .quiz_plan import quiz_plans
+from .scoreboard import scoreboards
+from .spectator import spectators
+
+logger = logging.getLogger(__name__)
+
+# Удаление с большим числом ответов выполняется фоновой задачей: ответы
+# удаляются пачками в отдельных транзакциях, чтобы не держать блокировки
+DELETE_JOB_THRESHOLD = int(os.getenv('DELETE_JOB_THRESHOLD', 10000))
+DELETE_BATCH_SIZE = 5000
+
+_answer = Answer.__table__
+
+
+def _quiz_games(quiz_id: int):
+    return select(Game.id).where(Game.quiz_id == quiz_id)
+
+
+def _quiz_questions(quiz_id: int):
+    return select(Question.id).where(Question.round_id.in_(select(Round.id).where(Round.quiz_id == quiz_id)))
+
+
+def answers_condition(target: str, target_id: int):
+    """Условие на ответы, удаляемые вместе с квизом или игрой"""
+    if target == 'quiz':
+        return or_(
+            _answer.c.game_id.in_(_quiz_games(target_id)),
+            _answer.c.question_id.in_(_quiz_questions(target_id))
+        )
+    return _answer.c.game_id == target_id
+
+
+def count_answers(target: str, target_id: int) -> int:
+    return db.session.scalar(select(func.count()).select_from(_answer).where(answers_condition(target, target_id)))
+
+
+def delete_games(games) -> List[int]:
+    """Удаляет игры (select id) с ответами, чатом и связями с командами; возвращает id удаленных игр.
+
+    Команды не удаляются, как и раньше при удалении игры.
+    """
+    db.session.execute(delete(_answer).where(_answer.c.game_id.in_(games)))
+    db.session.execute(delete(game_teams).where(game_teams.c.game_id.in_(games)))
+    db.session.execute(delete(ChatMessage.__table__).where(ChatMessage.__table__.c.game_id.in_(games)))
+    game_table = Game.__table__
+    return list(db.session.scalars(delete(game_table).where(game_table.c.id.in_(games)).returning(game_table.c.id)))
+
+
+def delete_quiz_tree(quiz_id: int) -> List[int]:
+    """Удаляет квиз с играми, ответами, раундами и вопросами; возвращает id удаленных игр"""
+    game_ids = delete_games(_quiz_games(quiz_id))
+    db.session.execute(delete(_answer).where(_answer.c.question_id.in_(_quiz_questions(quiz_id))))
+    db.session.execute(delete(Question.__table__).where(Question.__table__.c.id.in_(_quiz_questions(quiz_id))))
+    db.session.execute(delete(Round.__table__).where(Round.__table__.c.quiz_id == quiz_id))
+    db.session.execute(delete(Quiz.__table__).where(Quiz.__table__.c.id == quiz_id))
+    return game_ids
+
+
+def delete_team(team_id: int):
+    """Удаляет команду с участниками, ответами и участием в играх"""
+    db.session.execute(delete(_answer).where(_answer.c.team_id == team_id))
+    db.session.execute(delete(game_teams).where(game_teams.c.team_id == team_id))
+    db.session.execute(delete(TeamMember.__table__).where(TeamMember.__table__.c.team_id == team_id))
+    db.session.execute(delete(Team.__table__).where(Team.__table__.c.id == team_id))
+
+
+def delete_target(target: str, target_id: int) -> List[int]:
+    """Удаляет квиз или игру без фиксации транзакции; возвращает id удаленных игр.
+
+    Вместе с удалением фиксируется команда боту сбросить кэши (invalidate_deleted).
+    """
+    if target == 'quiz':
+        game_ids = delete_quiz_tree(target_id)
+    else:
+        game_ids = delete_games(select(Game.id).where(Game.id == target_id))
+    enqueue_control('invalidate_deleted', target=target, target_id=target_id, game_ids=game_ids)
+    return game_ids
+
+
+def invalidate_deleted(target: str, target_id: int, game_ids: List[int]):
+    """Сбрасывает кэши процесса после фиксации удаления (в боте — по команде из очереди)"""
+    for game_id in game_ids:
+        scoreboards.invalidate(game_id)
+        chat.forget(game_id)
+        spectators.forget(game_id)
+    identity_cache.invalidate_games(game_ids)
+    if target == 'quiz':
+        quiz_plans.invalidate(target_id)
+
+
+class DeleteJob(Job):
+    """Фоновое удаление квиза или игры"""
+    kind = 'delete'
+
+    def __init__(self, user_id: int, target: str, target_id: int):
+        super().__init__(user_id)
+        self.target = target
+        self.target_id = target_id
+
+    def params(self) -> dict:
+        return {'target': self.target, 'target_id': self.target_id}
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data['target'] = self.target
+        data['target_id'] = self.target_id
+        return data
+
+
+class DeleteJobRunner(JobRunner):
+    """Удаляет большие деревья данных по частям; задачи выполняются по одной"""
+    thread_name_prefix = 'delete'
+    job_class = DeleteJob
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+
+    def submit(self, app, target: str, target_id: int, user_id: int) -> DeleteJob:
+        return self._start(DeleteJob(user_id, target, target_id), self._run, app)
+
+    def _run(self, job: DeleteJob, app) -> DeleteJob:
+        started = time.monotonic()
+        with app.app_context():
+            try:
+                self._set_stage(job, STAGE_DELETING)
+                condition = answers_condition(job.target, job.target_id)
+                total = count_answers(job.target, job.target_id)
+                job.progress = 0.0
+
+                # Ответы — пачками, каждая в своей транзакции
+                deleted = 0
+                while True:
+                    batch = select(_answer.c.id).where(condition).limit(DELETE_BATCH_SIZE).scalar_subquery()
+                    count = db.session.execute(delete(_answer).where(_answer.c.id.in_(batch))).rowcount
+                    db.session.commit()
+                    deleted += count
+                    job.progress = min(deleted / total, 1.0) if total else 1.0
+                    self._save(job)
+                    if count < DELETE_BATCH_SIZE:
+                        break
+
+                # Остальное дерево — одной транзакцией (ответы, появившиеся за это время, тоже)
+                game_ids = delete_target(job.target, job.target_id)
+                db.session.commit()
+                invalidate_deleted(job.target, job.target_id, game_ids)
+
+                job.result = {'answers': deleted, 'games': len(game_ids)}
+                logger.info(
+                    f"Удаление {job.target} {job.target_id}: {deleted} ответов, "
+                    f"{len(game_ids)} игр за {time.monotonic() - started:.2f} с"
+                )
+                stage = STAGE_DONE
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Ошибка удаления {job.target} {job.target_id}: {e}")
+                job.error = str(e)
+                stage = STAGE_FAILED
+            finally:
+                db.session.remove()
+
+        self._finish(job, stage)
+        return job
+
+
+delete_jobs = DeleteJobRunner()
@@ -0,0 +1,164 @@
+import collections
+import os
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+# Обновления состояния комнаты за это время объединяются в одну отправку
+COALESCE_WINDOW = float(os.getenv('SOCKETIO_COALESCE_WINDOW', 0.25))
+# Клиент с большим числом неотправленных пакетов считается медленным:
+# промежуточные состояния ему не отправляются
+SLOW_CLIENT_BACKLOG = int(os.getenv('SOCKETIO_SLOW_CLIENT_BACKLOG', 16))
+RATE_WINDOW = 60          # секунд для расчета частоты отправок
+ROOM_MAX_IDLE = 3600      # секунд хранения состояния неактивной комнаты
+
+
+class _RoomStats:
+    __slots__ = ('submitted', 'sent', 'skipped_slow', 'recent', 'last_active')
+
+    def __init__(self):
+        self.submitted = 0        # обновлений передано в submit
+        self.sent = 0             # отправок в комнату
+        self.skipped_slow = 0     # кадров, не отправленных медленным клиентам
+        self.recent: Deque[float] = collections.deque()   # время отправок за RATE_WINDOW
+        self.last_active = time.monotonic()
+
+
+class EmitCoalescer:
+    """Объединяет частые обновления состояния игровых комнат.
+
+    submit запоминает последнее состояние (комната, событие) и не ждет
+    отправки. Через window секунд фоновый поток отправляет только его, а
+    для событий с зарегистрированной функцией diff — лишь изменения
+    относительно прошлой отправки. Состояние, не отличающееся от
+    отправленного, не отправляется вовсе.
+
+    Медленные клиенты (participants сообщает размер их очереди) пропускают
+    промежуточные кадры и, когда очередь разберется, получают последнее
+    полное состояние.
+    """
+
+    def __init__(self, emit: Callable, participants: Callable[[str], Iterable[Tuple[str, int]]],
+                 window: float = COALESCE_WINDOW, slow_backlog: int = SLOW_CLIENT_BACKLOG):
+        self._emit = emit                    # emit(event, data, room, skip_sids)
+        self._participants = participants    # participants(room) -> [(sid, очередь)]
+        self.window = window
+        self.slow_backlog = slow_backlog
+        self._diffs: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending: Dict[Tuple[str, str], Tuple[float, dict]] = {}   # -> (срок отправки, состояние)
+        self._sent: Dict[Tuple[str, str], dict] = {}                   # последнее отправленное полное состояние
+        self._lagging: Dict[Tuple[str, str], Set[str]] = {}            # медленные клиенты без последнего состояния
+        self._rooms: Dict[str, _RoomStats] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = time.monotonic()
+
+    def register_diff(self, event: str, diff: Callable[[dict, dict], Optional[dict]]):
+        """diff(отправленное, новое) -> изменения или None, если отправлять нечего"""
+        self._diffs[event] = diff
+
+    def submit(self, event: str, data: dict, room: str):
+        """Ставит состояние комнаты на отправку, заменяя еще не отправленное"""
+        key = (room, event)
+        with self._lock:
+            stats = self._rooms.get(room)
+            if stats is None:
+                stats = self._rooms[room] = _RoomStats()
+            stats.submitted += 1
+            stats.last_active = time.monotonic()
+            pending = self._pending.get(key)
+            deadline = pending[0] if pending else time.monotonic() + self.window
+            self._pending[key] = (deadline, data)
+            self._ensure_thread()
+            self._wakeup.notify()
+
+    def flush(self):
+        """Отправляет все ожидающие состояния сразу"""
+        with self._lock:
+            due = list(self._pending.items())
+            self._pending.clear()
+        for key, (_, data) in due:
+            self._send(key, data)
+
+    def stats(self) -> Dict[str, dict]:
+        """Счетчики и частота отправок по комнатам"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for room, stats in self._rooms.items():
+                while stats.recent and now - stats.recent[0] > RATE_WINDOW:
+                    stats.recent.popleft()
+                result[room] = {
+                    'submitted': stats.submitted,
+                    'sent': stats.sent,
+                    'coalesced': stats.submitted - stats.sent,
+                    'skipped_slow': stats.skipped_slow,
+                    'sent_per_minute': len(stats.recent) * 60 / RATE_WINDOW
+                }
+            return result
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='emit-coalescer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                now = time.monotonic()
+                deadline = min(deadline for deadline, _ in self._pending.values())
+                if deadline > now:
+                    self._wakeup.wait(deadline - now)
+                    continue
+                due = [(key, data) for key, (deadline, data) in self._pending.items() if deadline <= now]
+                for key, _ in due:
+                    del self._pending[key]
+                self._purge(now)
+            for key, data in due:
+                self._send(key, data)
+
+    def _send(self, key: Tuple[str, str], data: dict):
+        room, event = key
+        slow = {sid for sid, backlog in self._participants(room) if backlog > self.slow_backlog}
+
+        with self._lock:
+            previous = self._sent.get(key)
+            self._sent[key] = data
+            lagging = self._lagging.setdefault(key, set())
+            # Догнавшие клиенты получают полное состояние отдельно
+            caught_up = lagging - slow
+            lagging -= caught_up
+            lagging |= slow
+            if not lagging:
+                del self._lagging[key]
+            stats = self._rooms[room]
+            stats.skipped_slow += len(slow)
+
+        diff = self._diffs.get(event)
+        if previous is None:
+            payload = data
+        elif diff is not None:
+            payload = diff(previous, data)
+        else:
+            payload = data if data != previous else None
+
+        if payload is not None:
+            self._emit(event, payload, room, slow | caught_up)
+            with self._lock:
+                stats.sent += 1
+                stats.recent.append(time.monotonic())
+        for sid in caught_up:
+            self._emit(event, data, sid, ())
+
+    def _purge(self, now: float):
+        if now - self._last_purge < RATE_WINDOW:
+            return
+        self._last_purge = now
+        for room in [room for room, stats in self._rooms.items() if now - stats.last_active > ROOM_MAX_IDLE]:
+            del self._rooms[room]
+            for key in [key for key in self._sent if key[0] == room]:
+                self._sent.pop(key, None)
+                self._lagging.pop(key, None)
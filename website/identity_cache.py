@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+from .models import db, User, Team, TeamMember, game_teams
+from .outbox import enqueue_control
+
+# Веб и бот работают в разных процессах: изменения из админки сбрасывают
+# кэш бота служебной командой через очередь (share_invalidation), записи
+# прочих процессов живут не дольше TTL.
+IDENTITY_CACHE_TTL = 60
+IDENTITY_CACHE_SIZE = 10000
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей и счетчиками попаданий"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]):
+        """Удаляет записи, для которых predicate(key, value) истинно"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+
+class UserIdentity(NamedTuple):
+    id: int
+    telegram_id: int
+    role: str
+    username: str
+
+
+class TeamRef(NamedTuple):
+    team_id: int
+    name: str
+
+
+class IdentityCache:
+    """Кэш telegram_id -> пользователь и (пользователь, игра) -> команда"""
+
+    def __init__(self, maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL):
+        self.users = TTLCache(maxsize, ttl)
+        self.teams = TTLCache(maxsize, ttl)
+
+    def get_user(self, telegram_id: int) -> Optional[UserIdentity]:
+        identity = self.users.get(telegram_id)
+        if identity is None:
+            row = db.session.query(User.id, User.telegram_id, User.role, User.username)\
+                .filter(User.telegram_id == telegram_id)\
+                .first()
+            if row is None:
+                return None
+            identity = UserIdentity(*row)
+            self.users.set(telegram_id, identity)
+        return identity
+
+    def get_team(self, user_id: int, game_id: int) -> Optional[TeamRef]:
+        """Команда, в составе которой пользователь присоединился к игре"""
+        key = (user_id, game_id)
+        team = self.teams.get(key)
+        if team is None:
+            row = db.session.query(Team.id, Team.name)\
+                .join(TeamMember, TeamMember.team_id == Team.id)\
+                .join(game_teams, game_teams.c.team_id == Team.id)\
+                .filter(
+                    game_teams.c.game_id == game_id,
+                    TeamMember.user_id == user_id,
+                    TeamMember.joined_at.isnot(None)
+                ).first()
+            if row is None:
+                # Отрицательный результат не кэшируем: игрок может присоединиться в любой момент
+                return None
+            team = TeamRef(*row)
+            self.teams.set(key, team)
+        return team
+
+    def invalidate_user(self, user_id: Optional[int] = None, telegram_id: Optional[int] = None):
+        if telegram_id is not None:
+            self.users.pop(telegram_id)
+        if user_id is not None:
+            self.users.pop_where(lambda key, identity: identity.id == user_id)
+
+    def invalidate_membership(self, user_id: int, game_id: Optional[int] = None):
+        if game_id is not None:
+            self.teams.pop((user_id, game_id))
+        else:
+            self.teams.pop_where(lambda key, team: key[0] == user_id)
+
+    def invalidate_team(self, team_id: int):
+        self.teams.pop_where(lambda key, team: team.team_id == team_id)
+
+    def invalidate_games(self, game_ids):
+        game_ids = set(game_ids)
+        self.teams.pop_where(lambda key, team: key[1] in game_ids)
+
+    def invalidate(self, scope: str, ids: dict):
+        """Сброс по команде другого процесса (см. share_invalidation)"""
+        handlers = {
+            'user': self.invalidate_user,
+            'membership': self.invalidate_membership,
+            'team': self.invalidate_team
+        }
+        handlers[scope](**ids)
+
+    def stats(self) -> dict:
+        return {'users': self.users.stats(), 'teams': self.teams.stats()}
+
+
+identity_cache = IdentityCache()
+
+
+def share_invalidation(scope: str, **ids):
+    """Ставит боту команду сбросить ту же запись кэша.
+
+    Вызывается до commit: команда фиксируется вместе с изменением.
+    """
+    enqueue_control('invalidate_identity', scope=scope, ids=ids)
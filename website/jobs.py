@@ -0,0 +1,395 @@
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import delete, insert, or_, update
+
+from .identity_cache import TTLCache
+from .models import db, BackgroundJob, Quiz
+from .quiz_clone import clone_quiz
+from .views.quiz_parser import QuizParser, content_hash, quiz_lines, read_quiz_lines
+
+logger = logging.getLogger(__name__)
+
+# Задачи выполняются в фоновых потоках процесса (веб или бот), который их
+# принял; статус каждой смены этапа записывается в background_job, поэтому
+# его может отдать любой веб-процесс.
+IMPORT_WORKERS = int(os.getenv('QUIZ_IMPORT_WORKERS', 2))
+# Чтение файла (прежде всего разбор XML .docx) можно вынести в отдельные
+# процессы (0 — читать в потоке задачи)
+IMPORT_PARSE_PROCESSES = int(os.getenv('QUIZ_IMPORT_PROCESSES', 0))
+JOB_MAX_AGE = 3600   # секунд хранения завершенных задач
+# Задача, не завершившаяся за это время (процесс перезапущен), удаляется из базы
+JOB_STALE_AGE = timedelta(days=1)
+# Кэш разобранных файлов по хэшу содержимого: повторная загрузка того же
+# файла не разбирается заново. Большой квиз в разобранном виде занимает
+# десятки мегабайт, поэтому записей немного.
+IMPORT_CACHE_SIZE = int(os.getenv('QUIZ_IMPORT_CACHE_SIZE', 16))
+IMPORT_CACHE_TTL = 24 * 3600
+
+STAGE_QUEUED = 'queued'
+STAGE_PARSING = 'parsing'
+STAGE_SAVING = 'saving'
+STAGE_DELETING = 'deleting'
+STAGE_DONE = 'done'
+STAGE_FAILED = 'failed'
+STAGE_DUPLICATE = 'duplicate'   # такой квиз уже загружен, новый не создан
+
+STAGE_TITLES = {
+    STAGE_QUEUED: 'В очереди',
+    STAGE_PARSING: 'Разбор файла',
+    STAGE_SAVING: 'Сохранение в базу',
+    STAGE_DELETING: 'Удаление',
+    STAGE_DONE: 'Готово',
+    STAGE_FAILED: 'Ошибка',
+    STAGE_DUPLICATE: 'Уже загружен',
+}
+
+
+class CachedImport(NamedTuple):
+    """Разобранный файл квиза"""
+    parser: QuizParser
+    quiz_id: Optional[int]   # последний квиз, созданный из этого файла
+
+
+import_cache = TTLCache(IMPORT_CACHE_SIZE, IMPORT_CACHE_TTL)
+
+
+class Job:
+    """Фоновая задача, запущенная из админки или бота"""
+    kind = None
+
+    def __init__(self, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.stage = STAGE_QUEUED
+        self.progress: Optional[float] = None   # доля выполненной работы, если известна
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.future: Optional[Future] = None
+        self._finished = None   # time.monotonic() завершения, для очистки
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in (STAGE_DONE, STAGE_FAILED, STAGE_DUPLICATE)
+
+    def params(self) -> dict:
+        """Поля задачи конкретного вида, сохраняемые в BackgroundJob.params"""
+        return {}
+
+    def record(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'stage': self.stage,
+            'progress': self.progress,
+            'params': self.params(),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+    @classmethod
+    def restore(cls, record) -> 'Job':
+        """Задача другого процесса по записи BackgroundJob (только для чтения статуса)"""
+        job = cls.__new__(cls)
+        job.id = record.id
+        job.user_id = record.user_id
+        job.stage = record.stage
+        job.progress = record.progress
+        job.result = record.result
+        job.error = record.error
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        job.future = None
+        job._finished = None
+        for name, value in (record.params or {}).items():
+            setattr(job, name, value)
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'stage': self.stage,
+            'stage_title': STAGE_TITLES[self.stage],
+            'progress': self.progress,
+            'finished': self.finished,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ImportJob(Job):
+    """Фоновый импорт квиза из файла"""
+    kind = 'import'
+
+    def __init__(self, user_id: int, file_name: str):
+        super().__init__(user_id)
+        self.file_name = file_name
+        self.content_hash: Optional[str] = None
+        self.source_result: Optional[dict] = None   # итог задачи, копию которой создает эта
+
+    def params(self) -> dict:
+        return {'file_name': self.file_name, 'content_hash': self.content_hash, 'source_result': self.source_result}
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data['file_name'] = self.file_name
+        return data
+
+
+def _read_lines(data: bytes, file_type: str) -> List[str]:
+    return quiz_lines(io.BytesIO(data), file_type)
+
+
+def _summary(quiz_id: int, parser: QuizParser) -> dict:
+    """Итог импорта по разобранной структуре, без повторного чтения из базы"""
+    rounds = [
+        {
+            'title': round_data.title,
+            'questions': len(round_data.questions),
+            'multiple_choice': sum(1 for q in round_data.questions if q.type == 'multiple_choice'),
+            'open_answer': sum(1 for q in round_data.questions if q.type == 'open_answer')
+        }
+        for round_data in parser.rounds
+    ]
+    return {
+        'quiz_id': quiz_id,
+        'title': parser.quiz_title,
+        'rounds_count': len(rounds),
+        'questions_count': sum(r['questions'] for r in rounds),
+        'rounds': rounds,
+        'warnings': [str(error) for error in parser.errors[:20]]
+    }
+
+
+class JobRunner:
+    """Выполняет задачи в пуле потоков и хранит их статусы.
+
+    Свои задачи процесс держит в памяти, а каждую смену этапа записывает
+    в background_job: задачу другого процесса get читает из базы.
+    """
+    thread_name_prefix = 'job'
+    job_class = Job
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._app = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix)
+            return self._executor
+
+    def _start(self, job: Job, fn, app, *args) -> Job:
+        """Регистрирует задачу и ставит fn(job, app, *args) в очередь пула"""
+        executor = self._get_executor()
+        self._app = app
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        with app.app_context():
+            with db.engine.begin() as connection:
+                self._purge_records(connection)
+                connection.execute(insert(BackgroundJob.__table__).values(**job.record()))
+        job.future = executor.submit(fn, job, app, *args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Задача этого процесса или, в контексте приложения, записанная другим процессом"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = db.session.query(BackgroundJob).filter_by(id=job_id, kind=self.job_class.kind).first()
+        return self.job_class.restore(record) if record else None
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _save(self, job: Job):
+        """Записывает этап, прогресс и итог задачи; ошибка записи задачу не прерывает"""
+        record = job.record()
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        update(BackgroundJob.__table__)
+                        .where(BackgroundJob.__table__.c.id == record.pop('id'))
+                        .values(**record)
+                    )
+        except Exception as e:
+            logger.error(f"Ошибка записи статуса задачи {job.id}: {e}")
+
+    def _set_stage(self, job: Job, stage: str, on_progress=None):
+        job.stage = stage
+        self._save(job)
+        if on_progress is None:
+            return
+        try:
+            on_progress(job)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике прогресса задачи: {e}")
+
+    def _finish(self, job: Job, stage: str, on_progress=None):
+        job.finished_at = datetime.utcnow()
+        job._finished = time.monotonic()
+        self._set_stage(job, stage, on_progress)
+
+    def _purge(self):
+        now = time.monotonic()
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job._finished is not None and now - job._finished > JOB_MAX_AGE
+        ]:
+            del self._jobs[job_id]
+
+    def _purge_records(self, connection):
+        now = datetime.utcnow()
+        table = BackgroundJob.__table__
+        connection.execute(delete(table).where(or_(
+            table.c.finished_at < now - timedelta(seconds=JOB_MAX_AGE),
+            table.c.created_at < now - JOB_STALE_AGE
+        )))
+
+
+class ImportJobRunner(JobRunner):
+    """Импорт квизов из файлов: разбор и сохранение в базу"""
+    thread_name_prefix = 'quiz-import'
+    job_class = ImportJob
+
+    def __init__(self, max_workers: int = IMPORT_WORKERS, parse_processes: int = IMPORT_PARSE_PROCESSES):
+        super().__init__(max_workers)
+        self.parse_processes = parse_processes
+        self._parse_executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        executor = super()._get_executor()
+        with self._lock:
+            if self.parse_processes > 0 and self._parse_executor is None:
+                self._parse_executor = ProcessPoolExecutor(max_workers=self.parse_processes)
+        return executor
+
+    def submit(self, app, data: bytes, file_type: str, file_name: str, user_id: int,
+               on_progress: Callable[[ImportJob], None] = None) -> ImportJob:
+        """Ставит импорт файла в очередь и сразу возвращает задачу.
+
+        on_progress(job) вызывается из фонового потока при каждой смене этапа.
+        Если такой же файл уже загружен и квиз существует, задача завершается
+        этапом STAGE_DUPLICATE без создания квиза (см. submit_copy).
+        """
+        return self._start(ImportJob(user_id, file_name), self._run, app, data, file_type, on_progress)
+
+    def submit_copy(self, app, source: ImportJob, user_id: int,
+                    on_progress: Callable[[ImportJob], None] = None) -> ImportJob:
+        """Создает новый квиз из файла задачи source, не разбирая его повторно.
+
+        Если разобранного файла нет в кэше этого процесса (задачу source
+        выполнил другой процесс), копируется уже созданный из файла квиз.
+        """
+        job = ImportJob(user_id, source.file_name)
+        job.content_hash = source.content_hash
+        job.source_result = source.result
+        return self._start(job, self._run, app, None, None, on_progress)
+
+    def shutdown(self):
+        super().shutdown()
+        with self._lock:
+            parse_executor, self._parse_executor = self._parse_executor, None
+        if parse_executor is not None:
+            parse_executor.shutdown(wait=True)
+
+    def _run(self, job: ImportJob, app, data: Optional[bytes], file_type: Optional[str], on_progress) -> ImportJob:
+        started = time.monotonic()
+        try:
+            self._set_stage(job, STAGE_PARSING, on_progress)
+            parser, known_quiz_id = self._load(job, data, file_type)
+
+            with app.app_context():
+                try:
+                    existing = db.session.get(Quiz, known_quiz_id) if known_quiz_id else None
+                    if parser is None:
+                        self._set_stage(job, STAGE_SAVING, on_progress)
+                        job.result = self._clone(job)
+                        stage = STAGE_DONE
+                    elif existing is not None:
+                        job.result = _summary(existing.id, parser)
+                        job.result['title'] = existing.title
+                        stage = STAGE_DUPLICATE
+                    else:
+                        self._set_stage(job, STAGE_SAVING, on_progress)
+                        quiz = parser.save_to_db(job.user_id)
+                        import_cache.set(job.content_hash, CachedImport(parser, quiz.id))
+                        job.result = _summary(quiz.id, parser)
+                        stage = STAGE_DONE
+                finally:
+                    db.session.remove()
+
+            logger.info(
+                f"Импорт {job.file_name}: квиз {job.result['quiz_id']}"
+                f"{' (уже загружен)' if stage == STAGE_DUPLICATE else ''}, "
+                f"{job.result['questions_count']} вопросов за {time.monotonic() - started:.2f} с"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка импорта {job.file_name}: {e}")
+            job.error = str(e)
+            stage = STAGE_FAILED
+
+        self._finish(job, stage, on_progress)
+        return job
+
+    def _load(self, job: ImportJob, data: Optional[bytes], file_type: Optional[str]):
+        """Разобранный файл из кэша или после разбора; возвращает (parser, id уже созданного квиза)"""
+        if data is None:
+            # Копия ранее загруженного файла; без кэша — копия квиза в базе (_clone)
+            cached = import_cache.get(job.content_hash)
+            if cached is None:
+                if not job.source_result:
+                    raise ValueError("Файл больше не хранится на сервере, загрузите его заново")
+                return None, None
+            return cached.parser, None
+
+        if self._parse_executor is not None:
+            lines = self._parse_executor.submit(_read_lines, data, file_type).result()
+        else:
+            lines = _read_lines(data, file_type)
+        job.content_hash = content_hash(lines)
+
+        cached = import_cache.get(job.content_hash)
+        if cached is not None:
+            return cached.parser, cached.quiz_id
+
+        parser = read_quiz_lines(lines)
+        import_cache.set(job.content_hash, CachedImport(parser, None))
+        return parser, None
+
+    def _clone(self, job: ImportJob) -> dict:
+        """Копия квиза, уже созданного из того же файла; итог — как у исходной задачи"""
+        source = job.source_result
+        quiz = clone_quiz(source['quiz_id'], job.user_id, title=source['title'])
+        if quiz is None:
+            raise ValueError("Файл больше не хранится на сервере, загрузите его заново")
+        return dict(source, quiz_id=quiz.id)
+
+
+import_jobs = ImportJobRunner()
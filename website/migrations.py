@@ -0,0 +1,299 @@
+"""Версионные миграции схемы базы данных.
+
+Номер последней примененной миграции хранится в таблице schema_migration.
+При запуске приложения (create_db) читается только он: если схема
+актуальна, create_all и inspect не выполняются.
+
+Миграции, которые не должны блокировать таблицы (CREATE INDEX CONCURRENTLY,
+заполнение столбца пачками), выполняются вне транзакции (transactional=False)
+и поэтому должны быть идемпотентны: после сбоя миграция запускается заново.
+
+    python -m website.migrations           # версия схемы и ожидающие миграции
+    python -m website.migrations upgrade   # применить, не запуская приложение
+"""
+import contextlib
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, func, inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from .models import db, User, BackgroundJob, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Строк за одно обновление при заполнении нового столбца
+BACKFILL_BATCH_SIZE = 5000
+# Ключ advisory-блокировки PostgreSQL: миграции выполняет один процесс (веб или бот)
+MIGRATION_LOCK_KEY = 4242001
+# 0 — не применять миграции при запуске (их запускают перед деплоем командой upgrade)
+MIGRATE_ON_STARTUP = os.getenv('MIGRATE_ON_STARTUP', '1') != '0'
+
+schema_migration = Table(
+    'schema_migration', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable          # apply(connection)
+    transactional: bool = True
+
+
+def _is_postgres(connection) -> bool:
+    return connection.dialect.name == 'postgresql'
+
+
+def _column_type(connection, table: str, column: str) -> Optional[str]:
+    return connection.execute(text(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column"
+    ), {'table': table, 'column': column}).scalar()
+
+
+def backfill(connection, table: str, assignment: str, pending: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Обновляет строки пачками по первичному ключу id, каждая пачка — отдельная транзакция.
+
+    assignment — выражение SET, pending — условие на еще не обновленные строки.
+    Возвращает число обновленных строк.
+    """
+    total = 0
+    while True:
+        count = connection.execute(text(
+            f'UPDATE {table} SET {assignment} WHERE id IN (SELECT id FROM {table} WHERE {pending} LIMIT {int(batch_size)})'
+        )).rowcount
+        if connection.in_transaction():
+            connection.commit()
+        total += count
+        if count < batch_size:
+            return total
+
+
+def _initial_schema(connection):
+    # Создает недостающие таблицы (существующие не изменяются), как прежний create_all при запуске
+    db.metadata.create_all(connection)
+
+
+def _team_captain_nullable(connection):
+    # Бывший admin.alter_team_table: снятие NOT NULL не переписывает таблицу
+    if _is_postgres(connection):
+        connection.execute(text('ALTER TABLE team ALTER COLUMN captain_id DROP NOT NULL'))
+
+
+def _user_telegram_id_bigint(connection):
+    # Бывшие alter_table.py/recreate_table.py. В рабочей базе столбец уже
+    # изменен скриптом, поэтому таблица переписывается только в старых базах
+    if _is_postgres(connection) and _column_type(connection, 'user', 'telegram_id') == 'integer':
+        connection.execute(text('ALTER TABLE "user" ALTER COLUMN telegram_id TYPE BIGINT'))
+
+
+def _telegram_code_telegram_id_bigint(connection):
+    """telegram_code.telegram_id: INTEGER -> BIGINT без долгой блокировки таблицы.
+
+    Вместо ALTER TYPE (перезапись таблицы под эксклюзивной блокировкой):
+    новый столбец заполняется пачками, затем за одну короткую транзакцию
+    дозаполняются строки, добавленные за это время, и столбцы меняются
+    местами. Индекс по столбцу создает следующая миграция.
+    """
+    if not _is_postgres(connection) or _column_type(connection, 'telegram_code', 'telegram_id') != 'integer':
+        return  # В SQLite INTEGER и так 64-битный
+    connection.execute(text('ALTER TABLE telegram_code ADD COLUMN IF NOT EXISTS telegram_id_big BIGINT'))
+    backfill(connection, 'telegram_code', 'telegram_id_big = telegram_id', 'telegram_id_big IS NULL')
+
+    # Соединение миграции работает в режиме автофиксации, поэтому транзакция — в отдельном
+    with connection.engine.begin() as transaction:
+        transaction.execute(text('LOCK TABLE telegram_code IN ACCESS EXCLUSIVE MODE'))
+        transaction.execute(text('UPDATE telegram_code SET telegram_id_big = telegram_id WHERE telegram_id_big IS NULL'))
+        transaction.execute(text('ALTER TABLE telegram_code DROP COLUMN telegram_id'))
+        transaction.execute(text('ALTER TABLE telegram_code RENAME COLUMN telegram_id_big TO telegram_id'))
+        transaction.execute(text('ALTER TABLE telegram_code ALTER COLUMN telegram_id SET NOT NULL'))
+
+
+# Индексы горячих запросов (см. benchmarks/query_plans.py). Список
+# зафиксирован здесь, а не берется из моделей: миграция не должна меняться
+# вместе с ними.
+_HOT_PATH_INDEXES = (
+    ('ix_answer_game_team_question', 'answer', ('game_id', 'team_id', 'question_id')),
+    ('ix_team_member_user_id', 'team_member', ('user_id',)),
+    ('ix_round_quiz_order', 'round', ('quiz_id', 'order')),
+    ('ix_question_round_order', 'question', ('round_id', 'order')),
+    ('ix_game_status', 'game', ('status',)),
+    ('ix_telegram_code_telegram_used', 'telegram_code', ('telegram_id', 'is_used')),
+)
+
+
+def _drop_invalid_index(connection, name: str):
+    """Прерванное CREATE INDEX CONCURRENTLY оставляет невалидный индекс — его строим заново"""
+    if not _is_postgres(connection):
+        return
+    invalid = connection.execute(text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+    ), {'name': name}).scalar()
+    if invalid:
+        connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+
+
+def _hot_path_indexes(connection):
+    # В PostgreSQL индексы строятся CONCURRENTLY: запись в таблицы не блокируется
+    quote = connection.dialect.identifier_preparer.quote
+    concurrently = ' CONCURRENTLY' if _is_postgres(connection) else ''
+    for name, table, columns in _HOT_PATH_INDEXES:
+        _drop_invalid_index(connection, name)
+        connection.execute(text(
+            f"CREATE INDEX{concurrently} IF NOT EXISTS {name} ON {quote(table)} "
+            f"({', '.join(quote(column) for column in columns)})"
+        ))
+
+
+def _chat_message_table(connection):
+    # Новая таблица: блокировок существующих таблиц нет
+    ChatMessage.__table__.create(connection, checkfirst=True)
+
+
+def _outbox_retry_backoff(connection):
+    """outbox_message: время следующей попытки и частичный индекс неотправленных записей.
+
+    Столбец без значения по умолчанию добавляется без перезаписи таблицы,
+    индекс в PostgreSQL строится CONCURRENTLY.
+    """
+    if 'next_attempt_at' not in {column['name'] for column in inspect(connection).get_columns('outbox_message')}:
+        column_type = 'TIMESTAMP' if _is_postgres(connection) else 'DATETIME'
+        connection.execute(text(f'ALTER TABLE outbox_message ADD COLUMN next_attempt_at {column_type}'))
+    concurrently = ' CONCURRENTLY' if _is_postgres(connection) else ''
+    _drop_invalid_index(connection, 'ix_outbox_message_pending')
+    connection.execute(text(
+        f'CREATE INDEX{concurrently} IF NOT EXISTS ix_outbox_message_pending ON outbox_message (id) WHERE sent_at IS NULL'
+    ))
+
+
+def _background_job_table(connection):
+    # Новая таблица: блокировок существующих таблиц нет
+    BackgroundJob.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'initial schema', _initial_schema),
+    Migration(2, 'team.captain_id nullable', _team_captain_nullable),
+    Migration(3, 'user.telegram_id bigint', _user_telegram_id_bigint),
+    Migration(4, 'telegram_code.telegram_id bigint', _telegram_code_telegram_id_bigint, transactional=False),
+    Migration(5, 'hot path indexes', _hot_path_indexes, transactional=False),
+    Migration(6, 'chat_message table', _chat_message_table),
+    Migration(7, 'outbox retry backoff', _outbox_retry_backoff, transactional=False),
+    Migration(8, 'background_job table', _background_job_table),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(engine) -> Optional[int]:
+    """Версия схемы; None, если база еще не под управлением миграций"""
+    with engine.connect() as connection:
+        try:
+            return connection.execute(select(func.max(schema_migration.c.version))).scalar() or 0
+        except (OperationalError, ProgrammingError):
+            connection.rollback()
+            return None
+
+
+@contextlib.contextmanager
+def _migration_lock(engine):
+    """Не дает двум процессам применять миграции одновременно (только PostgreSQL)"""
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def _create_first_admin(connection):
+    """Первый админ новой базы (внутренний ID = 1)"""
+    admin_telegram_id = os.getenv('ADMIN_USER_ID')
+    if not admin_telegram_id:
+        return
+    connection.execute(User.__table__.insert().values(
+        id=1,
+        telegram_id=int(admin_telegram_id),
+        username='admin',
+        role='admin',
+        created_at=datetime.utcnow()
+    ))
+
+
+def _stamp(connection, migrations: List[Migration]):
+    connection.execute(schema_migration.insert(), [
+        {'version': migration.version, 'name': migration.name, 'applied_at': datetime.utcnow()}
+        for migration in migrations
+    ])
+
+
+def _apply(engine, migration: Migration):
+    started = time.monotonic()
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.apply(connection)
+            _stamp(connection, [migration])
+    else:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            migration.apply(connection)
+        with engine.begin() as connection:
+            _stamp(connection, [migration])
+    logger.info(f"Миграция {migration.version} ({migration.name}) применена за {time.monotonic() - started:.2f} с")
+
+
+def migrate(engine) -> bool:
+    """Приводит схему к последней версии; возвращает True, если база создана с нуля.
+
+    Новая база создается по моделям (create_all) с первым админом и сразу
+    получает последнюю версию. База, созданная до появления миграций, проходит их все: каждая
+    проверяет текущее состояние и не меняет уже измененное.
+    """
+    if current_version(engine) == LATEST_VERSION:
+        return False
+
+    with _migration_lock(engine):
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        version = current_version(engine)
+        if version is None:
+            created = not inspect(engine).get_table_names()
+            schema_migration.create(engine, checkfirst=True)
+            if created:
+                with engine.begin() as connection:
+                    db.metadata.create_all(connection)
+                    _create_first_admin(connection)
+                    _stamp(connection, MIGRATIONS)
+                logger.info(f"Схема базы создана, версия {LATEST_VERSION}")
+                return True
+            version = 0
+
+        for migration in MIGRATIONS:
+            if migration.version > version:
+                _apply(engine, migration)
+    return False
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(os.environ['DATABASE_URL'])
+    if len(sys.argv) > 1 and sys.argv[1] == 'upgrade':
+        migrate(engine)
+
+    version = current_version(engine)
+    print(f"Версия схемы: {'нет' if version is None else version}, последняя: {LATEST_VERSION}")
+    for migration in MIGRATIONS:
+        if version is None or migration.version > version:
+            print(f"  ожидает: {migration.version} {migration.name}")
+
+
+if __name__ == '__main__':
+    main()
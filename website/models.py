@@ -25,6 +25,10 @@ class Game(db.Model):
     started_at = db.Column(db.DateTime)
     finished_at = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index('ix_game_status', 'status'),  # активные игры при запуске бота, панель управления
+    )
+
     # Константы для статусов
     STATUS_SETUP = 'setup'      # Настройка игры (создание команд)
     STATUS_READY = 'ready'      # Готова к началу (ожидание игроков)
@@ -61,6 +65,10 @@ class Round(db.Model):
     title = db.Column(db.String(200), nullable=False)
     order = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_round_quiz_order', 'quiz_id', 'order'),  # раунды квиза по порядку
+    )
+
     questions = db.relationship('Question', backref='round', lazy=True, order_by='Question.order')
 
 class Question(db.Model):
@@ -75,6 +83,10 @@ class Question(db.Model):
     time_limit = db.Column(db.Integer, default=30)  # Время на ответ в секундах
     order = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_question_round_order', 'round_id', 'order'),  # вопросы раунда по порядку
+    )
+
 class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -91,6 +103,10 @@ class TeamMember(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     joined_at = db.Column(db.DateTime, nullable=True)  # Убираем default, делаем nullable
 
+    __table_args__ = (
+        db.Index('ix_team_member_user_id', 'user_id'),  # команды игрока
+    )
+
     user = db.relationship('User', backref=db.backref('team_memberships', lazy=True))
 
 class Answer(db.Model):
@@ -103,6 +119,11 @@ class Answer(db.Model):
     score = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Ответ команды на вопрос; префикс (game_id) — таблица результатов игры
+        db.Index('ix_answer_game_team_question', 'game_id', 'team_id', 'question_id'),
+    )
+
     game = db.relationship('Game', backref=db.backref('answers', lazy=True))
     team = db.relationship('Team', backref=db.backref('answers', lazy=True))
     question = db.relationship('Question', backref=db.backref('answers', lazy=True))
@@ -117,7 +138,57 @@ game_teams = db.Table('game_teams',
 class TelegramCode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(6), unique=True, nullable=False)
-    telegram_id = db.Column(db.Integer, nullable=False)
+    telegram_id = db.Column(db.BigInteger, nullable=False)
     is_used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    used_at = db.Column(db.DateTime) 
\ No newline at end of file
+    used_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_telegram_code_telegram_used', 'telegram_id', 'is_used'),  # неиспользованные коды пользователя
+    )
+
+class OutboxMessage(db.Model):
+    """Уведомление игроку или служебная команда, ожидающие обработки процессом бота"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), default='message', nullable=False)  # message, control
+    chat_id = db.Column(db.BigInteger)
+    text = db.Column(db.Text)
+    payload = db.Column(db.JSON)  # Параметры отправки или команды
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    next_attempt_at = db.Column(db.DateTime)  # Не раньше этого времени после неудачной попытки
+
+    __table_args__ = (
+        # Очередь выбирается по неотправленным записям, отправленные в индекс не попадают
+        db.Index('ix_outbox_message_pending', 'id',
+                 postgresql_where=db.text('sent_at IS NULL'), sqlite_where=db.text('sent_at IS NULL')),
+    )
+
+class BackgroundJob(db.Model):
+    """Состояние фоновой задачи (импорт, удаление): статус доступен любому веб-процессу"""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # import, delete
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    stage = db.Column(db.String(20), nullable=False)
+    progress = db.Column(db.Float)
+    params = db.Column(db.JSON)  # Поля задачи конкретного вида (файл, цель удаления)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class ChatMessage(db.Model):
+    """Сообщение чата игровой комнаты (записывается в фоне, см. website.chat)"""
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # NULL — системное сообщение
+    type = db.Column(db.String(20), nullable=False)  # system, moderator, player
+    sender = db.Column(db.String(80), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_chat_message_game_id', 'game_id', 'id'),  # последние сообщения игры
+    )
@@ -0,0 +1,24 @@
+from typing import Iterable, Tuple
+
+from .models import db, OutboxMessage
+
+
+def enqueue(chat_id: int, text: str, **kwargs):
+    """Ставит сообщение в очередь отправки ботом.
+
+    Запись добавляется в текущую сессию и фиксируется вместе
+    с изменениями, ради которых отправляется уведомление.
+    """
+    db.session.add(OutboxMessage(chat_id=chat_id, text=text, payload=kwargs or None))
+
+
+def enqueue_many(messages: Iterable[Tuple[int, str]]) -> int:
+    """Ставит в очередь пары (chat_id, текст), возвращает их количество"""
+    records = [OutboxMessage(chat_id=chat_id, text=text) for chat_id, text in messages]
+    db.session.add_all(records)
+    return len(records)
+
+
+def enqueue_control(action: str, **payload):
+    """Ставит в очередь служебную команду для процесса бота (например, пауза таймера)"""
+    db.session.add(OutboxMessage(kind='control', payload=dict(payload, action=action)))
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set
+
+# Соединение без активности (событий и heartbeat) дольше этого считается
+# пропавшим, даже если disconnect до процесса не дошел
+PRESENCE_TIMEOUT = int(os.getenv('PRESENCE_TIMEOUT', 90))
+
+
+class Presence(NamedTuple):
+    """Участник в игровой комнате"""
+    user_id: int
+    username: str
+    role: str
+    team_id: Optional[int]
+
+
+class _Connection:
+    __slots__ = ('games', 'last_seen')
+
+    def __init__(self):
+        self.games: Dict[int, Presence] = {}   # game_id -> участник с командой этой игры
+        self.last_seen = time.monotonic()
+
+
+class PresenceRegistry:
+    """Кто подключен к игровым комнатам: sid -> пользователь -> комнаты.
+
+    Реестр свой у каждого веб-процесса и знает только его соединения.
+    Пользователь может быть подключен несколькими вкладками: события
+    входа и выхода нужны только для первого и последнего соединения.
+    """
+
+    def __init__(self, timeout: int = PRESENCE_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._connections: Dict[str, _Connection] = {}
+        self._games: Dict[int, Dict[int, Set[str]]] = {}   # game_id -> user_id -> sids
+
+    def join(self, sid: str, game_id: int, user: Presence) -> bool:
+        """Добавляет соединение в комнату; True, если пользователь только что появился в игре"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None:
+                connection = self._connections[sid] = _Connection()
+            connection.games[game_id] = user
+            connection.last_seen = time.monotonic()
+            sids = self._games.setdefault(game_id, {}).setdefault(user.user_id, set())
+            first = not sids
+            sids.add(sid)
+            return first
+
+    def leave(self, sid: str, game_id: int) -> Optional[Presence]:
+        """Убирает соединение из комнаты; возвращает участника, если это было его последнее соединение"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or game_id not in connection.games:
+                return None
+            return self._leave(sid, connection, game_id)
+
+    def disconnect(self, sid: str) -> List[tuple]:
+        """Забывает соединение; возвращает (game_id, участник) для игр, которые участник покинул"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None:
+                return []
+            return self._drop(sid, connection)
+
+    def touch(self, sid: str) -> bool:
+        """Heartbeat: соединение живо; False, если реестр его уже не знает"""
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None:
+                return False
+            connection.last_seen = time.monotonic()
+            return True
+
+    def expire(self) -> List[tuple]:
+        """Убирает соединения без heartbeat; возвращает (game_id, участник), как disconnect"""
+        deadline = time.monotonic() - self.timeout
+        left = []
+        with self._lock:
+            for sid, connection in list(self._connections.items()):
+                if connection.last_seen < deadline:
+                    left.extend(self._drop(sid, connection))
+        return left
+
+    def online(self, game_id: int) -> List[Presence]:
+        """Участники, подключенные к комнате игры"""
+        with self._lock:
+            users = self._games.get(game_id, {})
+            return [
+                self._connections[next(iter(sids))].games[game_id]
+                for sids in users.values()
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'connections': len(self._connections), 'games': len(self._games)}
+
+    def _drop(self, sid: str, connection: _Connection) -> List[tuple]:
+        left = []
+        for game_id in list(connection.games):
+            user = self._leave(sid, connection, game_id)
+            if user is not None:
+                left.append((game_id, user))
+        del self._connections[sid]
+        return left
+
+    def _leave(self, sid: str, connection: _Connection, game_id: int) -> Optional[Presence]:
+        user = connection.games.pop(game_id)
+        users = self._games[game_id]
+        sids = users[user.user_id]
+        sids.discard(sid)
+        if sids:
+            return None
+        del users[user.user_id]
+        if not users:
+            del self._games[game_id]
+        return user
+
+
+presence = PresenceRegistry()
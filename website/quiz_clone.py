@@ -0,0 +1,56 @@
+from typing import Optional
+
+from sqlalchemy import func, insert, select
+
+from .models import db, Quiz, Round, Question
+
+COPY_SUFFIX = ' (копия)'
+
+
+def clone_quiz(quiz_id: int, user_id: int, title: Optional[str] = None) -> Optional[Quiz]:
+    """Копирует квиз с раундами и вопросами на стороне базы.
+
+    Раунды и вопросы переносятся двумя INSERT ... SELECT, поэтому число
+    запросов не зависит от размера квиза. Раунды копии нумеруются
+    подряд в прежнем порядке; по этому номеру вопросы находят свой
+    новый раунд. Возвращает None, если квиз не найден.
+    """
+    source = db.session.get(Quiz, quiz_id)
+    if source is None:
+        return None
+
+    quiz = Quiz(
+        title=(title or source.title + COPY_SUFFIX)[:200],
+        description=source.description,
+        created_by=user_id
+    )
+    db.session.add(quiz)
+    db.session.flush()  # Получаем ID копии
+
+    # Позиция раунда в исходном квизе — она же order раунда в копии
+    position = func.row_number().over(order_by=(Round.order, Round.id))
+    db.session.execute(
+        insert(Round.__table__).from_select(
+            ['quiz_id', 'title', 'order'],
+            select(quiz.id, Round.title, position).where(Round.quiz_id == quiz_id)
+        )
+    )
+
+    source_round = (
+        select(Round.id, position.label('position'))
+        .where(Round.quiz_id == quiz_id)
+        .subquery()
+    )
+    new_round = Round.__table__.alias('new_round')
+    columns = ['text', 'type', 'options', 'correct_answer', 'correct_option', 'points', 'time_limit', 'order']
+    db.session.execute(
+        insert(Question.__table__).from_select(
+            ['round_id'] + columns,
+            select(new_round.c.id, *(Question.__table__.c[name] for name in columns))
+            .join(source_round, Question.round_id == source_round.c.id)
+            .join(new_round, (new_round.c.quiz_id == quiz.id) & (new_round.c.order == source_round.c.position))
+        )
+    )
+
+    db.session.commit()
+    return quiz
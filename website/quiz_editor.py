@@ -0,0 +1,231 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+
+from .models import db, Quiz, Round, Question
+from .outbox import enqueue_control
+from .quiz_plan import quiz_plans
+
+# Поля вопроса, которые редактор может изменить
+_QUESTION_FIELDS = ('round_id', 'text', 'type', 'correct_answer', 'options', 'correct_option', 'order')
+
+
+class QuizEditError(ValueError):
+    """Некорректные данные редактора квиза"""
+
+
+def _load(quiz_id: int):
+    """Квиз целиком одним запросом: (quiz, {round_id: раунд}, {question_id: вопрос})"""
+    rows = db.session.execute(
+        select(
+            Quiz.title, Quiz.description,
+            Round.id.label('round_id'), Round.title.label('round_title'), Round.order.label('round_order'),
+            Question.id, Question.round_id.label('question_round_id'), Question.text, Question.type,
+            Question.correct_answer, Question.options, Question.correct_option, Question.order
+        )
+        .outerjoin(Round, Round.quiz_id == Quiz.id)
+        .outerjoin(Question, Question.round_id == Round.id)
+        .where(Quiz.id == quiz_id)
+    ).all()
+    if not rows:
+        return None, {}, {}
+
+    quiz = {'title': rows[0].title, 'description': rows[0].description}
+    rounds: Dict[int, dict] = {}
+    questions: Dict[int, dict] = {}
+    for row in rows:
+        if row.round_id is not None:
+            rounds[row.round_id] = {'title': row.round_title, 'order': row.round_order}
+        if row.id is not None:
+            questions[row.id] = {
+                'round_id': row.question_round_id,
+                'text': row.text,
+                'type': row.type,
+                'correct_answer': row.correct_answer,
+                'options': row.options,
+                'correct_option': row.correct_option,
+                'order': row.order
+            }
+    return quiz, rounds, questions
+
+
+def _question_values(data: dict, position: int) -> dict:
+    """Поля вопроса из данных редактора"""
+    text = (data.get('text') or '').strip()
+    if not text:
+        raise QuizEditError(f"Вопрос {position}: не указан текст")
+    question_type = data.get('type') or 'open'
+
+    if question_type == 'multiple_choice':
+        options = [str(option) for option in data.get('options') or []]
+        correct_option = data.get('correct_option')
+        if not options or not isinstance(correct_option, int) or not 0 <= correct_option < len(options):
+            raise QuizEditError(f"Вопрос {position}: не выбран правильный вариант")
+        correct_answer = options[correct_option]
+    else:
+        options = None
+        correct_option = None
+        correct_answer = (data.get('answer') or '').strip()
+        if not correct_answer:
+            raise QuizEditError(f"Вопрос {position}: не указан ответ")
+
+    return {
+        'text': text,
+        'type': question_type,
+        'correct_answer': correct_answer,
+        'options': options,
+        'correct_option': correct_option,
+        'order': position
+    }
+
+
+def _changed(question: dict, values: dict) -> bool:
+    # Пустой список вариантов и NULL у открытых вопросов равнозначны
+    return any(
+        (question[field] or []) != (values[field] or []) if field == 'options' else question[field] != values[field]
+        for field in _QUESTION_FIELDS
+    )
+
+
+def _parse_id(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise QuizEditError(f"Некорректный ID: {value}")
+
+
+def apply_quiz_edit(quiz_id: int, payload: dict) -> Optional[dict]:
+    """Применяет изменения из редактора квиза.
+
+    payload: {'title', 'description', 'rounds': [...]}, где rounds — все раунды
+    квиза в новом порядке. Неизмененный раунд передается только как {'id': ...};
+    измененный или новый — с 'title' и полным списком 'questions'. Раунды,
+    которых нет в списке, и вопросы, пропавшие из переданных раундов, удаляются.
+
+    Квиз читается одним запросом, изменения применяются пакетными
+    INSERT/UPDATE/DELETE, поэтому число запросов не зависит от размера квиза.
+    Возвращает число измененных строк по видам или None, если квиз не найден.
+    """
+    quiz, rounds, questions = _load(quiz_id)
+    if quiz is None:
+        return None
+
+    payload_rounds = payload.get('rounds')
+    if not isinstance(payload_rounds, list):
+        raise QuizEditError("Не переданы раунды квиза")
+
+    quiz_values = {}
+    for field in ('title', 'description'):
+        if field in payload and payload[field] != quiz[field]:
+            quiz_values[field] = payload[field]
+    if 'title' in quiz_values and not (quiz_values['title'] or '').strip():
+        raise QuizEditError("Название квиза обязательно")
+
+    round_updates: List[dict] = []
+    new_rounds: List[dict] = []          # новые раунды в порядке следования
+    new_round_questions: List[list] = []  # вопросы каждого нового раунда
+    question_updates: List[dict] = []
+    question_inserts: List[dict] = []
+    kept_rounds = set()
+    kept_questions = set()
+    edited_rounds = set()
+
+    for round_position, round_data in enumerate(payload_rounds, 1):
+        round_id = _parse_id(round_data.get('id'))
+        if round_id is not None and (round_id not in rounds or round_id in kept_rounds):
+            raise QuizEditError(f"Раунд {round_id} не принадлежит квизу")
+
+        if round_id is None or 'title' in round_data:
+            title = (round_data.get('title') or '').strip()
+            if not title:
+                raise QuizEditError(f"Раунд {round_position}: не указано название")
+        else:
+            title = rounds[round_id]['title']
+
+        if round_id is not None:
+            kept_rounds.add(round_id)
+            if rounds[round_id] != {'title': title, 'order': round_position}:
+                round_updates.append({'id': round_id, 'title': title, 'order': round_position})
+        else:
+            new_rounds.append({'quiz_id': quiz_id, 'title': title, 'order': round_position})
+
+        if 'questions' not in round_data:
+            if round_id is None:
+                new_round_questions.append([])
+            continue
+        if round_id is not None:
+            edited_rounds.add(round_id)
+
+        round_questions = []
+        for question_position, question_data in enumerate(round_data['questions'], 1):
+            values = _question_values(question_data, question_position)
+            question_id = _parse_id(question_data.get('id'))
+            if question_id is None:
+                round_questions.append(values)
+                continue
+            if question_id not in questions or question_id in kept_questions:
+                raise QuizEditError(f"Вопрос {question_id} не принадлежит квизу")
+            kept_questions.add(question_id)
+            if round_id is None:
+                # Вопрос перенесен в новый раунд: его id станет известен после вставки
+                round_questions.append(dict(values, id=question_id))
+                continue
+            values['round_id'] = round_id
+            if _changed(questions[question_id], values):
+                question_updates.append(dict(values, id=question_id))
+
+        if round_id is None:
+            new_round_questions.append(round_questions)
+        else:
+            question_inserts.extend(dict(values, round_id=round_id) for values in round_questions)
+
+    # Удаляются вопросы удаленных и переданных целиком раундов, которых нет в данных
+    deleted_rounds = set(rounds) - kept_rounds
+    deleted_questions = [
+        question_id for question_id, question in questions.items()
+        if question_id not in kept_questions
+        and (question['round_id'] in deleted_rounds or question['round_id'] in edited_rounds)
+    ]
+
+    if deleted_questions:
+        db.session.execute(delete(Question).where(Question.id.in_(deleted_questions)), execution_options={'synchronize_session': False})
+    if deleted_rounds:
+        db.session.execute(delete(Round).where(Round.id.in_(deleted_rounds)), execution_options={'synchronize_session': False})
+    if quiz_values:
+        db.session.execute(update(Quiz).where(Quiz.id == quiz_id).values(**quiz_values), execution_options={'synchronize_session': False})
+    if round_updates:
+        db.session.execute(update(Round), round_updates)
+
+    if new_rounds:
+        # ID новых раундов возвращаются в порядке переданных строк
+        new_round_ids = db.session.scalars(
+            insert(Round).returning(Round.id, sort_by_parameter_order=True), new_rounds
+        ).all()
+        for new_round_id, round_questions in zip(new_round_ids, new_round_questions):
+            for values in round_questions:
+                values['round_id'] = new_round_id
+                if 'id' in values:
+                    question_updates.append(values)
+                else:
+                    question_inserts.append(values)
+
+    if question_updates:
+        db.session.execute(update(Question), question_updates)
+    if question_inserts:
+        # Вставка через таблицу одним пакетом (см. QuizParser._insert_bulk)
+        db.session.execute(insert(Question.__table__), question_inserts)
+
+    # Бот перестраивает план вместе с правкой: иначе он переходил бы к удаленным вопросам
+    enqueue_control('invalidate_plan', quiz_id=quiz_id)
+    db.session.commit()
+    quiz_plans.invalidate(quiz_id)
+    return {
+        'rounds_added': len(new_rounds),
+        'rounds_updated': len(round_updates),
+        'rounds_deleted': len(deleted_rounds),
+        'questions_added': len(question_inserts),
+        'questions_updated': len(question_updates),
+        'questions_deleted': len(deleted_questions)
+    }
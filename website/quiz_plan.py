@@ -0,0 +1,156 @@
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .models import db, Round, Question
+
+# Время жизни плана в секундах. Правки квиза в редакторе сбрасывают план
+# в боте через очередь (invalidate_plan); другие веб-процессы очередь не
+# читают и видят правку не позже чем через этот интервал (или сразу, если
+# текущего вопроса нет в плане — см. locate).
+QUIZ_PLAN_MAX_AGE = 300
+
+
+class PlanEntry(NamedTuple):
+    """Позиция вопроса в квизе"""
+    index: int            # номер в общем списке вопросов (с нуля)
+    question_id: int
+    question_order: int
+    question_number: int  # номер вопроса внутри раунда (с единицы)
+    question_type: str
+    points: float
+    time_limit: int
+    round_id: int
+    round_order: int
+    round_number: int     # номер раунда в квизе (с единицы)
+    round_title: str
+    round_size: int
+
+
+class QuizPlan:
+    """Неизменяемый порядок вопросов квиза.
+
+    Вопросы хранятся плоским списком в порядке прохождения, границы
+    раундов — индексами первого вопроса каждого раунда.
+    """
+
+    def __init__(self, quiz_id: int, entries: Tuple[PlanEntry, ...], round_starts: Tuple[int, ...], total_rounds: int):
+        self.quiz_id = quiz_id
+        self.entries = entries
+        self.round_starts = round_starts
+        self.total_rounds = total_rounds
+        self.total_questions = len(entries)
+        self.built_at = time.monotonic()
+        self._by_question = {entry.question_id: entry for entry in entries}
+
+    @classmethod
+    def build(cls, quiz_id: int) -> 'QuizPlan':
+        """Строит план одним запросом"""
+        rows = (
+            db.session.query(
+                Round.id.label('round_id'), Round.order.label('round_order'), Round.title.label('round_title'),
+                Question.id, Question.order, Question.type, Question.points, Question.time_limit
+            )
+            .outerjoin(Question, Question.round_id == Round.id)
+            .filter(Round.quiz_id == quiz_id)
+            .order_by(Round.order, Round.id, Question.order, Question.id)
+            .all()
+        )
+
+        # Группируем строки по раундам, сохраняя порядок
+        rounds: Dict[int, List] = {}
+        for row in rows:
+            questions = rounds.setdefault(row.round_id, [])
+            if row.id is not None:
+                questions.append(row)
+
+        entries = []
+        round_starts = []
+        for round_number, questions in enumerate(rounds.values(), 1):
+            if questions:
+                round_starts.append(len(entries))
+            for question_number, row in enumerate(questions, 1):
+                entries.append(PlanEntry(
+                    index=len(entries),
+                    question_id=row.id,
+                    question_order=row.order,
+                    question_number=question_number,
+                    question_type=row.type,
+                    points=row.points,
+                    time_limit=row.time_limit,
+                    round_id=row.round_id,
+                    round_order=row.round_order,
+                    round_number=round_number,
+                    round_title=row.round_title,
+                    round_size=len(questions)
+                ))
+        return cls(quiz_id, tuple(entries), tuple(round_starts), len(rounds))
+
+    def first(self) -> Optional[PlanEntry]:
+        return self.entries[0] if self.entries else None
+
+    def get(self, question_id: Optional[int]) -> Optional[PlanEntry]:
+        return self._by_question.get(question_id)
+
+    def next(self, question_id: Optional[int]) -> Optional[PlanEntry]:
+        """Следующий вопрос (первый вопрос квиза, если текущего нет)"""
+        if question_id is None:
+            return self.first()
+        entry = self.get(question_id)
+        if entry is None or entry.index + 1 >= self.total_questions:
+            return None
+        return self.entries[entry.index + 1]
+
+    def prev(self, question_id: int) -> Optional[PlanEntry]:
+        entry = self.get(question_id)
+        if entry is None or entry.index == 0:
+            return None
+        return self.entries[entry.index - 1]
+
+    def next_round_start(self, question_id: Optional[int]) -> Optional[PlanEntry]:
+        """Первый вопрос следующего раунда (первого раунда, если текущего вопроса нет)"""
+        entry = self.get(question_id)
+        for start in self.round_starts:
+            if entry is None or start > entry.index:
+                return self.entries[start]
+        return None
+
+
+class QuizPlanCache:
+    """Кэш планов квизов"""
+
+    def __init__(self, max_age=QUIZ_PLAN_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._plans: Dict[int, QuizPlan] = {}
+
+    def get(self, quiz_id: int) -> QuizPlan:
+        with self._lock:
+            plan = self._plans.get(quiz_id)
+        if plan is None or time.monotonic() - plan.built_at > self.max_age:
+            plan = QuizPlan.build(quiz_id)
+            with self._lock:
+                self._plans[quiz_id] = plan
+        return plan
+
+    def locate(self, quiz_id: int, question_id: Optional[int]) -> Tuple[QuizPlan, Optional[PlanEntry]]:
+        """План квиза и позиция вопроса в нем.
+
+        Если вопроса нет в закэшированном плане (квиз правили в другом
+        процессе), план один раз перестраивается.
+        """
+        plan = self.get(quiz_id)
+        entry = plan.get(question_id)
+        if entry is None and question_id is not None:
+            self.invalidate(quiz_id)
+            plan = self.get(quiz_id)
+            entry = plan.get(question_id)
+        return plan, entry
+
+    def invalidate(self, quiz_id: int):
+        with self._lock:
+            self._plans.pop(quiz_id, None)
+
+
+quiz_plans = QuizPlanCache()
+
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from .models import db, Answer, Team, game_teams
+
+# Сколько секунд таблица считается актуальной без пересборки.
+# Веб и бот работают в разных процессах, поэтому изменения, сделанные
+# в соседнем процессе, подхватываются не позже чем через это время.
+SCOREBOARD_MAX_AGE = 60
+
+
+class GameScoreboard:
+    """Таблица результатов одной игры"""
+
+    def __init__(self, game_id: int, teams: Dict[int, str], scores: Dict[int, float]):
+        self.game_id = game_id
+        self.team_names = dict(teams)
+        self.scores = {team_id: scores.get(team_id, 0.0) for team_id in self.team_names}
+        self.built_at = time.monotonic()
+        self._ranking = None
+
+    def apply_delta(self, team_id: int, delta: float):
+        if not delta or team_id not in self.scores:
+            return
+        self.scores[team_id] += delta
+        self._ranking = None
+
+    def ranking(self) -> List[Tuple[int, str, float]]:
+        """Список (team_id, название, счет) по убыванию счета"""
+        if self._ranking is None:
+            self._ranking = sorted(
+                ((team_id, self.team_names[team_id], score) for team_id, score in self.scores.items()),
+                key=lambda item: item[2],
+                reverse=True
+            )
+        return self._ranking
+
+
+class ScoreboardRegistry:
+    """Кэш таблиц результатов, обновляемый по мере изменения Answer.score"""
+
+    def __init__(self, max_age=SCOREBOARD_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._boards: Dict[int, GameScoreboard] = {}
+
+    def _load(self, game_id: int) -> GameScoreboard:
+        """Собирает таблицу одним агрегирующим запросом"""
+        teams = dict(
+            db.session.query(Team.id, Team.name)
+            .join(game_teams, game_teams.c.team_id == Team.id)
+            .filter(game_teams.c.game_id == game_id)
+            .all()
+        )
+        scores = dict(
+            db.session.query(Answer.team_id, func.coalesce(func.sum(Answer.score), 0.0))
+            .filter(Answer.game_id == game_id)
+            .group_by(Answer.team_id)
+            .all()
+        )
+        return GameScoreboard(game_id, teams, {team_id: float(score) for team_id, score in scores.items()})
+
+    def get(self, game_id: int, max_age: Optional[float] = None) -> GameScoreboard:
+        """Таблица игры, собранная не раньше чем max_age секунд назад (по умолчанию self.max_age)"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            board = self._boards.get(game_id)
+        if board is None or time.monotonic() - board.built_at > max_age:
+            board = self._load(game_id)
+            with self._lock:
+                self._boards[game_id] = board
+        return board
+
+    def ranking(self, game_id: int, max_age: Optional[float] = None) -> List[Tuple[int, str, float]]:
+        return self.get(game_id, max_age).ranking()
+
+    def record_score(self, game_id: int, team_id: int, old_score: Optional[float], new_score: Optional[float]):
+        """Учитывает изменение оценки ответа (после коммита)"""
+        with self._lock:
+            board = self._boards.get(game_id)
+            if board is not None:
+                board.apply_delta(team_id, (new_score or 0.0) - (old_score or 0.0))
+
+    def invalidate(self, game_id: int):
+        """Сбрасывает таблицу игры (например, при изменении состава команд)"""
+        with self._lock:
+            self._boards.pop(game_id, None)
+
+    def warm(self, game_ids):
+        """Заранее собирает таблицы для указанных игр"""
+        for game_id in game_ids:
+            board = self._load(game_id)
+            with self._lock:
+                self._boards[game_id] = board
+
+
+scoreboards = ScoreboardRegistry()
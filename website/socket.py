@@ -1,9 +1,71 @@
-from flask_socketio import SocketIO, emit, join_room, leave_room
+import logging
+import os
+from flask import request
+from flask_socketio import ConnectionRefusedError, SocketIO, emit, join_room, leave_room
 from flask_login import current_user
-from .models import db, Game, User, TeamMember, Team
-from datetime import datetime
+from .models import Game
+from .identity_cache import identity_cache
+from .chat import chat
+from .emit_coalescer import EmitCoalescer
+from .presence import Presence, presence
+from .scoreboard import scoreboards
+from .socket_queue import create_client_manager
+from .spectator import SPECTATOR_NAMESPACE, spectator_room, spectators
+
+logger = logging.getLogger(__name__)
 
 socketio = SocketIO()
+# Издатель событий для процесса без сервера Socket.IO (бот)
+_emitter = None
+
+
+def init_socketio(app, **kwargs):
+    """Подключает сервер Socket.IO к приложению.
+
+    С SOCKETIO_MESSAGE_QUEUE рассылки в комнаты идут через очередь и доходят
+    до клиентов всех веб-процессов. Без sticky-сессий на балансировщике
+    long-polling между процессами не работает: либо балансировщик
+    закрепляет клиента по cookie SOCKETIO_STICKY_COOKIE, либо
+    SOCKETIO_WEBSOCKET_ONLY=1 оставляет только WebSocket.
+    """
+    options = {'async_mode': os.getenv('SOCKETIO_ASYNC_MODE', 'threading')}
+    message_queue = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    if message_queue:
+        options['client_manager'] = create_client_manager(message_queue)
+    sticky_cookie = os.getenv('SOCKETIO_STICKY_COOKIE')
+    if sticky_cookie:
+        options['cookie'] = sticky_cookie
+    transports = ['websocket'] if os.getenv('SOCKETIO_WEBSOCKET_ONLY') == '1' else ['polling', 'websocket']
+    options['transports'] = transports
+    options.update(kwargs)
+
+    app.config['SOCKETIO_TRANSPORTS'] = options['transports']  # для клиента в шаблонах
+    socketio.init_app(app, **options)
+    chat.start(app)
+    spectators.start(app, emit_to_room)
+
+
+def init_emitter(message_queue=None):
+    """Позволяет процессу без сервера Socket.IO отправлять события в комнаты через очередь"""
+    global _emitter
+    message_queue = message_queue or os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    if socketio.server is None and message_queue:
+        _emitter = create_client_manager(message_queue, write_only=True)
+
+
+def game_room(game_id) -> str:
+    return f"game_{game_id}"
+
+
+def emit_to_room(event, data, room, skip_sid=None, namespace='/'):
+    """Отправляет событие в комнату из любого процесса и вне обработчиков Socket.IO"""
+    skip_sid = list(skip_sid) if skip_sid else None
+    if socketio.server is not None:
+        socketio.emit(event, data, to=room, skip_sid=skip_sid, namespace=namespace)
+    elif _emitter is not None:
+        _emitter.emit(event, data=data, namespace=namespace, room=room, skip_sid=skip_sid)
+    else:
+        logger.debug(f"Событие {event} не отправлено: нет сервера Socket.IO и очереди")
 
 @socketio.on('connect')
 def handle_connect():
@@ -11,14 +73,29 @@ def handle_connect():
     if not current_user.is_authenticated:
         return False
 
+def _emit_left(game_id, user):
+    """player_left для участника, закрывшего последнее соединение с комнатой"""
+    if user.team_id is not None:
+        emit_to_room('player_left', {
+            'user_id': user.user_id,
+            'username': user.username,
+            'team_id': user.team_id
+        }, game_room(game_id))
+
+def _expire_presence():
+    """Соединения без heartbeat считаются отключившимися"""
+    for game_id, user in presence.expire():
+        _emit_left(game_id, user)
+
 @socketio.on('join_game_room')
 def on_join_game_room(data):
     """Обработчик присоединения к игровой комнате"""
     if not current_user.is_authenticated:
         return
     
-    game_id = data.get('game_id')
-    if not game_id:
+    try:
+        game_id = int(data.get('game_id'))
+    except (TypeError, ValueError):
         return
     
     # Получаем игру и проверяем её статус
@@ -32,23 +109,24 @@ def on_join_game_room(data):
         return
     
     # Присоединяемся к комнате игры
-    room = f"game_{game_id}"
+    room = game_room(game_id)
     join_room(room)
+    _expire_presence()
     
-    # Если это игрок (не админ/модератор), отправляем уведомление о присоединении
-    if current_user.role == 'player':
-        # Проверяем, является ли пользователь участником игры
-        team_member = TeamMember.query.join(TeamMember.team).join(Game.teams).filter(
-            Game.id == game_id,
-            TeamMember.user_id == current_user.id
-        ).first()
-        
-        if team_member:
-            emit('player_joined', {
-                'user_id': current_user.id,
-                'username': current_user.username,
-                'team_id': team_member.team_id
-            }, room=room)
+    # История чата — из буфера в памяти
+    emit('chat_history', {'messages': chat.history(game_id)})
+    
+    # Команда игрока берется из кэша, повторные подключения не ходят в базу
+    team = identity_cache.get_team(current_user.id, game_id) if current_user.role == 'player' else None
+    user = Presence(current_user.id, current_user.username, current_user.role, team.team_id if team else None)
+    
+    # Уведомление о присоединении — только для первого соединения участника команды
+    if presence.join(request.sid, game_id, user) and team:
+        emit('player_joined', {
+            'user_id': user.user_id,
+            'username': user.username,
+            'team_id': user.team_id
+        }, room=room)
 
 @socketio.on('leave_game_room')
 def handle_leave_game_room(data):
@@ -56,21 +134,28 @@ def handle_leave_game_room(data):
     if not current_user.is_authenticated:
         return
     
-    game_id = data.get('game_id')
-    if not game_id:
+    try:
+        game_id = int(data.get('game_id'))
+    except (TypeError, ValueError):
         return
     
     # Покидаем комнату игры
-    room = f'game_{game_id}'
+    room = game_room(game_id)
     leave_room(room)
     
+    # Другие вкладки пользователя еще в комнате — он не уходил
+    user = presence.leave(request.sid, game_id)
+    if user is None:
+        return
+    _emit_left(game_id, user)
+    
     # Отправляем сообщение о выходе
-    emit('chat_message', {
-        'type': 'system',
-        'sender': 'Система',
-        'message': f'{current_user.username} покинул игру',
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=room)
+    emit('chat_message', chat.add(game_id, 'system', 'Система', f'{user.username} покинул игру'), room=room)
+
+@socketio.on('presence_ping')
+def on_presence_ping(data=None):
+    """Heartbeat клиента игровой комнаты; False — соединение истекло и клиенту нужно войти заново"""
+    return presence.touch(request.sid)
 
 @socketio.on('send_message')
 def handle_send_message(data):
@@ -78,60 +163,76 @@ def handle_send_message(data):
     if not current_user.is_authenticated:
         return
     
-    game_id = data.get('game_id')
-    message = data.get('message')
-    
-    if not game_id or not message:
+    try:
+        game_id = int(data.get('game_id'))
+    except (TypeError, ValueError):
         return
+    message = (data.get('message') or '').strip()
+    if not message:
+        return
+    presence.touch(request.sid)
     
-    # Проверяем, что пользователь имеет доступ к игре
-    game = Game.query.get(game_id)
-    if not game:
+    # Право писать в чат игры кэшируется, игра и команды не запрашиваются на каждое сообщение
+    if not chat.can_post(current_user.id, current_user.role, game_id):
         return
     
-    if current_user.role not in ['admin', 'moderator'] and \
-       not TeamMember.query.join(TeamMember.team).filter(
-           TeamMember.team.in_([t.id for t in game.teams]),
-           TeamMember.user_id == current_user.id
-       ).first():
+    if not chat.allow(current_user.id):
+        emit('error', {'message': 'Слишком много сообщений, подождите немного'})
         return
     
     # Отправляем сообщение всем в комнате
-    room = f'game_{game_id}'
-    emit('chat_message', {
-        'type': 'moderator' if current_user.role in ['admin', 'moderator'] else 'player',
-        'sender': current_user.username,
-        'message': message,
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=room)
+    message_type = 'moderator' if current_user.role in ['admin', 'moderator'] else 'player'
+    emit('chat_message', chat.add(game_id, message_type, current_user.username, message, current_user.id),
+         room=game_room(game_id))
 
 @socketio.on('disconnect')
 def on_disconnect():
-    """Обработчик отключения от сервера"""
-    if not current_user.is_authenticated:
-        return
-    
-    # Находим все игры, в которых участвует пользователь
-    team_members = TeamMember.query\
-        .join(TeamMember.team)\
-        .join(Team.games)\
-        .filter(
-            TeamMember.user_id == current_user.id,
-            Game.status.in_(['setup', 'ready', 'active'])
-        ).all()
-    
-    for team_member in team_members:
-        # Получаем игру через связь с командой
-        games = team_member.team.games
-        for game in games:
-            if game.status in ['setup', 'ready', 'active']:
-                room = f"game_{game.id}"
-                emit('player_left', {
-                    'user_id': current_user.id,
-                    'username': current_user.username,
-                    'team_id': team_member.team_id
-                }, room=room)
-                leave_room(room)
+    """Обработчик отключения от сервера: комнаты соединения известны из реестра присутствия"""
+    for game_id, user in presence.disconnect(request.sid):
+        _emit_left(game_id, user)
+
+# Размер очереди отправки клиента читается из внутренних атрибутов
+# python-engineio; если в установленной версии их нет, медленные клиенты
+# не определяются и получают все кадры
+_backlog_supported = True
+
+def _send_backlog(server, eio_sid) -> int:
+    """Пакетов в очереди отправки клиента; 0, если engineio не дает это узнать"""
+    global _backlog_supported
+    if not _backlog_supported:
+        return 0
+    try:
+        eio_socket = server.eio.sockets.get(eio_sid)
+        return eio_socket.queue.qsize() if eio_socket is not None else 0
+    except (AttributeError, TypeError, NotImplementedError) as e:
+        _backlog_supported = False
+        logger.warning(f"Очередь отправки клиентов engineio недоступна, пропуск кадров отключен: {e}")
+        return 0
+
+def _room_backlogs(room):
+    """(sid, пакетов в очереди отправки) для клиентов комнаты в этом процессе.
+
+    Клиенты других веб-процессов здесь не видны: им, как и без этой
+    проверки, отправляются все кадры.
+    """
+    server = socketio.server
+    if server is None:
+        return []
+    try:
+        participants = list(server.manager.get_participants('/', room))
+    except (KeyError, AttributeError):
+        return []
+    return [(sid, _send_backlog(server, eio_sid)) for sid, eio_sid in participants]
+
+def _scoreboard_diff(sent, current):
+    """Только команды, чей счет или название изменились с прошлой отправки"""
+    previous = {score['team_id']: score for score in sent['scores']}
+    changed = [score for score in current['scores'] if previous.get(score['team_id']) != score]
+    return {'scores': changed} if changed else None
+
+# Состояние комнат (игра, таблица результатов) отправляется не чаще раза в окно
+room_updates = EmitCoalescer(emit_to_room, _room_backlogs)
+room_updates.register_diff('scoreboard_update', _scoreboard_diff)
 
 def broadcast_game_state(game_id):
     """Отправляет обновление состояния игры всем участникам"""
@@ -139,25 +240,39 @@ def broadcast_game_state(game_id):
     if not game:
         return
     
-    room = f"game_{game_id}"
-    emit('game_state', {
+    room_updates.submit('game_state', {
         'status': game.status,
         'current_question_id': game.current_question_id
-    }, room=room, namespace='/')
+    }, game_room(game_id))
+    spectators.publish(game_id)
 
 def broadcast_scoreboard(game_id):
     """Отправляет обновление таблицы результатов всем участникам"""
-    game = Game.query.get(game_id)
-    if not game:
-        return
+    scores = [
+        {'team_id': team_id, 'name': name, 'total_score': score}
+        for team_id, name, score in scoreboards.ranking(game_id)
+    ]
     
-    scores = []
-    for team in game.teams:
-        scores.append({
-            'team_id': team.id,
-            'name': team.name,
-            'total_score': sum(answer.score or 0 for answer in team.answers)
-        })
-    
-    room = f"game_{game_id}"
-    emit('scoreboard_update', {'scores': scores}, room=room, namespace='/') 
\ No newline at end of file
+    room_updates.submit('scoreboard_update', {'scores': scores}, game_room(game_id))
+    spectators.publish(game_id)
+
+@socketio.on('connect', namespace=SPECTATOR_NAMESPACE)
+def on_spectator_connect():
+    """Экран зрителей подключается без входа; число зрителей процесса ограничено"""
+    if not spectators.connect():
+        raise ConnectionRefusedError('Слишком много зрителей, попробуйте позже')
+
+@socketio.on('disconnect', namespace=SPECTATOR_NAMESPACE)
+def on_spectator_disconnect():
+    spectators.disconnect()
+
+@socketio.on('watch', namespace=SPECTATOR_NAMESPACE)
+def on_watch(data):
+    """Подписка на игру по коду комнаты; ответ — текущий снимок игры"""
+    room_code = (data or {}).get('room_code')
+    game_id = spectators.find(room_code) if isinstance(room_code, str) else None
+    if game_id is None:
+        return {'status': 'deleted'}
+    # Сначала комната, потом снимок: изменения между ними не теряются
+    join_room(spectator_room(game_id))
+    return spectators.snapshot(game_id) 
\ No newline at end of file
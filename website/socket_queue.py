@@ -0,0 +1,70 @@
+"""Очередь сообщений Socket.IO между процессами.
+
+Сервер Socket.IO каждого веб-процесса подписывается на очередь, и рассылка
+в комнату доходит до клиентов всех процессов. Процессы без сервера (бот)
+публикуют события в ту же очередь (write_only).
+
+Адрес очереди — SOCKETIO_MESSAGE_QUEUE:
+    redis://host:6379/0   — Redis (нужен пакет redis)
+    amqp://...            — любой транспорт kombu (нужен пакет kombu)
+    memory://<канал>      — очередь внутри процесса, для проверок без брокера
+"""
+import json
+import queue
+import threading
+from typing import Dict, List
+from urllib.parse import urlparse
+
+import socketio as socketio_server
+
+
+class LocalManager(socketio_server.PubSubManager):
+    """Очередь внутри процесса: несколько серверов Socket.IO и издатели
+    в одном процессе обмениваются сообщениями так же, как через Redis.
+
+    Сообщения проходят через JSON, поэтому несериализуемые данные
+    обнаруживаются так же, как с настоящим брокером.
+    """
+    name = 'local'
+
+    _lock = threading.Lock()
+    _subscribers: Dict[str, List[queue.Queue]] = {}
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue = None
+
+    def initialize(self):
+        if not self.write_only:
+            # Подписываемся до запуска фонового потока, чтобы не потерять первые сообщения
+            self._queue = queue.Queue()
+            with self._lock:
+                self._subscribers.setdefault(self.channel, []).append(self._queue)
+        super().initialize()
+
+    def _publish(self, data):
+        message = json.dumps(data)
+        with self._lock:
+            subscribers = list(self._subscribers.get(self.channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+    @classmethod
+    def reset(cls):
+        """Отписывает все серверы (между проверками)"""
+        with cls._lock:
+            cls._subscribers.clear()
+
+
+def create_client_manager(url: str, write_only: bool = False) -> socketio_server.PubSubManager:
+    """Менеджер клиентов Socket.IO для адреса очереди"""
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return LocalManager(channel=urlparse(url).netloc or 'socketio', write_only=write_only)
+    if scheme in ('redis', 'rediss'):
+        return socketio_server.RedisManager(url, write_only=write_only)
+    return socketio_server.KombuManager(url, write_only=write_only)
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .identity_cache import TTLCache
+from .models import db, Game, Quiz, Question
+from .quiz_plan import quiz_plans
+from .scoreboard import scoreboards
+
+logger = logging.getLogger(__name__)
+
+# Пространство имен Socket.IO экрана зрителей: без входа, только чтение
+SPECTATOR_NAMESPACE = '/spectate'
+# Подключенный зритель, как и игрок, занимает поток веб-процесса (режим
+# threading, потоки gunicorn gthread — см. gunicorn.conf.py), поэтому
+# зрителей одного процесса не больше этого числа: остальные потоки — игрокам
+SPECTATOR_MAX_CONNECTIONS = int(os.getenv('SPECTATOR_MAX_CONNECTIONS', 50))
+# Снимок для вновь подключившихся зрителей перечитывается не чаще этого
+SPECTATOR_REFRESH = float(os.getenv('SPECTATOR_REFRESH', 2.0))
+# Изменения игры за это время рассылаются одним снимком
+SPECTATOR_PUBLISH_WINDOW = 0.5
+ROOM_CODE_TTL = 600         # секунд кэширования кода комнаты -> id игры
+GAME_MAX_IDLE = 3600        # секунд хранения снимка игры без изменений и новых зрителей
+
+
+def spectator_room(game_id) -> str:
+    return f"spectate_{game_id}"
+
+
+class _GameView:
+    __slots__ = ('lock', 'data', 'loaded_at')
+
+    def __init__(self):
+        self.lock = threading.Lock()       # один пересчет снимка на игру
+        self.data: Optional[dict] = None
+        self.loaded_at = 0.0
+
+
+class SpectatorHub:
+    """Снимки игр для экранов зрителей (проектор, трансляция).
+
+    Снимок — текущий вопрос без правильного ответа и таблица результатов.
+    Процесс, изменивший игру (веб или бот), вызывает publish: не чаще раза
+    в SPECTATOR_PUBLISH_WINDOW фоновый поток перечитывает снимок из базы и
+    отправляет его в комнату spectate_<id> пространства /spectate через
+    очередь Socket.IO, то есть зрителям всех веб-процессов. version снимка —
+    время начала чтения: клиент отбрасывает снимки старше показанного,
+    поэтому порядок доставки из разных процессов не важен.
+    """
+
+    def __init__(self, refresh: float = SPECTATOR_REFRESH, window: float = SPECTATOR_PUBLISH_WINDOW,
+                 max_connections: int = SPECTATOR_MAX_CONNECTIONS):
+        self.refresh = refresh
+        self.window = window
+        self.max_connections = max_connections
+        self._app = None
+        self._emit: Optional[Callable] = None     # emit(event, data, room, namespace=...)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._games: Dict[int, _GameView] = {}
+        self._pending: Dict[int, float] = {}      # id игры -> срок рассылки
+        self._codes = TTLCache(10000, ROOM_CODE_TTL)
+        self._connections = 0
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = time.monotonic()
+
+    def start(self, app, emit: Callable):
+        """Включает рассылку снимков; emit — socket.emit_to_room"""
+        self._app = app
+        self._emit = emit
+
+    def find(self, room_code: str) -> Optional[int]:
+        """id игры по коду комнаты (с кэшированием)"""
+        room_code = room_code.upper()
+        game_id = self._codes.get(room_code)
+        if game_id is None:
+            game_id = db.session.query(Game.id).filter(Game.room_code == room_code).scalar()
+            if game_id is None:
+                return None
+            self._codes.set(room_code, game_id)
+        return game_id
+
+    def connect(self) -> bool:
+        """Учитывает подключение зрителя; False, если процесс уже обслуживает предельное число"""
+        with self._lock:
+            if self._connections >= self.max_connections:
+                return False
+            self._connections += 1
+            return True
+
+    def disconnect(self):
+        with self._lock:
+            self._connections = max(self._connections - 1, 0)
+
+    def snapshot(self, game_id: int) -> dict:
+        """Снимок для нового зрителя: из памяти, если он моложе refresh.
+
+        Вызывается в контексте приложения.
+        """
+        with self._lock:
+            view = self._games.get(game_id)
+            if view is None:
+                view = self._games[game_id] = _GameView()
+        with view.lock:
+            if view.data is None or time.monotonic() - view.loaded_at > self.refresh:
+                self._store(game_id, view, self._build(game_id))
+            return view.data
+
+    def publish(self, game_id: int):
+        """Игра изменилась: зрители получат новый снимок через window секунд"""
+        if self._emit is None:
+            return
+        with self._lock:
+            self._pending.setdefault(game_id, time.monotonic() + self.window)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='spectator-publisher', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def forget(self, game_id: int):
+        """Забывает удаленную игру и сообщает об этом ее зрителям"""
+        self._codes.pop_where(lambda _, cached_id: cached_id == game_id)
+        with self._lock:
+            self._games.pop(game_id, None)
+            self._pending.pop(game_id, None)
+        self._send(game_id, {'status': 'deleted', 'version': time.time()})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'connections': self._connections, 'games': len(self._games), 'pending': len(self._pending)}
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                now = time.monotonic()
+                deadline = min(self._pending.values())
+                if deadline > now:
+                    self._wakeup.wait(deadline - now)
+                    continue
+                due = [game_id for game_id, deadline in self._pending.items() if deadline <= now]
+                for game_id in due:
+                    del self._pending[game_id]
+                    if game_id not in self._games:
+                        self._games[game_id] = _GameView()
+                views = [(game_id, self._games[game_id]) for game_id in due]
+                self._purge(now)
+            for game_id, view in views:
+                try:
+                    with self._app.app_context():
+                        with view.lock:
+                            data = self._build(game_id)
+                            self._store(game_id, view, data)
+                    self._send(game_id, data)
+                except Exception as e:
+                    logger.error(f"Ошибка рассылки снимка игры {game_id} зрителям: {e}")
+
+    def _send(self, game_id: int, data: dict):
+        if self._emit is not None:
+            self._emit('game_snapshot', data, spectator_room(game_id), namespace=SPECTATOR_NAMESPACE)
+
+    def _store(self, game_id: int, view: _GameView, data: dict):
+        view.data = data
+        view.loaded_at = time.monotonic()
+        if data['status'] == 'deleted':
+            self._codes.pop_where(lambda _, cached_id: cached_id == game_id)
+
+    def _build(self, game_id: int) -> dict:
+        version = time.time()
+        data = self._snapshot(game_id) or {'status': 'deleted'}
+        data['version'] = version
+        return data
+
+    def _snapshot(self, game_id: int) -> Optional[dict]:
+        """Снимок игры: одна выборка игры с текущим вопросом и таблица результатов"""
+        row = db.session.query(
+            Game.status, Game.room_code, Game.quiz_id, Game.current_question_id, Quiz.title,
+            Question.text, Question.type, Question.options
+        ).join(Quiz, Quiz.id == Game.quiz_id)\
+            .outerjoin(Question, Question.id == Game.current_question_id)\
+            .filter(Game.id == game_id).first()
+        if row is None:
+            return None
+
+        question = None
+        if row.text is not None and row.status in (Game.STATUS_ACTIVE, Game.STATUS_PAUSED):
+            _, entry = quiz_plans.locate(row.quiz_id, row.current_question_id)
+            question = {
+                'round': entry.round_title if entry else None,
+                'round_number': entry.round_number if entry else None,
+                'number': entry.question_number if entry else None,
+                'round_size': entry.round_size if entry else None,
+                'text': row.text,
+                'options': row.options if row.type == 'multiple_choice' else None
+            }
+        # Счет перечитывается: его мог изменить другой процесс
+        ranking = scoreboards.ranking(game_id, max_age=0)
+        return {
+            'title': row.title,
+            'status': row.status,
+            'room_code': row.room_code,
+            'question': question,
+            'scores': [
+                {'place': place, 'name': name, 'score': score}
+                for place, (_, name, score) in enumerate(ranking, 1)
+            ]
+        }
+
+    def _purge(self, now: float):
+        if now - self._last_purge < GAME_MAX_IDLE:
+            return
+        self._last_purge = now
+        for game_id in [game_id for game_id, view in self._games.items()
+                        if now - view.loaded_at > GAME_MAX_IDLE and game_id not in self._pending]:
+            del self._games[game_id]
+
+
+spectators = SpectatorHub()
@@ -1,16 +1,26 @@
-import os
 import random
 import string
-import asyncio
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from ..models import db, User, Quiz, Game, Team, Round, Question, TeamMember, Answer
-from .quiz_parser import parse_quiz_file
-from sqlalchemy import text
-import tempfile
-from docx import Document
+from .quiz_parser import FILE_TOO_LARGE_MESSAGE
+from ..scoreboard import scoreboards
+from ..quiz_plan import quiz_plans
+from ..quiz_clone import clone_quiz
+from ..quiz_editor import apply_quiz_edit, QuizEditError
+from ..identity_cache import identity_cache, share_invalidation
+from ..presence import presence
+from ..spectator import spectators
+from ..socket import room_updates
+from ..outbox import enqueue, enqueue_many, enqueue_control
+from ..jobs import import_jobs, import_cache, STAGE_DUPLICATE
+from ..deletion import (
+    delete_jobs, count_answers, delete_target, delete_team, invalidate_deleted,
+    DELETE_JOB_THRESHOLD
+)
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Создаем Blueprint с указанием URL-префикса
 admin = Blueprint('admin', __name__, url_prefix='/admin')
@@ -34,7 +44,9 @@ def index():
             'quizzes': quizzes_count,
             'active_games': active_games,
             'teams': teams_count
-        }
+        },
+        # Кэш разобранных файлов веб-процесса (загрузки через бота считаются в его процессе)
+        import_cache=import_cache.stats()
     )
 
 @admin.route('/quizzes')
@@ -139,8 +151,12 @@ def create_quiz():
     return redirect(url_for('admin.quizzes'))
 
 @admin.route('/quizzes/upload', methods=['POST'])
+@login_required
 def upload_quiz():
     """Загрузка квиза из файла"""
+    if current_user.role not in ['admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
     if 'file' not in request.files:
         return jsonify({'error': 'Файл не найден'}), 400
         
@@ -153,78 +169,77 @@ def upload_quiz():
         return jsonify({'error': 'Поддерживаются только файлы .txt и .docx'}), 400
 
     try:
-        # Сохраняем файл во временную директорию
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp_file:
-            file.save(tmp_file.name)
-            
-            # Читаем содержимое файла
-            if filename.endswith('.txt'):
-                with open(tmp_file.name, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            else:  # .docx
-                doc = Document(tmp_file.name)
-                content = '\n'.join(paragraph.text for paragraph in doc.paragraphs)
-            
-            # Удаляем временный файл
-            os.unlink(tmp_file.name)
-            
-            # Парсим содержимое
-            quiz = parse_quiz_content(content, current_user.id)
-            
-            return jsonify({
-                'success': True,
-                'quiz': {
-                    'id': quiz.id,
-                    'title': quiz.title,
-                    'rounds_count': len(quiz.rounds),
-                    'questions_count': sum(len(round.questions) for round in quiz.rounds)
-                }
-            })
-            
+        # Файл уже в памяти (размер ограничен MAX_CONTENT_LENGTH); разбор и сохранение
+        # выполняются в фоне, статус задачи доступен по job_url
+        file_type = 'txt' if filename.endswith('.txt') else 'docx'
+        job = import_jobs.submit(
+            current_app._get_current_object(), file.read(), file_type, file.filename, current_user.id
+        )
+
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'job_url': url_for('admin.job_status', job_id=job.id)
+        }), 202
+
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@admin.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Статус фоновой задачи (импорт, удаление)"""
+    if current_user.role not in ['admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    job = import_jobs.get(job_id) or delete_jobs.get(job_id)
+    if not job or (job.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'error': 'Задача не найдена'}), 404
+
+    return jsonify(job.to_dict())
+
+@admin.route('/jobs/<job_id>/copy', methods=['POST'])
+@login_required
+def import_job_copy(job_id):
+    """Создание копии уже загруженного квиза из файла задачи без повторного разбора"""
+    if current_user.role not in ['admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    job = import_jobs.get(job_id)
+    if not job or (job.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'error': 'Задача не найдена'}), 404
+    if job.stage != STAGE_DUPLICATE:
+        return jsonify({'error': 'Квиз из этого файла еще не загружен'}), 400
+
+    copy_job = import_jobs.submit_copy(current_app._get_current_object(), job, current_user.id)
+    return jsonify({
+        'success': True,
+        'job_id': copy_job.id,
+        'job_url': url_for('admin.job_status', job_id=copy_job.id)
+    }), 202
+
+@admin.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({'error': FILE_TOO_LARGE_MESSAGE}), 413
+
 @admin.route('/quizzes/<int:quiz_id>/delete', methods=['POST'])
 @login_required
 def delete_quiz(quiz_id):
     if current_user.role not in ['admin', 'moderator']:
         return jsonify({'error': 'Доступ запрещен'}), 403
     
+    quiz = Quiz.query.get_or_404(quiz_id)
+
     try:
-        quiz = Quiz.query.get_or_404(quiz_id)
-        
-        # Получаем все связанные игры
-        games = Game.query.filter_by(quiz_id=quiz.id).all()
-        
-        for game in games:
-            # Удаляем все ответы в игре
-            Answer.query.filter_by(game_id=game.id).delete(synchronize_session='fetch')
-            
-            # Очищаем связи с командами
-            game.teams = []
-            db.session.flush()
-        
-        # Удаляем все игры
-        Game.query.filter_by(quiz_id=quiz.id).delete(synchronize_session='fetch')
-        db.session.flush()
-        
-        # Удаляем все вопросы и раунды
-        for round in quiz.rounds:
-            # Удаляем все ответы на вопросы этого раунда
-            for question in round.questions:
-                Answer.query.filter_by(question_id=question.id).delete(synchronize_session='fetch')
-            
-            # Удаляем все вопросы раунда
-            Question.query.filter_by(round_id=round.id).delete(synchronize_session='fetch')
-        
-        # Удаляем все раунды
-        Round.query.filter_by(quiz_id=quiz.id).delete(synchronize_session='fetch')
-        db.session.flush()
-        
-        # Удаляем сам квиз
-        db.session.delete(quiz)
+        # Квиз, который много раз играли, удаляется фоновой задачей по частям
+        response = _start_delete_job('quiz', quiz.id)
+        if response is not None:
+            return response
+
+        game_ids = delete_target('quiz', quiz.id)
         db.session.commit()
-        
+        invalidate_deleted('quiz', quiz_id, game_ids)
+
         return jsonify({'success': True})
         
     except Exception as e:
@@ -232,6 +247,37 @@ def delete_quiz(quiz_id):
         print(f"Error deleting quiz: {str(e)}")  # Добавляем вывод ошибки в консоль
         return jsonify({'error': str(e)}), 500
 
+def _start_delete_job(target: str, target_id: int):
+    """Ставит удаление в фоновую задачу, если у квиза или игры много ответов.
+
+    Возвращает ответ 202 со ссылкой на статус задачи или None для удаления в запросе.
+    """
+    if count_answers(target, target_id) <= DELETE_JOB_THRESHOLD:
+        return None
+    job = delete_jobs.submit(current_app._get_current_object(), target, target_id, current_user.id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'job_url': url_for('admin.job_status', job_id=job.id)
+    }), 202
+
+@admin.route('/quizzes/<int:quiz_id>/clone', methods=['POST'])
+@login_required
+def clone_quiz_route(quiz_id):
+    """Копия квиза с раундами и вопросами"""
+    if current_user.role not in ['admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    try:
+        quiz = clone_quiz(quiz_id, current_user.id)
+        if quiz is None:
+            return jsonify({'error': 'Квиз не найден'}), 404
+        return jsonify({'success': True, 'quiz_id': quiz.id, 'title': quiz.title})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin.route('/quizzes/<int:quiz_id>/edit')
 @login_required
 def edit_quiz(quiz_id):
@@ -244,139 +290,25 @@ def edit_quiz(quiz_id):
 @admin.route('/quizzes/<int:quiz_id>/update', methods=['POST'])
 @login_required
 def update_quiz(quiz_id):
+    """Сохранение изменений из редактора квиза (см. apply_quiz_edit)"""
     if current_user.role not in ['admin', 'moderator']:
-        return "Доступ запрещен", 403
-    
-    quiz = Quiz.query.get_or_404(quiz_id)
+        return jsonify({'error': 'Доступ запрещен'}), 403
     
+    if not request.is_json:
+        return jsonify({'error': 'Ожидаются данные редактора в формате JSON'}), 400
+
     try:
-        # Обновляем название квиза
-        quiz.title = request.form.get('title')
-        
-        # Получаем существующие ID раундов и вопросов
-        existing_round_ids = {round.id for round in quiz.rounds}
-        existing_question_ids = set()
-        for round in quiz.rounds:
-            existing_question_ids.update(q.id for q in round.questions)
-        
-        # Собираем новые ID из формы
-        form_round_ids = set()
-        form_question_ids = set()
-        
-        # Обрабатываем данные формы
-        rounds_data = []
-        for key in request.form:
-            if key.startswith('rounds[') and '][title]' in key:
-                round_index = int(key.split('[')[1].split(']')[0])
-                round_id = request.form.get(f'rounds[{round_index}][id]')
-                round_title = request.form[key]
-                questions = []
-                
-                # Если есть ID, добавляем его в список
-                if round_id and round_id.isdigit():
-                    form_round_ids.add(int(round_id))
-                
-                # Собираем вопросы для текущего раунда
-                i = 0
-                while f'rounds[{round_index}][questions][{i}][text]' in request.form:
-                    question_id = request.form.get(f'rounds[{round_index}][questions][{i}][id]')
-                    question_text = request.form[f'rounds[{round_index}][questions][{i}][text]']
-                    question_type = request.form[f'rounds[{round_index}][questions][{i}][type]']
-                    
-                    # Если есть ID, добавляем его в список
-                    if question_id and question_id.isdigit():
-                        form_question_ids.add(int(question_id))
-                    
-                    # Обработка разных типов вопросов
-                    if question_type == 'multiple_choice':
-                        # Получаем варианты ответов
-                        options = request.form.getlist(f'rounds[{round_index}][questions][{i}][options][]')
-                        correct_option = int(request.form[f'rounds[{round_index}][questions][{i}][correct_option]'])
-                        
-                        questions.append({
-                            'id': question_id if question_id and question_id.isdigit() else None,
-                            'text': question_text,
-                            'type': question_type,
-                            'options': options,
-                            'answer': options[correct_option],
-                            'order': i + 1
-                        })
-                    else:
-                        # Для вопросов с ручным вводом
-                        question_answer = request.form[f'rounds[{round_index}][questions][{i}][answer]']
-                        questions.append({
-                            'id': question_id if question_id and question_id.isdigit() else None,
-                            'text': question_text,
-                            'type': question_type,
-                            'answer': question_answer,
-                            'order': i + 1
-                        })
-                    i += 1
-                
-                rounds_data.append({
-                    'id': round_id if round_id and round_id.isdigit() else None,
-                    'title': round_title,
-                    'order': round_index + 1,
-                    'questions': questions
-                })
-        
-        # Удаляем раунды и вопросы, которых нет в форме
-        rounds_to_delete = existing_round_ids - form_round_ids
-        questions_to_delete = existing_question_ids - form_question_ids
-        
-        if questions_to_delete:
-            Question.query.filter(Question.id.in_(questions_to_delete)).delete(synchronize_session=False)
-        
-        if rounds_to_delete:
-            Round.query.filter(Round.id.in_(rounds_to_delete)).delete(synchronize_session=False)
-        
-        # Обновляем или создаем раунды и вопросы
-        for round_data in rounds_data:
-            if round_data['id']:
-                # Обновляем существующий раунд
-                quiz_round = Round.query.get(round_data['id'])
-                quiz_round.title = round_data['title']
-                quiz_round.order = round_data['order']
-            else:
-                # Создаем новый раунд
-                quiz_round = Round(
-                    quiz_id=quiz.id,
-                    title=round_data['title'],
-                    order=round_data['order']
-                )
-                db.session.add(quiz_round)
-                db.session.flush()  # Получаем ID нового раунда
-            
-            # Обновляем или создаем вопросы
-            for question_data in round_data['questions']:
-                if question_data['id']:
-                    # Обновляем существующий вопрос
-                    question = Question.query.get(question_data['id'])
-                    question.text = question_data['text']
-                    question.type = question_data['type']
-                    question.correct_answer = question_data['answer']
-                    question.options = question_data.get('options')
-                    question.order = question_data['order']
-                else:
-                    # Создаем новый вопрос
-                    question = Question(
-                        round_id=quiz_round.id,
-                        text=question_data['text'],
-                        type=question_data['type'],
-                        correct_answer=question_data['answer'],
-                        options=question_data.get('options'),
-                        order=question_data['order']
-                    )
-                    db.session.add(question)
-        
-        db.session.commit()
-        flash('Квиз успешно обновлен', 'success')
-        
+        changes = apply_quiz_edit(quiz_id, request.get_json())
+        if changes is None:
+            return jsonify({'error': 'Квиз не найден'}), 404
+        return jsonify({'success': True, 'changes': changes})
+
+    except QuizEditError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        flash(f'Ошибка при обновлении квиза: {str(e)}', 'danger')
-    
-    return redirect(url_for('admin.edit_quiz', quiz_id=quiz_id))
+        return jsonify({'error': f'Ошибка при обновлении квиза: {str(e)}'}), 500
 
 @admin.route('/games')
 @login_required
@@ -393,54 +325,6 @@ def games():
                          quizzes=quizzes,
                          moderators=moderators)
 
-def alter_team_table():
-    """Изменяет структуру таблицы team, делая captain_id nullable"""
-    try:
-        # Проверяем текущее состояние колонки
-        result = db.session.execute(text("""
-            SELECT is_nullable 
-            FROM information_schema.columns 
-            WHERE table_name = 'team' 
-            AND column_name = 'captain_id';
-        """))
-        is_nullable = result.scalar()
-        
-        # Если колонка уже nullable, ничего не делаем
-        if is_nullable == 'YES':
-            print("Колонка captain_id уже nullable")
-            return
-            
-        # Проверяем наличие данных
-        result = db.session.execute(text("SELECT COUNT(*) FROM team;"))
-        count = result.scalar()
-        
-        if count > 0:
-            # Если есть данные, используем ALTER COLUMN
-            db.session.execute(text("""
-                ALTER TABLE team 
-                ALTER COLUMN captain_id DROP NOT NULL;
-            """))
-        else:
-            # Если данных нет, можно пересоздать таблицу
-            db.session.execute(text("""
-                DROP TABLE IF EXISTS team CASCADE;
-                
-                CREATE TABLE team (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    captain_id INTEGER REFERENCES "user"(id),
-                    join_code VARCHAR(6) UNIQUE NOT NULL,
-                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                );
-            """))
-            
-        db.session.commit()
-        print("Таблица team успешно изменена")
-    except Exception as e:
-        db.session.rollback()
-        print(f"Ошибка при изменении таблицы team: {e}")
-        raise
-
 @admin.route('/games/new')
 @login_required
 def new_game():
@@ -448,12 +332,6 @@ def new_game():
     if current_user.role not in ['admin', 'moderator']:
         return "Доступ запрещен", 403
     
-    try:
-        # Проверяем и изменяем структуру таблицы team
-        alter_team_table()
-    except Exception as e:
-        print(f"Ошибка при подготовке базы данных: {e}")
-    
     quizzes = Quiz.query.all()
     return render_template('admin/create_game.html', quizzes=quizzes)
 
@@ -521,31 +399,17 @@ def create_game():
             # Добавляем команду в игру
             game.teams.append(team)
 
-        db.session.commit()
-
-        # Отправляем уведомления всем участникам
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        message = (
-                            f"Вы добавлены в команду {team.name} для игры {game.quiz.title}.\n"
-                            f"Код для присоединения к игре: {game.join_code}"
-                        )
-                        tasks.append(bot.send_message(member.user.telegram_id, message))
-                
-                if tasks:  # Только если есть задачи для выполнения
-                    await asyncio.gather(*tasks, return_exceptions=True)
+        # Уведомления участникам уходят боту вместе с созданием игры
+        db.session.flush()
+        enqueue_many(
+            (member.user.telegram_id,
+             f"Вы добавлены в команду {team.name} для игры {game.quiz.title}.\n"
+             f"Код для присоединения к игре: {game.join_code}")
+            for team in game.teams
+            for member in team.members
+        )
 
-            # Запускаем асинхронную функцию
-            asyncio.run(send_notifications())
-            
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
+        db.session.commit()
 
         return jsonify({
             'success': True,
@@ -566,12 +430,14 @@ def delete_game(game_id):
     game = Game.query.get_or_404(game_id)
     
     try:
-        # Удаляем связанные ответы
-        Answer.query.filter_by(game_id=game.id).delete()
-        
-        # Удаляем саму игру
-        db.session.delete(game)
+        response = _start_delete_job('game', game.id)
+        if response is not None:
+            return response
+
+        # Ответы, связи с командами и саму игру удаляем наборными запросами
+        game_ids = delete_target('game', game.id)
         db.session.commit()
+        invalidate_deleted('game', game_id, game_ids)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -644,26 +510,15 @@ def add_team_to_game(game_id):
 
         # Добавляем команду в игру
         game.teams.append(team)
-        db.session.commit()
 
-        # Отправляем уведомление капитану через бота
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                loop.run_until_complete(bot.send_message(
-                    captain.telegram_id,
-                    f"Вы назначены капитаном команды {team.name} в игре {game.quiz.title}.\n"
-                    f"Код для присоединения к команде: {team.join_code}"
-                ))
-            finally:
-                loop.close()
-        except Exception as e:
-            print(f"Ошибка отправки уведомления: {e}")
+        # Уведомление капитану отправит бот
+        enqueue(
+            captain.telegram_id,
+            f"Вы назначены капитаном команды {team.name} в игре {game.quiz.title}.\n"
+            f"Код для присоединения к команде: {team.join_code}"
+        )
+        db.session.commit()
+        scoreboards.invalidate(game_id)
 
         return jsonify({
             'success': True,
@@ -696,19 +551,14 @@ def remove_team_from_game(game_id, team_id):
         if team not in game.teams:
             return jsonify({'error': 'Команда не найдена в этой игре'}), 404
         
-        # Удаляем команду из игры
-        game.teams.remove(team)
-        
-        # Удаляем все ответы команды в этой игре
-        Answer.query.filter_by(game_id=game.id, team_id=team.id).delete()
-        
-        # Удаляем участников команды
-        TeamMember.query.filter_by(team_id=team.id).delete()
-        
-        # Удаляем саму команду
-        db.session.delete(team)
+        # Удаляем команду вместе с ответами, участниками и участием в играх
+        delete_team(team.id)
+        share_invalidation('team', team_id=team_id)
+        enqueue_control('invalidate_scoreboard', game_id=game_id)
         
         db.session.commit()
+        scoreboards.invalidate(game_id)
+        identity_cache.invalidate_team(team_id)
         return jsonify({'success': True})
         
     except Exception as e:
@@ -774,7 +624,9 @@ def add_team_member(team_id):
         # Добавляем пользователя в команду
         team_member = TeamMember(team_id=team_id, user_id=user.id)
         db.session.add(team_member)
+        share_invalidation('membership', user_id=user.id)
         db.session.commit()
+        identity_cache.invalidate_membership(user.id)
 
         return jsonify({
             'success': True,
@@ -810,7 +662,9 @@ def remove_team_member(team_id, user_id):
             return jsonify({'error': 'Пользователь не является участником команды'}), 404
 
         db.session.delete(member)
+        share_invalidation('membership', user_id=user_id)
         db.session.commit()
+        identity_cache.invalidate_membership(user_id)
 
         return jsonify({'success': True})
 
@@ -844,7 +698,9 @@ def change_team_captain(team_id):
         # Меняем капитана
         old_captain_id = team.captain_id
         team.captain_id = new_captain.id
+        share_invalidation('team', team_id=team_id)
         db.session.commit()
+        identity_cache.invalidate_team(team_id)
 
         return jsonify({
             'success': True,
@@ -905,7 +761,9 @@ def add_moderator():
             return redirect(url_for('admin.moderators'))
         
         user.role = 'moderator'
+        share_invalidation('user', user_id=user.id)
         db.session.commit()
+        identity_cache.invalidate_user(user_id=user.id)
         flash('Модератор успешно добавлен', 'success')
         
     except Exception as e:
@@ -939,7 +797,9 @@ def delete_moderator(user_id):
             game.moderator_id = current_user.id  # Передаем игру текущему админу
         
         user.role = 'player'
+        share_invalidation('user', user_id=user.id)
         db.session.commit()
+        identity_cache.invalidate_user(user_id=user.id)
         
         # Если были переданы игры, возвращаем информацию об этом
         if active_games:
@@ -967,8 +827,38 @@ def game_room(game_id):
     if game.status == Game.STATUS_SETUP:
         return redirect(url_for('admin.manage_game', game_id=game_id))
     
+    # Код комнаты для зрителей у игр, подготовленных до его появления
+    if not game.room_code:
+        game.generate_room_code()
+        db.session.commit()
+    
     return render_template('admin/game_room.html', game=game)
 
+@admin.route('/games/<int:game_id>/online')
+@login_required
+def game_online(game_id):
+    """Кто подключен к комнате игры (по соединениям этого веб-процесса)"""
+    if current_user.role not in ['admin', 'moderator']:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    online = [user for user in presence.online(game_id) if user.team_id is not None]
+    return jsonify({
+        'online': [
+            {'user_id': user.user_id, 'username': user.username, 'team_id': user.team_id}
+            for user in online
+        ],
+        'count': len(online)
+    })
+
+@admin.route('/socket/stats')
+@login_required
+def socket_stats():
+    """Частота отправок в игровые комнаты, число соединений и игр со зрителями этого веб-процесса"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    return jsonify({'rooms': room_updates.stats(), 'presence': presence.stats(), 'spectators': spectators.stats()})
+
 @admin.route('/games/<int:game_id>/ready', methods=['POST'])
 @login_required
 def ready_game(game_id):
@@ -992,40 +882,28 @@ def ready_game(game_id):
         
         # Меняем статус игры
         game.status = Game.STATUS_READY
+        if not game.room_code:
+            game.generate_room_code()
         print(f"Новый статус игры {game_id}: '{game.status}'")
+
+        # Уведомления участникам фиксируются вместе со сменой статуса
+        enqueue_many(
+            (member.user.telegram_id,
+             f"Игра {game.quiz.title} готова к началу!\n"
+             f"Вы уже добавлены в команду {team.name}.\n"
+             f"Для присоединения к игре используйте команду:\n"
+             f"/join {game.join_code}")
+            for team in game.teams
+            for member in team.members
+        )
         db.session.commit()
+        spectators.publish(game.id)
         print(f"Статус после коммита: '{game.status}'")
         print(f"Проверка статуса: {game.status == Game.STATUS_READY}")
         print(f"Длина статуса: {len(game.status)}, длина константы: {len(Game.STATUS_READY)}")
         print(f"Байты статуса: {game.status.encode()}")
         print(f"Байты константы: {Game.STATUS_READY.encode()}")
 
-        # Отправляем уведомления всем участникам через бота
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        tasks.append(bot.send_message(
-                            member.user.telegram_id,
-                            f"Игра {game.quiz.title} готова к началу!\n"
-                            f"Вы уже добавлены в команду {team.name}.\n"
-                            f"Для присоединения к игре используйте команду:\n"
-                            f"/join {game.join_code}"
-                        ))
-                
-                if tasks:  # Только если есть задачи для выполнения
-                    await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Запускаем асинхронную функцию
-            asyncio.run(send_notifications())
-            
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
-        
         # Перенаправляем на страницу игровой комнаты
         return jsonify({
             'success': True,
@@ -1059,38 +937,21 @@ def start_game(game_id):
         game.status = Game.STATUS_ACTIVE
         
         # Берем первый вопрос первого раунда
-        first_round = Round.query.filter_by(quiz_id=game.quiz_id, order=1).first()
-        if first_round:
-            first_question = Question.query.filter_by(round_id=first_round.id, order=1).first()
-            if first_question:
-                game.current_question_id = first_question.id
-        
+        first_question = quiz_plans.get(game.quiz_id).first()
+        if first_question:
+            game.current_question_id = first_question.question_id
+
+        # Уведомления участникам фиксируются вместе со стартом игры
+        enqueue_many(
+            (member.user.telegram_id,
+             f"Игра {game.quiz.title} началась!\n"
+             f"Вы играете за команду {team.name}.")
+            for team in game.teams
+            for member in team.members
+        )
         db.session.commit()
+        spectators.publish(game.id)
 
-        # Отправляем уведомления всем участникам через бота
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        tasks.append(bot.send_message(
-                            member.user.telegram_id,
-                            f"Игра {game.quiz.title} началась!\n"
-                            f"Вы играете за команду {team.name}."
-                        ))
-                
-                if tasks:
-                    await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Запускаем асинхронную функцию
-            asyncio.run(send_notifications())
-            
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
-        
         return jsonify({
             'success': True,
             'game': {
@@ -1132,7 +993,11 @@ def update_team_score(game_id, team_id):
         
         if answer:
             answer.score = float(data['score'])
+            # Таблицы бота и других веб-процессов пересобираются вместе с изменением
+            enqueue_control('invalidate_scoreboard', game_id=game_id)
             db.session.commit()
+            # Таблица этого процесса могла не знать об ответах, оцененных ботом
+            scoreboards.invalidate(game_id)
             
             # Отправляем обновление всем участникам
             from ..socket import broadcast_scoreboard
@@ -1159,93 +1024,51 @@ def next_question(game_id):
         if game.status != Game.STATUS_ACTIVE:
             return jsonify({'error': 'Игра не активна'}), 400
         
-        # Получаем текущий раунд и вопрос
-        current_round = None
-        current_question = None
-        if game.current_question_id:
-            current_question = Question.query.get(game.current_question_id)
-            current_round = current_question.round
-
-        # Ищем следующий вопрос
-        next_question = None
-        if current_question:
-            # Пробуем найти следующий вопрос в текущем раунде
-            next_question = Question.query.filter_by(
-                round_id=current_round.id,
-                order=current_question.order + 1
-            ).first()
+        # Следующий вопрос по плану квиза (первый, если текущего нет)
+        plan, _ = quiz_plans.locate(game.quiz_id, game.current_question_id)
+        next_entry = plan.next(game.current_question_id)
 
-            if not next_question:
-                # Если вопросов в текущем раунде больше нет, переходим к следующему раунду
-                next_round = Round.query.filter_by(
-                    quiz_id=game.quiz_id,
-                    order=current_round.order + 1
-                ).first()
-
-                if next_round:
-                    next_question = Question.query.filter_by(
-                        round_id=next_round.id,
-                        order=1
-                    ).first()
-        else:
-            # Если текущего вопроса нет, берем первый вопрос первого раунда
-            first_round = Round.query.filter_by(quiz_id=game.quiz_id, order=1).first()
-            if first_round:
-                next_question = Question.query.filter_by(
-                    round_id=first_round.id,
-                    order=1
-                ).first()
-
-        if not next_question:
+        if not next_entry:
             return jsonify({'error': 'Больше нет вопросов'}), 400
 
-        # Обновляем текущий вопрос
-        game.current_question_id = next_question.id
-        db.session.commit()
+        # Обновляем текущий вопрос; таймер прежнего вопроса в боте больше не нужен
+        game.current_question_id = next_entry.question_id
+        enqueue_control('cancel_timer', game_id=game.id)
+        next_question = db.session.get(Question, next_entry.question_id)
 
-        # Получаем информацию о текущем раунде и общем количестве раундов
-        total_rounds = Round.query.filter_by(quiz_id=game.quiz_id).count()
-        total_questions_in_round = len(next_question.round.questions)
+        # Информация о текущем раунде и общем количестве раундов
+        total_rounds = plan.total_rounds
+        total_questions_in_round = next_entry.round_size
 
         # Формируем сообщения для разных ролей
         admin_message = (
             f"📍 Текущее положение:\n"
-            f"Раунд {next_question.round.order} из {total_rounds}: {next_question.round.title}\n"
+            f"Раунд {next_entry.round_order} из {total_rounds}: {next_entry.round_title}\n"
             f"Вопрос {next_question.order} из {total_questions_in_round}\n\n"
             f"📚 Следующий раунд:\n"
-            f"Переходим к раунду {next_question.round.order + 1} из {total_rounds}: {next_question.round.title}\n"
+            f"Переходим к раунду {next_entry.round_order + 1} из {total_rounds}: {next_entry.round_title}\n"
             f"Начнем с вопроса {next_question.order} из {total_questions_in_round}\n"
             f"Тип: {'Выбор варианта' if next_question.type == 'multiple_choice' else 'Свободный ответ'}"
         )
 
         player_message = (
-            f"📍 Текущий раунд: {next_question.round.title} (Раунд {next_question.round.order} из {total_rounds})\n"
+            f"📍 Текущий раунд: {next_entry.round_title} (Раунд {next_entry.round_order} из {total_rounds})\n"
             f"❓ Вопрос {next_question.order} из {total_questions_in_round}\n"
             f"⭐ Тип вопроса: {'Выбор варианта' if next_question.type == 'multiple_choice' else 'Свободный ответ'}\n"
             f"⏱ Время на ответ: {next_question.time_limit} секунд\n"
             f"💎 Баллы за правильный ответ: {next_question.points}"
         )
 
-        # Отправляем уведомления
-        try:
-            from bot.bot import bot
-            import asyncio
-
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        # Определяем, какое сообщение отправить
-                        message = admin_message if member.user.role in ['admin', 'moderator'] else player_message
-                        tasks.append(bot.send_message(member.user.telegram_id, message))
-
-                if tasks:
-                    await asyncio.gather(*tasks, return_exceptions=True)
-
-            asyncio.run(send_notifications())
-
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
+        # Уведомления фиксируются вместе со сменой вопроса
+        enqueue_many(
+            (member.user.telegram_id,
+             # Определяем, какое сообщение отправить
+             admin_message if member.user.role in ['admin', 'moderator'] else player_message)
+            for team in game.teams
+            for member in team.members
+        )
+        db.session.commit()
+        spectators.publish(game.id)
 
         return jsonify({
             'success': True,
@@ -1258,9 +1081,9 @@ def next_question(game_id):
                 'points': next_question.points,
                 'time_limit': next_question.time_limit,
                 'round': {
-                    'id': next_question.round.id,
-                    'title': next_question.round.title,
-                    'order': next_question.round.order,
+                    'id': next_entry.round_id,
+                    'title': next_entry.round_title,
+                    'order': next_entry.round_order,
                     'total_rounds': total_rounds,
                     'total_questions': total_questions_in_round
                 }
@@ -1303,7 +1126,11 @@ def update_team(team_id):
                 
             team.name = new_name
 
+        share_invalidation('team', team_id=team_id)
         db.session.commit()
+        for game in team.games:
+            scoreboards.invalidate(game.id)
+        identity_cache.invalidate_team(team_id)
         
         return jsonify({
             'success': True,
@@ -1344,41 +1171,26 @@ def transfer_team_captain(team_id):
         # Сохраняем старого капитана для ответа
         old_captain_id = team.captain_id
         
-        # Отправляем уведомления через бота
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_captain_notifications():
-                tasks = []
-                
-                # Если был старый капитан, отправляем ему уведомление
-                if old_captain_id:
-                    old_captain = User.query.get(old_captain_id)
-                    if old_captain:
-                        tasks.append(bot.send_message(
-                            old_captain.telegram_id,
-                            f"Вы больше не являетесь капитаном команды {team.name}"
-                        ))
-                
-                # Отправляем уведомление новому капитану
-                tasks.append(bot.send_message(
-                    new_captain.telegram_id,
-                    f"Вы назначены новым капитаном команды {team.name}"
-                ))
-                
-                if tasks:  # Только если есть задачи для выполнения
-                    await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Запускаем асинхронную функцию
-            asyncio.run(send_captain_notifications())
-                
-        except Exception as e:
-            print(f"Ошибка отправки уведомления: {e}")
+        # Если был старый капитан, отправляем ему уведомление
+        if old_captain_id:
+            old_captain = User.query.get(old_captain_id)
+            if old_captain:
+                enqueue(
+                    old_captain.telegram_id,
+                    f"Вы больше не являетесь капитаном команды {team.name}"
+                )
+
+        # Отправляем уведомление новому капитану
+        enqueue(
+            new_captain.telegram_id,
+            f"Вы назначены новым капитаном команды {team.name}"
+        )
 
         # Меняем капитана
         team.captain_id = new_captain_id
+        share_invalidation('team', team_id=team_id)
         db.session.commit()
+        identity_cache.invalidate_team(team_id)
 
         return jsonify({
             'success': True,
@@ -1414,43 +1226,21 @@ def broadcast_message(game_id):
         if not message:
             return jsonify({'error': 'Сообщение не может быть пустым'}), 400
 
-        # Отправляем сообщение всем участникам через бота
-        from bot.bot import bot
-        sent_count = 0
-        errors = []
-        
-        # Создаем и запускаем event loop для асинхронных операций
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Собираем все задачи отправки сообщений
-            tasks = []
-            for team in game.teams:
-                for member in team.members:
-                    tasks.append(bot.send_message(member.user.telegram_id, message))
-            
-            # Запускаем все задачи параллельно
-            results = loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
-            
-            # Подсчитываем успешные отправки и ошибки
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    member = next((m for t in game.teams for m in t.members))[i]
-                    errors.append(f"Ошибка отправки {member.user.username}: {str(result)}")
-                else:
-                    sent_count += 1
-                    
-        finally:
-            loop.close()
+        # Ставим сообщение в очередь для всех участников, отправит его бот
+        queued_count = enqueue_many(
+            (member.user.telegram_id, message)
+            for team in game.teams
+            for member in team.members
+        )
+        db.session.commit()
 
         return jsonify({
             'success': True,
-            'sent_count': sent_count,
-            'errors': errors
+            'queued_count': queued_count
         })
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @admin.route('/games/<int:game_id>/scores', methods=['POST'])
@@ -1489,7 +1279,11 @@ def update_team_scores(game_id):
                     )
                     db.session.add(answer)
 
+        # Таблицы бота и других веб-процессов пересобираются вместе с изменением
+        enqueue_control('invalidate_scoreboard', game_id=game_id)
         db.session.commit()
+        # Таблица этого процесса могла не знать об ответах, оцененных ботом
+        scoreboards.invalidate(game_id)
 
         # Обновляем таблицу результатов через WebSocket
         from ..socket import broadcast_scoreboard
@@ -1534,29 +1328,15 @@ def pause_game(game_id):
             return jsonify({'error': 'Игра не активна'}), 400
         
         game.status = Game.STATUS_PAUSED
+        # Бот остановит отсчет времени на текущий вопрос
+        enqueue_control('pause', game_id=game.id)
+        enqueue_many(
+            (member.user.telegram_id, "Игра приостановлена. Ожидайте продолжения.")
+            for team in game.teams
+            for member in team.members
+        )
         db.session.commit()
-        
-        # Отправляем уведомления
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        tasks.append(bot.send_message(
-                            member.user.telegram_id,
-                            "Игра приостановлена. Ожидайте продолжения."
-                        ))
-                
-                if tasks:
-                    await asyncio.gather(*tasks, return_exceptions=True)
-            
-            asyncio.run(send_notifications())
-            
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
+        spectators.publish(game.id)
         
         return jsonify({'success': True})
         
@@ -1578,29 +1358,14 @@ def resume_game(game_id):
             return jsonify({'error': 'Игра не на паузе'}), 400
         
         game.status = Game.STATUS_ACTIVE
+        enqueue_control('resume', game_id=game.id)
+        enqueue_many(
+            (member.user.telegram_id, "Игра продолжается!")
+            for team in game.teams
+            for member in team.members
+        )
         db.session.commit()
-        
-        # Отправляем уведомления
-        try:
-            from bot.bot import bot
-            import asyncio
-            
-            async def send_notifications():
-                tasks = []
-                for team in game.teams:
-                    for member in team.members:
-                        tasks.append(bot.send_message(
-                            member.user.telegram_id,
-                            "Игра продолжается!"
-                        ))
-                
-                if tasks:
-                    await asyncio.gather(*tasks, return_exceptions=True)
-            
-            asyncio.run(send_notifications())
-            
-        except Exception as e:
-            print(f"Ошибка отправки уведомлений: {e}")
+        spectators.publish(game.id)
         
         return jsonify({'success': True})
         
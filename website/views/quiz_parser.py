@@ -1,133 +1,211 @@
+import hashlib
+import io
+import os
 import re
 from docx import Document
-from typing import Dict, List, Optional, Tuple
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from sqlalchemy import insert
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from ..models import db, Quiz, Round, Question
 
+# Грамматика файла квиза:
+#   # Название          — название квиза, следующая строка до раунда — описание
+#   ## Раунд            — начало раунда
+#   1. Текст вопроса    — начало вопроса внутри раунда
+#   Тип: / Ответ: / Варианты: / Баллы: / Время: — параметры вопроса
+_QUESTION = re.compile(r'\d+\.')
+_FIELDS = frozenset(('Тип', 'Ответ', 'Варианты', 'Баллы', 'Время'))
+
+# Максимальный размер загружаемого файла квиза в байтах
+MAX_QUIZ_FILE_SIZE = int(os.getenv('QUIZ_MAX_FILE_SIZE', 10 * 1024 * 1024))
+FILE_TOO_LARGE_MESSAGE = f"Файл слишком большой: допускается не больше {MAX_QUIZ_FILE_SIZE // (1024 * 1024)} МБ"
+
+
+class ParseError(NamedTuple):
+    """Замечание к строке файла квиза"""
+    line: int
+    message: str
+
+    def __str__(self):
+        return f"строка {self.line}: {self.message}"
+
+
+class QuizParseError(ValueError):
+    """Файл квиза не удалось разобрать"""
+
+    def __init__(self, errors: List[ParseError]):
+        self.errors = errors
+        super().__init__('; '.join(str(error) for error in errors))
+
+
+class ParsedQuestion:
+    __slots__ = ('line', 'text', 'type', 'correct_answer', 'options', 'correct_option', 'points', 'time_limit')
+
+    def __init__(self, line: int, text: str):
+        self.line = line
+        self.text = text
+        self.type = None
+        self.correct_answer = None
+        self.options = []
+        self.correct_option = None
+        self.points = 1
+        self.time_limit = 30
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.text and self.type and self.correct_answer)
+
+
+class ParsedRound:
+    __slots__ = ('line', 'title', 'questions')
+
+    def __init__(self, line: int, title: str):
+        self.line = line
+        self.title = title
+        self.questions: List[ParsedQuestion] = []
+
+
 class QuizParser:
-    def __init__(self):
+    """Однопроходный разбор квиза из любой последовательности строк.
+
+    Замечания (пропущенные неполные вопросы, нераспознанные строки и т.п.)
+    собираются в errors с номерами строк; в строгом режиме при их наличии
+    разбор завершается QuizParseError. Некорректные баллы или время
+    прерывают разбор в любом режиме.
+    """
+
+    def __init__(self, strict: bool = False):
+        self.strict = strict
         self.quiz_title = ""
         self.quiz_description = ""
-        self.current_round = None
-        self.rounds = []
+        self.current_round: Optional[ParsedRound] = None
+        self.rounds: List[ParsedRound] = []
+        self.errors: List[ParseError] = []
 
-    def parse_txt(self, file_content: str) -> Tuple[str, str, List[Dict]]:
-        """Парсит содержимое .txt файла"""
-        lines = file_content.split('\n')
+    def parse_lines(self, lines: Iterable[str]) -> Tuple[str, str, List[ParsedRound]]:
+        """Разбирает строки файла квиза (файл, поток загрузки, абзацы документа)"""
+        question_match = _QUESTION.match
+        current_round = self.current_round
         current_question = None
-        
-        for line_number, line in enumerate(lines):
+
+        for line_number, line in enumerate(lines, 1):
             line = line.strip()
-            if not line or line.startswith('==='): continue
-            
-            # Парсим название квиза
+            if not line or line.startswith('==='):
+                continue
+
+            # Название квиза
             if line.startswith('# '):
                 self.quiz_title = line[2:].strip()
-                print(f"Название квиза: {self.quiz_title}")
                 continue
-            
-            # Парсим описание квиза
-            if self.quiz_title and not line.startswith('##') and not self.current_round:
+
+            # Описание квиза — строки между названием и первым раундом
+            if not current_round and self.quiz_title and not line.startswith('##'):
                 if not line.startswith('Тип:') and not line.startswith('Ответ:'):
-                    self.quiz_description = line.strip()
-                    print(f"Описание квиза: {self.quiz_description}")
+                    self.quiz_description = line
                 continue
-            
-            # Парсим раунд
+
+            # Раунд
             if line.startswith('## '):
-                # Сохраняем предыдущий вопрос в текущий раунд, если он есть
-                if (current_question and self.current_round and
-                    current_question.get('text') and 
-                    current_question.get('type') and 
-                    current_question.get('correct_answer')):
-                    print(f"Сохраняем последний вопрос раунда: {current_question['text']}")
-                    self.current_round['questions'].append(current_question)
+                # Неполный вопрос не сохраняется и переходит в новый раунд
+                if current_question and current_round and current_question.complete:
+                    current_round.questions.append(current_question)
                     current_question = None
-                
-                # Создаем новый раунд
-                round_data = {
-                    'title': line[3:].strip(),
-                    'questions': []
-                }
-                self.rounds.append(round_data)
-                self.current_round = round_data
-                print(f"\nНовый раунд: {round_data['title']}")
+
+                current_round = self.current_round = ParsedRound(line_number, line[3:].strip())
+                self.rounds.append(current_round)
                 continue
-            
-            # Парсим вопрос
-            if self.current_round:
-                # Новый вопрос начинается с цифры и точки
-                if re.match(r'^\d+\.', line):
-                    # Сохраняем предыдущий вопрос, если он полностью заполнен
-                    if (current_question and 
-                        current_question.get('text') and 
-                        current_question.get('type') and 
-                        current_question.get('correct_answer')):
-                        print(f"Сохраняем вопрос: {current_question['text']}")
-                        self.current_round['questions'].append(current_question)
-                    
-                    # Создаем новый вопрос
-                    current_question = {
-                        'text': line.split('.', 1)[1].strip(),
-                        'type': None,
-                        'correct_answer': None,
-                        'options': [],  # Пустой список по умолчанию
-                        'points': 1,
-                        'time_limit': 30
-                    }
-                    print(f"\nНовый вопрос: {current_question['text']}")
-                    continue
-                
-                # Парсим параметры вопроса
+
+            if not current_round:
+                continue
+
+            # Новый вопрос начинается с цифры и точки
+            if question_match(line):
                 if current_question:
-                    if line.startswith('Тип:'):
-                        current_question['type'] = line.split(':', 1)[1].strip()
-                        print(f"Тип вопроса: {current_question['type']}")
-                    elif line.startswith('Ответ:'):
-                        current_question['correct_answer'] = line.split(':', 1)[1].strip()
-                        print(f"Правильный ответ: {current_question['correct_answer']}")
-                    elif line.startswith('Варианты:'):
-                        options = line.split(':', 1)[1].strip()
-                        current_question['options'] = [opt.strip() for opt in options.split(';')]
-                        print(f"Варианты ответов: {current_question['options']}")
-                        # Находим индекс правильного ответа
-                        if current_question['type'] == 'multiple_choice':
-                            try:
-                                current_question['correct_option'] = current_question['options'].index(current_question['correct_answer'])
-                                print(f"Индекс правильного ответа: {current_question['correct_option']}")
-                            except ValueError:
-                                current_question['correct_option'] = 0
-                    elif line.startswith('Баллы:'):
-                        current_question['points'] = float(line.split(':', 1)[1].strip())
-                        print(f"Баллы: {current_question['points']}")
-                    elif line.startswith('Время:'):
-                        current_question['time_limit'] = int(line.split(':', 1)[1].strip())
-                        print(f"Время: {current_question['time_limit']}")
-        
-        # Добавляем последний вопрос, если он есть и полностью заполнен
-        if (current_question and self.current_round and
-            current_question.get('text') and 
-            current_question.get('type') and 
-            current_question.get('correct_answer')):
-            print(f"\nСохраняем последний вопрос: {current_question['text']}")
-            self.current_round['questions'].append(current_question)
-        
-        print("\nИтоговая структура:")
-        for round_data in self.rounds:
-            print(f"\nРаунд: {round_data['title']}")
-            print(f"Количество вопросов: {len(round_data['questions'])}")
-            for q in round_data['questions']:
-                print(f"- {q['text']} (Тип: {q['type']})")
-        
+                    self._close_question(current_question)
+                current_question = ParsedQuestion(line_number, line.split('.', 1)[1].strip())
+                continue
+
+            if not current_question:
+                continue
+
+            # Параметр вопроса: имя до первого двоеточия
+            name, colon, value = line.partition(':')
+            if not colon or name not in _FIELDS:
+                self._warn(line_number, f"Нераспознанная строка: {line[:50]}")
+                continue
+
+            value = value.strip()
+            if name == 'Тип':
+                current_question.type = value
+            elif name == 'Ответ':
+                current_question.correct_answer = value
+            elif name == 'Варианты':
+                current_question.options = [option.strip() for option in value.split(';')]
+                if current_question.type == 'multiple_choice':
+                    try:
+                        current_question.correct_option = current_question.options.index(current_question.correct_answer)
+                    except ValueError:
+                        current_question.correct_option = 0
+                        self._warn(line_number, "Правильный ответ не найден среди вариантов, выбран первый")
+            elif name == 'Баллы':
+                current_question.points = self._number(float, value, line_number, "Баллы")
+            else:
+                current_question.time_limit = self._number(int, value, line_number, "Время")
+
+        # Последний вопрос
+        if current_question and current_round:
+            self._close_question(current_question)
+
+        self.errors.sort()
+        if self.strict and self.errors:
+            raise QuizParseError(self.errors)
         return self.quiz_title, self.quiz_description, self.rounds
 
-    def parse_docx(self, file_path: str) -> Tuple[str, str, List[Dict]]:
-        """Парсит .docx файл"""
-        doc = Document(file_path)
-        content = '\n'.join(paragraph.text for paragraph in doc.paragraphs)
-        return self.parse_txt(content)
+    def parse_txt(self, file_content: str) -> Tuple[str, str, List[ParsedRound]]:
+        """Парсит содержимое .txt файла"""
+        return self.parse_lines(io.StringIO(file_content, newline='\n'))
+
+    def parse_docx(self, file_path) -> Tuple[str, str, List[ParsedRound]]:
+        """Парсит .docx файл (путь или открытый двоичный поток)"""
+        return self.parse_lines(_docx_lines(Document(file_path)))
+
+    def parse_stream(self, stream: BinaryIO, file_type: str) -> Tuple[str, str, List[ParsedRound]]:
+        """Парсит файл квиза из двоичного потока без записи на диск"""
+        if file_type == 'txt':
+            text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+            try:
+                return self.parse_lines(text)
+            finally:
+                # Поток принадлежит вызывающему, не закрываем его вместе с оберткой
+                text.detach()
+        if file_type == 'docx':
+            return self.parse_docx(stream)
+        raise ValueError(f"Неподдерживаемый тип файла: {file_type}")
+
+    def _close_question(self, question: ParsedQuestion):
+        if question.complete:
+            self.current_round.questions.append(question)
+            return
+        missing = 'тип' if not question.type else 'ответ' if not question.correct_answer else 'текст'
+        self._warn(question.line, f"Вопрос пропущен: не указан {missing}")
 
-    def save_to_db(self, user_id: int) -> Quiz:
-        """Сохраняет распарсенный квиз в базу данных"""
+    def _warn(self, line_number: int, message: str):
+        self.errors.append(ParseError(line_number, message))
+
+    def _number(self, convert, value: str, line_number: int, name: str):
+        try:
+            return convert(value)
+        except ValueError:
+            raise QuizParseError([ParseError(line_number, f"{name}: некорректное значение «{value}»")])
+
+    def save_to_db(self, user_id: int, bulk: bool = True) -> Quiz:
+        """Сохраняет распарсенный квиз в базу данных одной транзакцией.
+
+        В режиме bulk раунды вставляются одним INSERT ... RETURNING, а вопросы —
+        одним пакетным INSERT. bulk=False — построчные INSERT через unit of work
+        ORM (для сравнения, см. benchmarks.save_quiz).
+        """
         quiz = Quiz(
             title=self.quiz_title,
             description=self.quiz_description,
@@ -135,32 +213,125 @@ class QuizParser:
         )
         db.session.add(quiz)
         db.session.flush()  # Получаем ID квиза
-        
+
+        if bulk:
+            self._insert_bulk(quiz.id)
+        else:
+            self._insert_orm(quiz.id)
+
+        db.session.commit()
+        return quiz
+
+    def _insert_bulk(self, quiz_id: int):
+        if not self.rounds:
+            return
+        # ID раундов возвращаются в порядке переданных строк
+        round_ids = db.session.scalars(
+            insert(Round).returning(Round.id, sort_by_parameter_order=True),
+            [
+                {'quiz_id': quiz_id, 'title': round_data.title, 'order': round_idx}
+                for round_idx, round_data in enumerate(self.rounds, 1)
+            ]
+        ).all()
+
+        questions = [
+            {
+                'round_id': round_id,
+                'text': question_data.text,
+                'type': question_data.type,
+                'correct_answer': question_data.correct_answer,
+                'options': question_data.options,
+                'correct_option': question_data.correct_option,
+                'points': question_data.points,
+                'time_limit': question_data.time_limit,
+                'order': question_idx
+            }
+            for round_id, round_data in zip(round_ids, self.rounds)
+            for question_idx, question_data in enumerate(round_data.questions, 1)
+        ]
+        if questions:
+            # Вставка через таблицу: пакетный INSERT ORM дробится на группы
+            # по набору заполненных столбцов (у открытых вопросов нет correct_option)
+            db.session.execute(insert(Question.__table__), questions)
+
+    def _insert_orm(self, quiz_id: int):
         for round_idx, round_data in enumerate(self.rounds, 1):
             quiz_round = Round(
-                quiz_id=quiz.id,
-                title=round_data['title'],
+                quiz_id=quiz_id,
+                title=round_data.title,
                 order=round_idx
             )
             db.session.add(quiz_round)
             db.session.flush()  # Получаем ID раунда
-            
-            for question_idx, question_data in enumerate(round_data['questions'], 1):
+
+            for question_idx, question_data in enumerate(round_data.questions, 1):
                 question = Question(
                     round_id=quiz_round.id,
-                    text=question_data['text'],
-                    type=question_data['type'],
-                    correct_answer=question_data['correct_answer'],
-                    options=question_data['options'],
-                    correct_option=question_data.get('correct_option'),
-                    points=question_data['points'],
-                    time_limit=question_data['time_limit'],
+                    text=question_data.text,
+                    type=question_data.type,
+                    correct_answer=question_data.correct_answer,
+                    options=question_data.options,
+                    correct_option=question_data.correct_option,
+                    points=question_data.points,
+                    time_limit=question_data.time_limit,
                     order=question_idx
                 )
                 db.session.add(question)
-        
-        db.session.commit()
-        return quiz
+
+def _docx_lines(document) -> Iterator[str]:
+    # Абзацы верхнего уровня, как в document.paragraphs, но без построения списка
+    for element in document.element.body.iterchildren(qn('w:p')):
+        # Абзац может содержать переносы строк
+        yield from Paragraph(element, document).text.split('\n')
+
+
+def quiz_lines(stream: BinaryIO, file_type: str) -> List[str]:
+    """Строки файла квиза из двоичного потока (для txt — с универсальными переводами строк)"""
+    if file_type == 'txt':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+        try:
+            return text.read().split('\n')
+        finally:
+            text.detach()
+    if file_type == 'docx':
+        return list(_docx_lines(Document(stream)))
+    raise ValueError(f"Неподдерживаемый тип файла: {file_type}")
+
+
+def content_hash(lines: Iterable[str]) -> str:
+    """Хэш нормализованного текста квиза: строки без пробелов по краям, без пустых строк.
+
+    Один и тот же квиз в .txt и .docx или после пересохранения редактором
+    дает одинаковый хэш.
+    """
+    digest = hashlib.sha256()
+    for line in lines:
+        line = line.strip()
+        if line:
+            digest.update(line.encode('utf-8'))
+            digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _require_content(parser: QuizParser) -> QuizParser:
+    if not parser.quiz_title and not parser.rounds:
+        raise ValueError("Не удалось прочитать содержимое файла")
+    return parser
+
+
+def read_quiz(stream: BinaryIO, file_type: str) -> QuizParser:
+    """Разбирает файл квиза из потока, не сохраняя его; пустой файл — ошибка"""
+    parser = QuizParser()
+    parser.parse_stream(stream, file_type)
+    return _require_content(parser)
+
+
+def read_quiz_lines(lines: Iterable[str]) -> QuizParser:
+    """Разбирает уже прочитанные строки квиза; пустой файл — ошибка"""
+    parser = QuizParser()
+    parser.parse_lines(lines)
+    return _require_content(parser)
+
 
 def parse_quiz_file(file_path: str, file_type: str, user_id: int) -> Optional[Quiz]:
     """
@@ -174,19 +345,24 @@ def parse_quiz_file(file_path: str, file_type: str, user_id: int) -> Optional[Qu
     Returns:
         Quiz: Объект квиза или None в случае ошибки
     """
+    with open(file_path, 'rb') as f:
+        return parse_quiz_stream(f, file_type, user_id)
+
+def parse_quiz_stream(stream: BinaryIO, file_type: str, user_id: int) -> Quiz:
+    """
+    Парсит файл квиза из потока (загрузка, BytesIO) и сохраняет его в базу данных
+
+    Args:
+        stream (BinaryIO): Двоичный поток с содержимым файла
+        file_type (str): Тип файла ('txt' или 'docx')
+        user_id (int): ID пользователя, создающего квиз
+
+    Returns:
+        Quiz: Объект квиза
+    """
     try:
-        parser = QuizParser()
-        
-        if file_type == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                parser.parse_txt(f.read())
-        elif file_type == 'docx':
-            parser.parse_docx(file_path)
-        else:
-            raise ValueError(f"Неподдерживаемый тип файла: {file_type}")
-        
-        return parser.save_to_db(user_id)
-        
+        return read_quiz(stream, file_type).save_to_db(user_id)
+
     except Exception as e:
         db.session.rollback()
         raise Exception(f"Ошибка при парсинге файла: {str(e)}")
@@ -0,0 +1,15 @@
+from flask import Blueprint, abort, render_template
+from ..spectator import spectators
+
+# Публичные страницы без входа: только чтение, без правильных ответов
+spectator = Blueprint('spectator', __name__, url_prefix='/spectate')
+
+@spectator.route('/<room_code>')
+def spectate(room_code):
+    """Экран зрителей игры: текущий вопрос и таблица результатов.
+
+    Снимки игры страница получает через Socket.IO (пространство /spectate).
+    """
+    if spectators.find(room_code) is None:
+        abort(404)
+    return render_template('spectate.html', room_code=room_code.upper())
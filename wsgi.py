@@ -1,9 +1,14 @@
 import os
 from website import create_app
-from website.socket import socketio
+from website.socket import socketio, init_socketio
 
 app = create_app()
+# Очередь сообщений и sticky-сессии для нескольких веб-процессов задаются
+# переменными SOCKETIO_* (см. init_socketio); рабочий запуск — gunicorn wsgi:app
+# с настройками из gunicorn.conf.py
+init_socketio(app)
 
 if __name__ == "__main__":
+    # Встроенный сервер — только для локального запуска
     port = int(os.getenv("PORT", 5000))
     socketio.run(app, host='0.0.0.0', port=port) 
\ No newline at end of file